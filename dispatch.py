@@ -17,11 +17,34 @@ from argparse import ArgumentParser
 from logging import getLogger, Formatter as LogFormatter, StreamHandler
 
 from asyncio import run
+from contextlib import nullcontext
 from json import load as jload
+from sys import stdin, stdout
 
 from modules import ALL_MODULES, load_module, run_module
 from server import serve
+from tufin.bulktickets import BulkCreation
+from tufin.batch import DEFAULT_BATCH_LIMIT
+from tufin.codec import dumps
+from tufin.common import TufinConn
 from tufin.io import write_success_failure
+from tufin.pool import (
+    TufinPool,
+    DEFAULT_LIMIT,
+    DEFAULT_LIMIT_PER_HOST,
+    DEFAULT_DNS_CACHE_TTL,
+    DEFAULT_KEEPALIVE_TIMEOUT
+    )
+from tufin.cache import DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES
+from tufin.catalog import DEFAULT_REFRESH_INTERVAL
+from tufin.objindex import DEFAULT_MAX_AGE as DEFAULT_OBJECT_INDEX_AGE
+from tufin.ruleindex import DEFAULT_MAX_AGE as DEFAULT_RULE_INDEX_AGE
+from tufin.pathcache import DEFAULT_TTL as DEFAULT_PATH_TTL
+from tufin.revisions import DEFAULT_POLL_INTERVAL
+from tufin.snapshot import DEFAULT_SYNC_INTERVAL
+from tufin.zonecache import DEFAULT_TTL as DEFAULT_ZONE_TTL
+from tufin.ticketcache import DEFAULT_TTL as DEFAULT_TICKET_TTL
+from tufin.throttle import DEFAULT_CONCURRENCY, DEFAULT_RATE, DEFAULT_MAX_RETRIES
 
 ### Defaults and constants ###
 
@@ -65,6 +88,11 @@ def parse_arguments():
         '-s', '--socket'
         , help="UNIX domain socket path or IP address with port."
         )
+    arggroup.add_argument(
+        '-B', '--bulk-create'
+        , metavar='FILE'
+        , help='Creates the tickets specified in FILE, one JSON spec per line, - for stdin.'
+        )
     parser.add_argument(
         '--no-tls'
         , dest='tls'
@@ -88,6 +116,119 @@ def parse_arguments():
         '-U', '--dump-directory'
         , default=DEFAULT_DUMP_DIRECTORY
         )
+    parser.add_argument(
+        '--pool-limit'
+        , type=int
+        , default=DEFAULT_LIMIT
+        , help='Maximum open connections per Tufin upstream, 0 for no limit.'
+        )
+    parser.add_argument(
+        '--pool-limit-per-host'
+        , type=int
+        , default=DEFAULT_LIMIT_PER_HOST
+        , help='Maximum open connections per Tufin host, 0 for no limit.'
+        )
+    parser.add_argument(
+        '--dns-cache-ttl'
+        , type=int
+        , default=DEFAULT_DNS_CACHE_TTL
+        , help='Seconds to cache DNS lookups of the Tufin hosts.'
+        )
+    parser.add_argument(
+        '--keepalive-timeout'
+        , type=float
+        , default=DEFAULT_KEEPALIVE_TIMEOUT
+        , help='Seconds to keep idle Tufin connections open.'
+        )
+    parser.add_argument(
+        '--max-concurrency'
+        , type=int
+        , default=DEFAULT_CONCURRENCY
+        , help='Maximum requests in flight per Tufin upstream, 0 for no limit.'
+        )
+    parser.add_argument(
+        '--rate-limit'
+        , type=float
+        , default=DEFAULT_RATE
+        , help='Maximum requests per second per Tufin upstream.'
+        )
+    parser.add_argument(
+        '--max-retries'
+        , type=int
+        , default=DEFAULT_MAX_RETRIES
+        , help='Retries of idempotent requests after transient errors.'
+        )
+    parser.add_argument(
+        '--cache-entries'
+        , type=int
+        , default=DEFAULT_MAX_ENTRIES
+        , help='Server mode: Maximum cached SecureTrack responses, 0 to disable caching.'
+        )
+    parser.add_argument(
+        '--cache-bytes'
+        , type=int
+        , default=DEFAULT_MAX_BYTES
+        , help='Server mode: Maximum approximate size of cached SecureTrack responses.'
+        )
+    parser.add_argument(
+        '--catalog-refresh'
+        , type=float
+        , default=DEFAULT_REFRESH_INTERVAL
+        , help='Server mode: Seconds between device catalog refreshes, 0 to disable the catalog.'
+        )
+    parser.add_argument(
+        '--object-index-age'
+        , type=float
+        , default=DEFAULT_OBJECT_INDEX_AGE
+        , help='Server mode: Seconds before object indexes are rebuilt, 0 to disable them.'
+        )
+    parser.add_argument(
+        '--rule-index-age'
+        , type=float
+        , default=DEFAULT_RULE_INDEX_AGE
+        , help='Server mode: Seconds before rule indexes are rebuilt, 0 to disable them.'
+        )
+    parser.add_argument(
+        '--revision-poll'
+        , type=float
+        , default=DEFAULT_POLL_INTERVAL
+        , help='Server mode: Seconds between device revision polls, 0 to disable revision tracking.'
+        )
+    parser.add_argument(
+        '--zone-cache-ttl'
+        , type=float
+        , default=DEFAULT_ZONE_TTL
+        , help='Server mode: Seconds zone lookups are remembered, 0 to disable the cache.'
+        )
+    parser.add_argument(
+        '--path-cache-ttl'
+        , type=float
+        , default=DEFAULT_PATH_TTL
+        , help='Server mode: Seconds path queries are remembered, 0 to disable the cache.'
+        )
+    parser.add_argument(
+        '--ticket-cache-ttl'
+        , type=float
+        , default=DEFAULT_TICKET_TTL
+        , help='Server mode: Seconds tickets are remembered, 0 to disable the cache.'
+        )
+    parser.add_argument(
+        '--inventory-snapshot'
+        , action='store_true'
+        , help='Server mode: Persist the SecureTrack inventory in the --database.'
+        )
+    parser.add_argument(
+        '--snapshot-sync'
+        , type=float
+        , default=DEFAULT_SYNC_INTERVAL
+        , help='Server mode: Seconds between inventory snapshot syncs.'
+        )
+    parser.add_argument(
+        '--bulk-limit'
+        , type=int
+        , default=DEFAULT_BATCH_LIMIT
+        , help='Bulk creation: Maximum ticket creations in flight.'
+        )
     return parser.parse_args()
 
 def load_secrets(logger, path):
@@ -120,6 +261,31 @@ def make_logger(log_level):
     logger.addHandler(stream_handler)
     return logger
 
+async def bulk_create(logger, secrets, args):
+    '''
+    Creates the tickets specified in the --bulk-create file, printing
+    the outcome of each as a line of JSON as soon as it is known.
+    Outcomes are numbered by the line of their spec, counting from 1.
+    Returns whether all tickets were created.
+    '''
+    creation = BulkCreation(limit=args.bulk_limit)
+    if args.bulk_create == '-':
+        handle = nullcontext(stdin)
+    else:
+        handle = open(args.bulk_create, 'r', encoding='utf-8')
+    with handle as lines:
+        specs = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+        async with TufinPool.from_args(secrets, args) as pool:
+            async with TufinConn(secrets, logger=logger, tls=args.tls, pool=pool) as conn:
+                async for outcome in creation.create(conn, specs, numbered=True):
+                    stdout.write(dumps(outcome.show()) + '\n')
+                    stdout.flush()
+            logger.info(
+                'Bulk creation finished: %s, retries: %s'
+                , creation.stats(), pool.sc.throttle.stats()['retries']
+                )
+    return creation.stats()['failed'] == 0
+
 async def main():
     '''
     The core dispatcher function.
@@ -128,7 +294,7 @@ async def main():
         - Provides a logger
         - Loads secrets
         - Imports module
-        - Runs that module
+        - Runs that module, the server or a bulk ticket creation
     '''
     args = parse_arguments()
     logger = make_logger(args.log_level)
@@ -140,6 +306,10 @@ async def main():
         result = await run_module(logger, secrets, args, None, args.module)
         write_success_failure(result)
         return None
+    if args.bulk_create is not None:
+        if not await bulk_create(logger, secrets, args):
+            raise SystemExit(1)
+        return None
     logger.info('Running server at %s', args.socket)
     await serve(logger, secrets, args)
 
@@ -0,0 +1,442 @@
+
+'''
+A local stand-in for SecureChange and SecureTrack, for load testing
+Threefin without access to the real appliances. It implements the
+endpoints Threefin uses on synthetic data (see mock.data) and injects
+latency, errors and throttling (see mock.faults).
+
+Run it with
+    python -m mock --socket tcp://127.0.0.1:8080 --secrets-out secrets.json
+and point Threefin at the written secrets file, or use mock.loadtest to
+drive TufinConn or whole modules against an in-process instance.
+'''
+
+from ipaddress import ip_address, ip_network
+from zlib import crc32
+from xml.etree.ElementTree import fromstring, ParseError
+
+from aiohttp.web import (
+    Application,
+    HTTPBadRequest,
+    HTTPNotFound,
+    Response,
+    normalize_path_middleware,
+    get as rget,
+    post as rpost,
+    put as rput
+    )
+
+from mock.data import Inventory, zones_of, ZONES, ZONE_OTHER
+from mock.faults import FaultInjector, parse_profiles
+from tufin.codec import json_response, loads
+from tufin.netindex import parse_network
+
+SC_PREFIX = '/securechangeworkflow/api/securechange/'
+ST_PREFIX = '/securetrack/api/'
+
+def make_mock_app(inventory, injector=None): # pylint: disable=too-many-locals,too-many-statements
+    '''
+    Creates the mock's routes and handlers. Routes are named after the
+    endpoint profiles they are subject to.
+    '''
+    injector = FaultInjector() if injector is None else injector
+    routes = []
+
+    async def get_ticket(req):
+        '''
+        Serves a ticket.
+        '''
+        ticket = inventory.ticket(int(req.match_info['tid']))
+        if ticket is None:
+            raise HTTPNotFound
+        return json_response({'ticket': ticket})
+    routes.append(rget(SC_PREFIX + 'tickets/{tid:\\d+}', get_ticket, name='ticket'))
+
+    async def get_tickets(req):
+        '''
+        Lists tickets, optionally filtered by status.
+        '''
+        tickets = inventory.ticket_summaries()
+        status = req.query.get('status')
+        if status is not None:
+            tickets = [ticket for ticket in tickets if ticket['status'] == status]
+        return json_response({'tickets': page(req, tickets, 'ticket')})
+    routes.append(rget(SC_PREFIX + 'tickets', get_tickets, name='tickets'))
+
+    async def post_ticket(req):
+        '''
+        Creates a ticket, answering with its URL in the Location header.
+        '''
+        body = loads(await req.read())
+        try:
+            ticket = inventory.create_ticket(body['ticket'])
+        except (KeyError, TypeError) as e:
+            raise HTTPBadRequest(text=f'Bad ticket: {e!r}') from e
+        location = f'{req.url.origin()}{SC_PREFIX}tickets/{ticket["id"]}'
+        return Response(status=201, headers={'Location': location})
+    routes.append(rpost(SC_PREFIX + 'tickets{slash:/?}', post_ticket, name='create_ticket'))
+
+    async def put_fields(req):
+        '''
+        Updates the fields of a task.
+        '''
+        task = find_task(inventory, req)
+        body = loads(await req.read())
+        fields = task['fields']['field']
+        for update in as_list(body.get('fields', {}).get('field')):
+            for index, field in enumerate(fields):
+                if field['id'] == update.get('id') or field['name'] == update.get('name'):
+                    fields[index] = {**field, **update}
+                    break
+            else:
+                raise HTTPBadRequest(text=f'No such field: {update.get("name")}')
+        return Response(status=200)
+    routes.append(rput(
+        SC_PREFIX + 'tickets/{tid:\\d+}/steps/{sid:\\d+}/tasks/{taskid:\\d+}/fields'
+        , put_fields, name='fields'
+        ))
+
+    async def put_task(req):
+        '''
+        Updates the status of a task from an XML body, advancing the ticket when done.
+        '''
+        ticket = inventory.ticket(int(req.match_info['tid']))
+        task = find_task(inventory, req)
+        try:
+            status = fromstring(await req.text()).findtext('status')
+        except ParseError as e:
+            raise HTTPBadRequest from e
+        if status:
+            task['status'] = status
+        if status == 'DONE':
+            advance(ticket, int(req.match_info['sid']))
+        return Response(status=200)
+    routes.append(rput(
+        SC_PREFIX + 'tickets/{tid:\\d+}/steps/{sid:\\d+}/tasks/{taskid:\\d+}'
+        , put_task, name='task'
+        ))
+
+    async def get_devices(req):
+        '''
+        Lists devices, optionally filtered by name.
+        '''
+        devices = inventory.devices
+        name = req.query.get('name')
+        if name is not None:
+            devices = [device for device in devices if device['name'] == name]
+        return json_response({'devices': page(req, devices, 'device')})
+    routes.append(rget(ST_PREFIX + 'devices', get_devices, name='devices'))
+
+    async def get_network_objects(req):
+        '''
+        Lists a device's network objects, optionally filtered by name.
+        '''
+        device_id = int(req.match_info['did'])
+        if device_id not in inventory.device_by_id:
+            raise HTTPNotFound
+        objs = inventory.network_objects(device_id)
+        name = req.query.get('name')
+        if name is not None:
+            objs = [obj for obj in objs if obj['name'] == name]
+        return json_response({'network_objects': page(req, objs, 'network_object')})
+    routes.append(rget(
+        ST_PREFIX + 'devices/{did:\\d+}/network_objects'
+        , get_network_objects, name='network_objects'
+        ))
+
+    async def get_rules(req):
+        '''
+        Lists a device's security rules.
+        '''
+        device_id = int(req.match_info['did'])
+        if device_id not in inventory.device_by_id:
+            raise HTTPNotFound
+        return json_response({'rules': page(req, inventory.rules(device_id), 'rule')})
+    routes.append(rget(ST_PREFIX + 'devices/{did:\\d+}/rules', get_rules, name='rules'))
+
+    async def get_latest_revision(req):
+        '''
+        Serves the latest revision of a device.
+        '''
+        device_id = int(req.match_info['did'])
+        if device_id not in inventory.device_by_id:
+            raise HTTPNotFound
+        revision = inventory.revisions[device_id]
+        return json_response({'revision': {
+            'id': device_id * 1000 + revision
+            , 'revisionId': revision
+            , 'action': 'automatic'
+            , 'ready': True
+            }})
+    routes.append(rget(
+        ST_PREFIX + 'devices/{did:\\d+}/latest_revision'
+        , get_latest_revision, name='revision'
+        ))
+
+    async def search_network_objects(req):
+        '''
+        Searches the network objects of a device.
+        '''
+        try:
+            device_id = int(req.query['device_id'])
+        except (KeyError, ValueError) as e:
+            raise HTTPBadRequest from e
+        if device_id not in inventory.device_by_id:
+            raise HTTPNotFound
+        matches = search(inventory.network_objects(device_id), req.query)
+        return json_response({'network_objects': page(req, matches, 'network_object')})
+    routes.append(rget(ST_PREFIX + 'network_objects/search', search_network_objects, name='search'))
+
+    async def post_security_zones(req):
+        '''
+        Maps networks and objects to their security zones.
+        '''
+        body = loads(await req.read())
+        entries = [
+            zone_entry(inventory, item)
+            for item in as_list(body.get('network_objects', {}).get('network_object'))
+            ]
+        return json_response({
+            'security_zones_result': {'network_object_zones_map': {'entry': entries}}
+            })
+    routes.append(rpost(ST_PREFIX + 'security_zones', post_security_zones, name='zones'))
+
+    async def get_topology_path(req):
+        '''
+        Serves a path through a deterministic selection of devices.
+        '''
+        try:
+            src = ip_network(req.query['src'], strict=False)
+            dst = ip_network(req.query['dst'], strict=False)
+        except (KeyError, ValueError) as e:
+            raise HTTPBadRequest from e
+        service = req.query.get('service', 'any')
+        return json_response({'path_calc_results': path_result(inventory, src, dst, service)})
+    routes.append(rget(ST_PREFIX + 'topology/path', get_topology_path, name='path'))
+
+    async def stats(req): # pylint: disable=unused-argument
+        '''
+        Counters of the requests served, by route and outcome.
+        '''
+        return json_response(injector.counters)
+    routes.append(rget('/_mock/stats', stats, name='mock_stats'))
+
+    async def bump_revision(req):
+        '''
+        Simulates a policy installation on a device.
+        '''
+        device_id = int(req.match_info['did'])
+        if device_id not in inventory.device_by_id:
+            raise HTTPNotFound
+        return json_response({'revisionId': inventory.bump_revision(device_id)})
+    routes.append(rpost('/_mock/devices/{did:\\d+}/revisions', bump_revision, name='mock_revision'))
+
+    app = Application(middlewares=[
+        normalize_path_middleware(append_slash=False, merge_slashes=True)
+        , injector.middleware
+        ])
+    app.add_routes(routes)
+    return app
+
+def as_list(obj):
+    '''
+    Lists stay lists, None becomes empty, anything else a single item.
+    '''
+    if obj is None:
+        return []
+    return obj if isinstance(obj, list) else [obj]
+
+def page(req, items, key):
+    '''
+    A start/count page of items in Tufin's container format.
+    '''
+    start = int(req.query.get('start', 0))
+    count = int(req.query.get('count', len(items) or 1))
+    chunk = items[start:start+count]
+    return {'count': len(chunk), 'total': len(items), key: chunk}
+
+def find_task(inventory, req):
+    '''
+    The task addressed by the request's path.
+    '''
+    ticket = inventory.ticket(int(req.match_info['tid']))
+    if ticket is None:
+        raise HTTPNotFound
+    for step in ticket['steps']['step']:
+        task = step['tasks']['task']
+        if step['id'] == int(req.match_info['sid']) and task['id'] == int(req.match_info['taskid']):
+            return task
+    raise HTTPNotFound
+
+def advance(ticket, step_id):
+    '''
+    Moves the ticket past a finished step.
+    '''
+    steps = ticket['steps']['step']
+    for index, step in enumerate(steps):
+        if step['id'] == step_id and index + 1 < len(steps):
+            following = steps[index + 1]
+            following['tasks']['task']['status'] = 'ASSIGNED'
+            ticket['current_step'] = {'id': following['id'], 'name': following['name']}
+            return None
+    ticket.pop('current_step', None)
+    ticket['status'] = 'Ticket Closed'
+    return None
+
+def object_network(obj):
+    '''
+    The network covered by a host or network object, None for others.
+    '''
+    if 'ip' not in obj:
+        return None
+    return parse_network(obj['ip'], obj['netmask'])
+
+def search(objs, query):
+    '''
+    The network objects matching a network_objects/search query: exact
+    subnets for the subnet filter, containing objects for ip searches.
+    '''
+    if query.get('filter') == 'subnet':
+        target = parse_network(query['contains'], query['exact_subnet'])
+        return [obj for obj in objs if object_network(obj) == target]
+    if 'ip' in query:
+        address = ip_address(query['ip'])
+        matches = []
+        for obj in objs:
+            network = object_network(obj)
+            if network is not None and network.version == address.version and address in network:
+                matches.append(obj)
+            elif 'first_ip' in obj:
+                if ip_address(obj['first_ip']) <= address <= ip_address(obj['last_ip']):
+                    matches.append(obj)
+        matches.sort(key=lambda obj: 0 if obj['type'] == 'host' else 1)
+        return matches
+    return list(objs)
+
+def zone_entry(inventory, item):
+    '''
+    The security zones result for a single requested network or object.
+    '''
+    if item.get('@xsi.type') == 'ip_network':
+        key_network = item['network']
+        network = parse_network(key_network['ip'], key_network['mask'])
+        key = {'network': {'ip': key_network['ip'], 'mask': key_network['mask']}}
+    else:
+        management_id = int(item['management_id'])
+        key = {'management_id': item['management_id'], 'uid': item['uid']}
+        network = None
+        if management_id in inventory.device_by_id:
+            for obj in inventory.network_objects(management_id):
+                if obj['uid'] == item['uid']:
+                    network = object_network(obj)
+                    break
+    names = zones_of(network) if network is not None else [ZONE_OTHER]
+    zone_ids = {name: index for index, (name, _) in enumerate(ZONES, start=1)}
+    return {
+        'key': key
+        , 'value': {'network_objects_zones': {'network_objects_zone': [
+            {'zone': {'id': zone_ids.get(name, 0), 'name': name}}
+            for name in names
+            ]}}
+        }
+
+def path_result(inventory, src, dst, service):
+    '''
+    A path calculation result crossing up to three devices, chosen by
+    a hash of the flow so that repeated queries agree.
+    '''
+    digest = crc32(f'{src}>{dst}>{service}'.encode('utf-8'))
+    devices = inventory.devices
+    hops = {
+        (digest >> (8 * hop)) % len(devices): devices[(digest >> (8 * hop)) % len(devices)]
+        for hop in range(1 + digest % 3)
+        }.values()
+    return {
+        'traffic_allowed': digest % 5 != 0
+        , 'device_info': [
+            {
+                'id': device['id']
+                , 'name': device['name']
+                , 'vendor': device['vendor']
+                , 'incomingInterfaces': [{'name': 'eth0', 'ip': '0.0.0.0'}]
+                , 'bindings': []
+                }
+            for device in hops
+            ]
+        , 'unrouted_elements': []
+        }
+
+def add_mock_arguments(parser):
+    '''
+    The command line arguments shared by the mock server and the load
+    test driver.
+    '''
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument(
+        '--device-names', nargs='*', default=[]
+        , help='Names for the first devices.'
+        )
+    parser.add_argument('--objects', type=int, default=500, help='Network objects per device.')
+    parser.add_argument('--rules', type=int, default=100, help='Security rules per device.')
+    parser.add_argument('--tickets', type=int, default=100, help='Tickets listed.')
+    parser.add_argument('--steps', type=int, default=4, help='Steps per ticket.')
+    parser.add_argument('--fields', type=int, default=8, help='Text fields per step.')
+    parser.add_argument('--access-requests', type=int, default=10, help='Access requests per step.')
+    parser.add_argument(
+        '--latency', action='append', default=[]
+        , help='NAME=SPEC, e.g. devices=lognormal:-3:0.5 or *=fixed:0.01'
+        )
+    parser.add_argument('--error-rate', action='append', default=[], help='NAME=RATE of HTTP 500s.')
+    parser.add_argument(
+        '--throttle-rate', action='append', default=[]
+        , help='NAME=RATE of HTTP 429s.'
+        )
+    parser.add_argument(
+        '--max-in-flight', type=int, default=None
+        , help='Throttle beyond this many requests.'
+        )
+    parser.add_argument(
+        '--retry-after', type=int, default=1
+        , help='Retry-After seconds sent with 429s.'
+        )
+    return parser
+
+def mock_from_args(args):
+    '''
+    Creates the mock application configured by the arguments. Returns
+    the application and its fault injector, which holds the counters.
+    '''
+    inventory = Inventory(
+        seed=args.seed
+        , devices=args.devices
+        , objects=args.objects
+        , steps=args.steps
+        , fields=args.fields
+        , access_requests=args.access_requests
+        , rules=args.rules
+        , tickets=args.tickets
+        )
+    for device, name in zip(inventory.devices, args.device_names):
+        device['name'] = name
+    injector = FaultInjector(
+        profiles=parse_profiles(args.latency, args.error_rate, args.throttle_rate)
+        , seed=args.seed
+        , max_in_flight=args.max_in_flight
+        , retry_after=args.retry_after
+        )
+    return make_mock_app(inventory, injector), injector
+
+def mock_secrets(base_url):
+    '''
+    A secrets dict pointing Threefin at a mock running at base_url.
+    '''
+    base_url = base_url.rstrip('/')
+    return {
+        'SECURECHANGEURL': base_url + SC_PREFIX
+        , 'SECURECHANGEUSER': 'mock'
+        , 'SECURECHANGEPASSWORD': 'mock'
+        , 'SECURETRACKURL': base_url + ST_PREFIX
+        , 'SECURETRACKUSER': 'mock'
+        , 'SECURETRACKPASSWORD': 'mock'
+        }
@@ -0,0 +1,52 @@
+
+'''
+Runs the mock Tufin server. See mock/__init__.py for details.
+'''
+
+from argparse import ArgumentParser
+from asyncio import run, sleep as a_sleep
+from urllib.parse import urlparse
+
+from mock import add_mock_arguments, mock_from_args, mock_secrets
+from server.site import make_site
+from tufin.codec import dumpb
+
+def parse_arguments():
+    '''
+    The mock server's arguments.
+    '''
+    parser = ArgumentParser(description='Mock SecureChange and SecureTrack server')
+    parser.add_argument(
+        '-s', '--socket'
+        , default='tcp://127.0.0.1:8080'
+        , help='tcp://HOST:PORT to listen on.'
+        )
+    parser.add_argument(
+        '--secrets-out'
+        , default=None
+        , help='Write a Threefin secrets file pointing at the mock.'
+        )
+    add_mock_arguments(parser)
+    return parser.parse_args()
+
+async def main():
+    '''
+    Starts the mock and serves until interrupted.
+    '''
+    args = parse_arguments()
+    components = urlparse(args.socket)
+    if components.scheme != 'tcp':
+        raise ValueError('The mock only listens on tcp:// sockets', args.socket)
+    app, _ = mock_from_args(args)
+    _, site = await make_site(app, args.socket, None)
+    await site.start()
+    base_url = f'http://{components.hostname}:{components.port}'
+    if args.secrets_out is not None:
+        with open(args.secrets_out, 'wb') as handle:
+            handle.write(dumpb(mock_secrets(base_url), pretty=True))
+    print(f'Mock Tufin listening on {base_url}')
+    while True:
+        await a_sleep(3600)
+
+if __name__ == '__main__':
+    run(main())
@@ -0,0 +1,434 @@
+
+'''
+Synthetic SecureTrack and SecureChange data for the mock server. All data
+is derived from a seed, so two inventories with the same seed and sizes
+are identical. Network objects and tickets are generated on first access
+and kept afterwards, so that changes made through the API stick.
+'''
+
+from ipaddress import ip_address, ip_network
+from random import Random
+
+ZONES = (
+    ('Intern', ip_network('10.0.0.0/8'))
+    , ('DMZ', ip_network('172.16.0.0/12'))
+    , ('Lab', ip_network('192.168.0.0/16'))
+    , ('Intern6', ip_network('fd00::/8'))
+    )
+ZONE_OTHER = 'Extern'
+
+CREATED_TICKET_IDS = 1000000
+
+VENDORS = (
+    ('Checkpoint', 'module')
+    , ('Cisco', 'asa')
+    , ('PaloAltoNetworks', 'fw')
+    , ('Fortinet', 'fortigate')
+    )
+
+class Inventory(): # pylint: disable=too-many-instance-attributes
+    '''
+    The mock's view of the world. Sizes:
+        devices: number of SecureTrack devices
+        objects: network objects per device
+        rules: security rules per device
+        steps: workflow steps per ticket
+        fields: text fields per step
+        access_requests: access requests in each step's multi access
+            request field
+        tickets: number of tickets listed, any id can be fetched
+    '''
+    def __init__( # pylint: disable=too-many-arguments
+            self
+            , seed=0
+            , devices=20
+            , objects=500
+            , steps=4
+            , fields=8
+            , access_requests=10
+            , rules=100
+            , tickets=100
+            ):
+        self.seed = seed
+        self.listed_tickets = tickets
+        self.objects_per_device = objects
+        self.rules_per_device = rules
+        self.steps = steps
+        self.fields = fields
+        self.access_requests = access_requests
+        rng = Random(seed)
+        self.devices = []
+        for device_id in range(1, devices + 1):
+            vendor, model = rng.choice(VENDORS)
+            self.devices.append({
+                'id': device_id
+                , 'name': f'fw-{device_id:04d}'
+                , 'vendor': vendor
+                , 'model': model
+                , 'domain_id': 1
+                , 'domain_name': 'Default'
+                , 'offline': False
+                , 'topology': True
+                })
+        self.device_by_id = {device['id']: device for device in self.devices}
+        self.revisions = {device['id']: 1 for device in self.devices}
+        self._objects = {}
+        self._rules = {}
+        self._tickets = {}
+        self._created = []
+    def network_objects(self, device_id):
+        '''
+        The network objects of a device: hosts, networks, ranges and a
+        few groups of them.
+        '''
+        objs = self._objects.get(device_id)
+        if objs is None:
+            rng = Random(self.seed * 100003 + device_id)
+            objs = make_network_objects(rng, device_id, self.objects_per_device)
+            self._objects[device_id] = objs
+        return objs
+    def rules(self, device_id):
+        '''
+        The security rules of a device, referring to its network objects.
+        '''
+        rules = self._rules.get(device_id)
+        if rules is None:
+            rules = make_rules(
+                Random(self.seed * 100043 + device_id)
+                , device_id
+                , self.network_objects(device_id)
+                , self.rules_per_device
+                )
+            self._rules[device_id] = rules
+        return rules
+    def ticket(self, ticket_id):
+        '''
+        The ticket with the given id, None for ids below 1.
+        '''
+        if ticket_id < 1:
+            return None
+        ticket = self._tickets.get(ticket_id)
+        if ticket is None:
+            ticket = make_ticket(
+                Random(self.seed * 100019 + ticket_id)
+                , ticket_id
+                , self.steps
+                , self.fields
+                , self.access_requests
+                )
+            self._tickets[ticket_id] = ticket
+        return ticket
+    def ticket_summaries(self):
+        '''
+        The listed and the created tickets, without their steps.
+        '''
+        return [
+            {
+                'id': ticket_id
+                , 'subject': (
+                    self._tickets[ticket_id]['subject'] if ticket_id in self._tickets
+                    else f'Mock ticket {ticket_id}'
+                    )
+                , 'status': (
+                    self._tickets[ticket_id]['status'] if ticket_id in self._tickets
+                    else 'In Progress'
+                    )
+                }
+            for ticket_id in [*range(1, self.listed_tickets + 1), *self._created]
+            ]
+    def create_ticket(self, data):
+        '''
+        Creates a ticket from a creation payload, with a single step
+        holding the given fields. Ids of created tickets start far above
+        those of the generated ones.
+        '''
+        ticket_id = CREATED_TICKET_IDS + len(self._created)
+        step_id = ticket_id * 1000
+        infields = data['steps']['step'][0]['tasks']['task'][0]['fields']['field']
+        step = {
+            'id': step_id
+            , 'name': 'Open request'
+            , 'redone': False
+            , 'skipped': False
+            , 'tasks': {'task': {
+                'id': step_id
+                , 'assignee': 'mock'
+                , 'status': 'ASSIGNED'
+                , 'fields': {'field': [
+                    {**field, 'id': step_id * 100 + index}
+                    for index, field in enumerate(infields)
+                    ]}
+                }}
+            }
+        ticket = {
+            'id': ticket_id
+            , 'subject': data['subject']
+            , 'requester': 'mock'
+            , 'requester_id': 1
+            , 'priority': data.get('priority', 'Normal')
+            , 'status': 'In Progress'
+            , 'domain_name': data.get('domain_name', '')
+            , 'workflow': {'id': 1, 'name': data['workflow']['name'], 'uses_topology': True}
+            , 'steps': {'step': [step]}
+            , 'current_step': {'id': step_id, 'name': step['name']}
+            }
+        self._created.append(ticket_id)
+        self._tickets[ticket_id] = ticket
+        return ticket
+    def bump_revision(self, device_id):
+        '''
+        Simulates a policy installation on a device.
+        '''
+        self.revisions[device_id] += 1
+        return self.revisions[device_id]
+
+def make_network_objects(rng, device_id, count):
+    '''
+    Creates count network objects for a device.
+    '''
+    objs = []
+    for index in range(count):
+        uid = f'{{{device_id:08x}-{index:08x}}}'
+        kind = rng.random()
+        base = {
+            'id': device_id * 1000000 + index
+            , 'uid': uid
+            , 'device_id': device_id
+            , 'global': False
+            , 'comment': ''
+            }
+        if kind < 0.6:
+            address = random_address(rng)
+            objs.append({
+                **base
+                , '@xsi.type': 'hostNetworkObjectDTO'
+                , 'name': f'Host_{address}'
+                , 'display_name': f'Host_{address}'
+                , 'ip': str(address)
+                , 'netmask': str(ip_network(address).netmask)
+                , 'type': 'host'
+                })
+        elif kind < 0.85:
+            prefix = f'{random_address(rng, v6=False)}/{rng.randint(16, 30)}'
+            network = ip_network(prefix, strict=False)
+            objs.append({
+                **base
+                , '@xsi.type': 'networkObjectDTO'
+                , 'name': f'Net_{network.network_address}_{network.prefixlen}'
+                , 'display_name': f'Net_{network.network_address}_{network.prefixlen}'
+                , 'ip': str(network.network_address)
+                , 'netmask': str(network.netmask)
+                , 'type': 'network'
+                })
+        elif kind < 0.95 or index < 10:
+            first = random_address(rng, v6=False)
+            last = ip_address(int(first) + rng.randint(1, 255))
+            objs.append({
+                **base
+                , '@xsi.type': 'rangeNetworkObjectDTO'
+                , 'name': f'Range_{first}_{last}'
+                , 'display_name': f'Range_{first}_{last}'
+                , 'first_ip': str(first)
+                , 'last_ip': str(last)
+                , 'type': 'range'
+                })
+        else:
+            members = rng.sample(objs[:index], min(len(objs), rng.randint(1, 8)))
+            objs.append({
+                **base
+                , '@xsi.type': 'networkObjectGroupDTO'
+                , 'name': f'Group_{device_id}_{index}'
+                , 'display_name': f'Group_{device_id}_{index}'
+                , 'type': 'group'
+                , 'member': [member_reference(member) for member in members]
+                })
+    return objs
+
+SERVICES = (
+    ('http', 6, 80, 80)
+    , ('https', 6, 443, 443)
+    , ('ssh', 6, 22, 22)
+    , ('dns', 17, 53, 53)
+    , ('high_tcp', 6, 1024, 65535)
+    , ('ntp', 17, 123, 123)
+    )
+ANY_OBJECT = {'@xsi.type': 'anyNetworkObjectDTO', 'name': 'Any', 'type': 'any'}
+ANY_SERVICE = {'@xsi.type': 'anyServiceDTO', 'name': 'Any', 'type': 'any'}
+
+def make_rules(rng, device_id, objs, count):
+    '''
+    Creates count rules for a device, with the occasional Any, disabled
+    rule and final cleanup rule.
+    '''
+    rules = []
+    for index in range(count):
+        cleanup = index == count - 1
+        rules.append({
+            'id': device_id * 100000 + index
+            , 'uid': f'{{r{device_id:07x}-{index:08x}}}'
+            , 'order': index + 1
+            , 'rule_number': index + 1
+            , 'name': 'Cleanup' if cleanup else f'Rule {index + 1}'
+            , 'action': 'Drop' if cleanup else rng.choice(('Accept', 'Accept', 'Accept', 'Drop'))
+            , 'disabled': not cleanup and rng.random() < 0.05
+            , 'src_networks_negated': False
+            , 'dst_networks_negated': False
+            , 'dst_services_negated': False
+            , 'src_network': [ANY_OBJECT] if cleanup or rng.random() < 0.1 else [
+                member_reference(obj) for obj in rng.sample(objs, rng.randint(1, 4))
+                ]
+            , 'dst_network': [ANY_OBJECT] if cleanup or rng.random() < 0.05 else [
+                member_reference(obj) for obj in rng.sample(objs, rng.randint(1, 4))
+                ]
+            , 'dst_service': [ANY_SERVICE] if cleanup or rng.random() < 0.1 else [
+                {
+                    'name': name
+                    , 'type': 'tcp_service' if protocol == 6 else 'udp_service'
+                    , 'protocol': protocol
+                    , 'min_port': first
+                    , 'max_port': last
+                    }
+                for name, protocol, first, last in rng.sample(SERVICES, rng.randint(1, 3))
+                ]
+            })
+    return rules
+
+def member_reference(obj):
+    '''
+    The way group members refer to other objects.
+    '''
+    return {
+        'id': obj['id']
+        , 'uid': obj['uid']
+        , 'name': obj['name']
+        , 'display_name': obj['display_name']
+        }
+
+def random_address(rng, v6=None):
+    '''
+    A random private address, occasionally IPv6 unless v6 is False.
+    '''
+    if v6 is None:
+        v6 = rng.random() < 0.05
+    if v6:
+        return ip_address(int(ip_address('fd00::')) + rng.getrandbits(64))
+    prefix = rng.choice(ZONES[:3])[1]
+    return prefix[rng.randrange(prefix.num_addresses)]
+
+def make_ticket(rng, ticket_id, steps, fields, access_requests):
+    '''
+    Creates a ticket whose last step is the current one. Every step
+    has text fields, a drop-down list, a multi access request and a
+    group change field named "Modifications".
+    '''
+    step_list = []
+    for step_index in range(steps):
+        step_id = ticket_id * 1000 + step_index
+        current = step_index == steps - 1
+        field_list = [
+            {
+                '@xsi.type': 'text_field'
+                , 'id': step_id * 100 + field_index
+                , 'name': f'Field {field_index}'
+                , 'read_only': False
+                , 'text': f'Value {rng.getrandbits(32):08x}'
+                }
+            for field_index in range(fields)
+            ]
+        options = [f'Option {i}' for i in range(5)]
+        field_list.append({
+            '@xsi.type': 'drop_down_list'
+            , 'id': step_id * 100 + 90
+            , 'name': 'Choice'
+            , 'options': {'option': [{'value': option} for option in options]}
+            , 'selection': rng.choice(options)
+            })
+        field_list.append({
+            '@xsi.type': 'multi_access_request'
+            , 'id': step_id * 100 + 91
+            , 'name': 'Access'
+            , 'access_request': [
+                make_access_request(rng, step_id * 1000 + ar_index)
+                for ar_index in range(access_requests)
+                ]
+            })
+        field_list.append({
+            '@xsi.type': 'multi_group_change'
+            , 'id': step_id * 100 + 92
+            , 'name': 'Modifications'
+            , 'group_change': []
+            })
+        step_list.append({
+            'id': step_id
+            , 'name': f'Step {step_index}'
+            , 'redone': False
+            , 'skipped': False
+            , 'tasks': {'task': {
+                'id': step_id
+                , 'assignee': 'mock'
+                , 'status': 'ASSIGNED' if current else 'DONE'
+                , 'fields': {'field': field_list}
+                }}
+            })
+    return {
+        'id': ticket_id
+        , 'subject': f'Mock ticket {ticket_id}'
+        , 'requester': 'mock'
+        , 'requester_id': 1
+        , 'priority': 'Normal'
+        , 'status': 'In Progress'
+        , 'domain_name': ''
+        , 'workflow': {'id': 1, 'name': 'Mock workflow', 'uses_topology': True}
+        , 'steps': {'step': step_list}
+        , 'current_step': {'id': step_list[-1]['id'], 'name': step_list[-1]['name']}
+        }
+
+def make_access_request(rng, ar_id):
+    '''
+    A single access request between two random addresses.
+    '''
+    return {
+        'id': ar_id
+        , 'order': f'AR{ar_id % 1000 + 1}'
+        , 'verifier_result': {'status': 'not run'}
+        , 'use_topology': True
+        , 'targets': {'target': {'@type': 'ANY', 'id': ar_id}}
+        , 'users': {'user': ['Any']}
+        , 'sources': {'source': [
+            {
+                '@type': 'IP', 'id': ar_id * 10 + 1
+                , 'ip_address': str(random_address(rng, v6=False)), 'netmask': '255.255.255.255'
+                }
+            ]}
+        , 'destinations': {'destination': [
+            {
+                '@type': 'IP', 'id': ar_id * 10 + 2
+                , 'ip_address': str(random_address(rng, v6=False)), 'netmask': '255.255.255.255'
+                }
+            ]}
+        , 'services': {'service': [
+            {
+                '@type': 'PROTOCOL', 'id': ar_id * 10 + 3
+                , 'protocol': 'TCP', 'port': str(rng.choice((22, 80, 443, 8443)))
+                }
+            ]}
+        , 'action': 'Accept'
+        , 'labels': ''
+        }
+
+def zones_of(network):
+    '''
+    The names of the zones a network intersects.
+    '''
+    names = [
+        name
+        for name, zone in ZONES
+        if zone.version == network.version and zone.overlaps(network)
+        ]
+    if not names or not any(
+            network.subnet_of(zone)
+            for _, zone in ZONES
+            if zone.version == network.version
+            ):
+        names.append(ZONE_OTHER)
+    return names
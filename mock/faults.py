@@ -0,0 +1,126 @@
+
+'''
+Latency and fault injection for the mock server. Each endpoint has a
+profile with a latency distribution, an error rate and a throttling rate.
+Distributions are given as strings:
+    fixed:SECONDS
+    uniform:LOW:HIGH
+    exp:MEAN
+    lognormal:MU:SIGMA   (of the natural logarithm of the seconds)
+All randomness comes from a seeded generator, so runs are repeatable.
+'''
+
+from asyncio import sleep as a_sleep
+from random import Random
+
+from aiohttp.web import HTTPInternalServerError, HTTPTooManyRequests, middleware
+
+class Latency(): # pylint: disable=too-few-public-methods
+    '''
+    A latency distribution parsed from its string form.
+    '''
+    def __init__(self, spec='fixed:0'):
+        kind, *params = spec.split(':')
+        try:
+            values = [float(p) for p in params]
+        except ValueError as e:
+            raise ValueError('Bad latency spec', spec) from e
+        expected = {'fixed': 1, 'uniform': 2, 'exp': 1, 'lognormal': 2}.get(kind)
+        if expected is None or expected != len(values):
+            raise ValueError('Bad latency spec', spec)
+        self.kind = kind
+        self.values = values
+        self.spec = spec
+    def sample(self, rng):
+        '''
+        Draws a latency in seconds.
+        '''
+        if self.kind == 'fixed':
+            return self.values[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.values)
+        if self.kind == 'exp':
+            return rng.expovariate(1 / self.values[0]) if self.values[0] > 0 else 0.0
+        return rng.lognormvariate(*self.values)
+
+class Profile(): # pylint: disable=too-few-public-methods
+    '''
+    The behaviour of one endpoint.
+    '''
+    def __init__(self, latency='fixed:0', error_rate=0.0, throttle_rate=0.0):
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+
+class FaultInjector():
+    '''
+    Applies the endpoint profiles to incoming requests, identified by
+    their route names. Requests beyond max_in_flight are throttled
+    regardless of the profiles, the way an overloaded appliance would.
+    '''
+    def __init__(self, profiles=None, seed=0, max_in_flight=None, retry_after=1):
+        self.profiles = profiles or {}
+        self.default = self.profiles.get('*', Profile())
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self._rng = Random(seed)
+        self._in_flight = 0
+        self.counters = {}
+    def profile(self, name):
+        '''
+        The profile for a route name.
+        '''
+        return self.profiles.get(name, self.default)
+    def count(self, name, outcome):
+        '''
+        Records the outcome of a request.
+        '''
+        key = f'{name}:{outcome}'
+        self.counters[key] = self.counters.get(key, 0) + 1
+    @middleware
+    async def middleware(self, req, handler):
+        '''
+        The aiohttp middleware doing the injection.
+        '''
+        route = req.match_info.route
+        name = route.name if route is not None and route.name else None
+        if name is None or name.startswith('mock_'):
+            return await handler(req)
+        profile = self.profile(name)
+        if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+            self.count(name, 429)
+            raise HTTPTooManyRequests(headers={'Retry-After': str(self.retry_after)})
+        self._in_flight += 1
+        try:
+            await a_sleep(profile.latency.sample(self._rng))
+            roll = self._rng.random()
+            if roll < profile.throttle_rate:
+                self.count(name, 429)
+                raise HTTPTooManyRequests(headers={'Retry-After': str(self.retry_after)})
+            if roll < profile.throttle_rate + profile.error_rate:
+                self.count(name, 500)
+                raise HTTPInternalServerError
+            res = await handler(req)
+            self.count(name, res.status)
+            return res
+        finally:
+            self._in_flight -= 1
+
+def parse_profiles(latencies=(), error_rates=(), throttle_rates=()):
+    '''
+    Builds profiles from NAME=VALUE strings as given on the command
+    line. The name * sets the default for all endpoints.
+    '''
+    settings = {}
+    kinds = (('latency', latencies), ('error_rate', error_rates), ('throttle_rate', throttle_rates))
+    for key, values in kinds:
+        for value in values:
+            name, sep, setting = value.partition('=')
+            if not sep:
+                raise ValueError('Expected NAME=VALUE', value)
+            settings.setdefault(name, {})[key] = setting if key == 'latency' else float(setting)
+    defaults = settings.get('*', {})
+    return {
+        name: Profile(**{**defaults, **setting})
+        for name, setting in settings.items()
+        }
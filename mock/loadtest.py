@@ -0,0 +1,139 @@
+
+'''
+A load test driver running Threefin against an in-process mock. Scenarios:
+    lookup: resolves a device, a batch of addresses and their zones,
+        the way the group change modules do
+    module: runs a Threefin module for a mock ticket, as the server
+        does for each SecureChange trigger
+All scenario runs share one TufinPool, as in server mode. The report
+lists latency percentiles, throughput, and the counters of the pool and
+the mock. Example:
+    python -m mock.loadtest --runs 500 --concurrency 50 --latency '*=exp:0.02'
+'''
+
+from argparse import ArgumentParser, Namespace
+from asyncio import run, Semaphore, gather
+from ipaddress import ip_address
+from random import Random
+from tempfile import TemporaryDirectory
+from time import monotonic
+from logging import getLogger
+
+from aiohttp.web import AppRunner, TCPSite
+
+from mock import add_mock_arguments, mock_from_args, mock_secrets
+from modules import ALL_MODULES, run_module
+from tufin.codec import dumps
+from tufin.common import TufinConn
+from tufin.pool import TufinPool
+from tufin.securetrack import grab_device_id, grab_name_bulk, zone_lookup
+
+def parse_arguments():
+    '''
+    The load test's arguments, including those of the mock.
+    '''
+    parser = ArgumentParser(description='Threefin load test against a mock Tufin')
+    parser.add_argument('--scenario', choices=('lookup', 'module'), default='lookup')
+    parser.add_argument('--module', choices=ALL_MODULES, default='groupadd')
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--addresses', type=int, default=20, help='Addresses per lookup run.')
+    parser.add_argument(
+        '--max-concurrency', type=int, default=16
+        , help='Pool concurrency per upstream.'
+        )
+    parser.add_argument(
+        '--rate-limit', type=float, default=None
+        , help='Pool requests per second per upstream.'
+        )
+    add_mock_arguments(parser)
+    return parser.parse_args()
+
+async def lookup_scenario(pool, secrets, args, run_index):
+    '''
+    Device, name and zone lookups for a batch of addresses.
+    '''
+    rng = Random(args.seed * 7919 + run_index)
+    device_name = args.device_names[0] if args.device_names else 'fw-0001'
+    addresses = [
+        ip_address(f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}')
+        for _ in range(args.addresses)
+        ]
+    async with TufinConn(secrets, pool=pool) as conn:
+        device_id = await grab_device_id(conn, device_name)
+        await grab_name_bulk(conn, device_id, addresses)
+        await zone_lookup(conn, addresses)
+    return True
+
+async def module_scenario(pool, secrets, args, run_index):
+    '''
+    A module invocation for a mock ticket.
+    '''
+    instr = f'<ticket_info><id>{run_index + 1}</id></ticket_info>'
+    return await run_module(getLogger('loadtest'), secrets, args, instr, args.module, pool=pool)
+
+def percentile(values, fraction):
+    '''
+    The value below which the given fraction of values falls.
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def main(): # pylint: disable=too-many-locals
+    '''
+    Starts the mock, runs the scenario and prints the report.
+    '''
+    args = parse_arguments()
+    app, injector = mock_from_args(args)
+    runner = AppRunner(app)
+    await runner.setup()
+    site = TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    secrets = mock_secrets(f'http://127.0.0.1:{port}')
+    scenario = lookup_scenario if args.scenario == 'lookup' else module_scenario
+    semaphore = Semaphore(args.concurrency)
+    latencies = []
+    failures = []
+    with TemporaryDirectory() as dumpdir:
+        module_args = Namespace(**vars(args), tls=None, dump_directory=dumpdir, database=None)
+        pool = TufinPool(secrets, concurrency=args.max_concurrency, rate=args.rate_limit)
+        async with pool:
+            async def one(run_index):
+                async with semaphore:
+                    started = monotonic()
+                    try:
+                        ok = await scenario(pool, secrets, module_args, run_index)
+                    except Exception as e: # pylint: disable=broad-except
+                        failures.append(repr(e))
+                        return None
+                    latencies.append(monotonic() - started)
+                    if not ok:
+                        failures.append(f'Run {run_index} failed')
+                return None
+            started = monotonic()
+            await gather(*(one(i) for i in range(args.runs)))
+            elapsed = monotonic() - started
+            pool_stats = pool.stats()
+    report = {
+        'scenario': args.scenario
+        , 'runs': args.runs
+        , 'failures': len(failures)
+        , 'first_failures': failures[:5]
+        , 'elapsed': round(elapsed, 3)
+        , 'runs_per_second': round(args.runs / elapsed, 1) if elapsed > 0 else None
+        , 'latency': {
+            f'p{int(p * 100)}': round(percentile(latencies, p) or 0, 4)
+            for p in (0.5, 0.9, 0.99)
+            }
+        , 'pool': pool_stats
+        , 'mock': injector.counters
+        }
+    await runner.cleanup()
+    print(dumps(report, pretty=True))
+    return None
+
+if __name__ == '__main__':
+    run(main())
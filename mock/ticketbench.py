@@ -0,0 +1,114 @@
+
+'''
+A benchmark of tufin.ticket on large synthetic tickets from the mock's
+inventory. For every ticket it measures construction, access to the
+current step's fields and a full parse of all steps via show(...) ,
+reporting time per ticket and the memory allocated. Example:
+    python -m mock.ticketbench --tickets 200 --steps 40 --access-requests 200
+'''
+
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+from tracemalloc import start, stop, take_snapshot
+
+from mock.data import make_ticket
+from tufin.codec import dumps
+from tufin.ticket import SimpleTicket
+
+def parse_arguments():
+    '''
+    The benchmark's arguments.
+    '''
+    parser = ArgumentParser(description='SimpleTicket benchmark on synthetic tickets')
+    parser.add_argument('--tickets', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=30, help='Steps per ticket.')
+    parser.add_argument('--fields', type=int, default=20, help='Text fields per step.')
+    parser.add_argument(
+        '--access-requests', type=int, default=100
+        , help='Access requests per step.'
+        )
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+def construct(tickets):
+    '''
+    Builds a SimpleTicket per ticket.
+    '''
+    return [SimpleTicket(ticket) for ticket in tickets]
+
+def current_fields(simple_tickets):
+    '''
+    Touches a text and an option field of every current step.
+    '''
+    for simple in simple_tickets:
+        step = simple.steps[simple.current_step]
+        step.text('Field 0')
+        step.options('Choice')
+    return simple_tickets
+
+def full_parse(simple_tickets):
+    '''
+    Parses every step of every ticket.
+    '''
+    for simple in simple_tickets:
+        simple.show()
+    return simple_tickets
+
+def run_phases(tickets, traced):
+    '''
+    Runs the phases in order, returning the run time of each, or the
+    memory each allocated and kept when traced. Tracing slows things
+    down, so times and memory are taken in separate runs.
+    '''
+    measured = {}
+    state = tickets
+    for name, function in PHASES:
+        if traced:
+            start()
+            before = take_snapshot()
+            state = function(state)
+            after = take_snapshot()
+            stop()
+            measured[name] = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        else:
+            started = perf_counter()
+            state = function(state)
+            measured[name] = perf_counter() - started
+    return measured
+
+PHASES = (
+    ('construct', construct)
+    , ('current_step', current_fields)
+    , ('full_parse', full_parse)
+    )
+
+def main():
+    '''
+    Generates the tickets, runs the phases and prints the report.
+    '''
+    args = parse_arguments()
+    tickets = [
+        make_ticket(
+            Random(args.seed * 100019 + ticket_id), ticket_id
+            , args.steps, args.fields, args.access_requests
+            )
+        for ticket_id in range(1, args.tickets + 1)
+        ]
+    times = run_phases(tickets, False)
+    memory = run_phases(tickets, True)
+    report = {
+        'tickets': args.tickets
+        , 'steps': args.steps
+        , **{
+            name: {
+                'us_per_ticket': round(times[name] / args.tickets * 1e6, 1)
+                , 'bytes_per_ticket': round(memory[name] / args.tickets)
+                }
+            for name, _ in PHASES
+            }
+        }
+    print(dumps(report, pretty=True))
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,9 @@ which loads and runs modules both for one-shot and
 server invocations. The instr argument is used by
 the server to pass along request data; when instr is
 None, the modules will typically try to read from stdin.
+The pool argument is used by the server to share its
+long-lived Tufin connections; when pool is None, the
+modules open and close their own.
 '''
 
 from importlib import import_module
@@ -28,7 +31,7 @@ def load_module(module_name):
         raise ValueError('Invalid module name', module_name)
     return import_module('.' + module_name, 'modules')
 
-async def run_module(logger, secrets, args, instr, module_name):
+async def run_module(logger, secrets, args, instr, module_name, pool=None): # pylint: disable=too-many-arguments
     '''
     Dynamically loads and runs the specified module. If the
     instr parameter is not given, the module's main function
@@ -38,6 +41,6 @@ async def run_module(logger, secrets, args, instr, module_name):
     mlogger.info('Loading module')
     module = load_module(module_name)
     mlogger.info('Loading successful, running module')
-    return await module.main(mlogger, secrets, args, instr)
+    return await module.main(mlogger, secrets, args, instr, pool=pool)
 
 
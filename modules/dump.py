@@ -5,10 +5,10 @@ and the mangled version to disk. Needs credentials
 to operate - good for testing integrations.
 '''
 
-from json import dump as jdump, dumps as jdumps
-
+from tufin.codec import dumpb
 from tufin.common import TufinConn
 from tufin.io import read_ticket, write_success_failure
+from tufin.lazylog import LazyJSON
 from tufin.ticket import SimpleTicket
 
 def raw_path(dumpdir, ticketid, instatus):
@@ -23,16 +23,16 @@ def mangled_path(dumpdir, ticketid):
     '''
     return f'{dumpdir}/ticket_mangled_{ticketid}.json'
 
-async def dump(logger, secrets, args, instr, action):
+async def dump(logger, secrets, args, instr, action, pool=None): # pylint: disable=too-many-arguments
     '''
     The core function of the module - main(...) only supplies the exit code.
     This function is reused in the faildump module, which motivates the split.
     '''
     dumpdir = args.dump_directory
-    async with TufinConn(secrets, tls=args.tls) as conn:
+    async with TufinConn(secrets, tls=args.tls, pool=pool) as conn:
         ticketid, instatus, inticket = await read_ticket(conn, instr, logger=logger)
-    with open(raw_path(dumpdir, ticketid, instatus), 'w+') as handle:
-        jdump(inticket, handle)
+    with open(raw_path(dumpdir, ticketid, instatus), 'wb+') as handle:
+        handle.write(dumpb(inticket))
     if instatus is None or (not instatus < 400):
         if logger is not None:
             logger.error(f'Error retrieving ticket #{ticketid}')
@@ -40,7 +40,7 @@ async def dump(logger, secrets, args, instr, action):
             logger.info('Raw data:\n%s', inticket)
         return None
     try:
-        formatted_ticket = SimpleTicket(inticket)
+        mangled = SimpleTicket(inticket).show()
     except ValueError:
         if logger is not None:
             logger.error(f'Error mangling ticket #{ticketid}')
@@ -48,14 +48,14 @@ async def dump(logger, secrets, args, instr, action):
             logger.info('Raw data:\n%s', inticket)
         write_success_failure(False)
         return None
-    with open(mangled_path(dumpdir, ticketid), 'w+') as handle:
-        jdump(formatted_ticket.show(), handle)
+    with open(mangled_path(dumpdir, ticketid), 'wb+') as handle:
+        handle.write(dumpb(mangled))
     if logger is not None:
         logger.info('All done!')
         logger.info('Status: %s', instatus)
-        logger.info('Raw data:\n%s', jdumps(inticket, indent=2))
-        logger.info('Mangled data:\n%s', jdumps(formatted_ticket.show(), indent=2))
+        logger.info('Raw data:\n%s', LazyJSON(inticket, limit=None, pretty=True))
+        logger.info('Mangled data:\n%s', LazyJSON(mangled, limit=None, pretty=True))
     return action
 
-async def main(logger, secrets, args, instr): # pylint: disable=unused-argument,missing-function-docstring
-    return await dump(logger, secrets, args, instr, True)
+async def main(logger, secrets, args, instr, pool=None): # pylint: disable=unused-argument,missing-function-docstring
+    return await dump(logger, secrets, args, instr, True, pool=pool)
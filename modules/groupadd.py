@@ -5,12 +5,11 @@ device and writes the changes to the "Modifications" field of the input ticket.
 '''
 
 from ipaddress import ip_address
-from json import dumps
-
 from tufin.common import TufinConn
 from tufin.io import read_simple
+from tufin.lazylog import LazyJSON
 from tufin.securetrack import grab_device_id
-from tufin.securechange import make_member_data, group_change
+from tufin.securechange import group_change_bulk
 
 
 FAKE_ADDRESSES = [
@@ -22,17 +21,12 @@ FAKE_ADDRESSES = [
 TARGET_DEVICE = 'jk-CPMgmt'
 TARGET_GROUP = 'Z_Intern'
 
-async def main(logger, secrets, args, instr): # pylint: disable=unused-argument,missing-function-docstring
-    async with TufinConn(secrets, logger=logger, tls=args.tls) as conn:
+async def main(logger, secrets, args, instr, pool=None): # pylint: disable=unused-argument,missing-function-docstring
+    async with TufinConn(secrets, logger=logger, tls=args.tls, pool=pool) as conn:
         ticket = await read_simple(conn, instr, logger=logger)
         mgmt_id = await grab_device_id(conn, TARGET_DEVICE)
-        members = [
-            await make_member_data(conn, mgmt_id, obj)
-            for obj in FAKE_ADDRESSES
-            ]
-        logger.debug('Members: %s', dumps(members, indent=2, default=str))
-        groupchange = group_change(mgmt_id, TARGET_GROUP, members)
-        logger.debug('Groupchange: %s', dumps(groupchange, indent=2, default=str))
+        groupchange = await group_change_bulk(conn, {(TARGET_GROUP, mgmt_id): FAKE_ADDRESSES})
+        logger.debug('Groupchange: %s', LazyJSON(groupchange, pretty=True))
         status, headers, res = await ticket.set(conn, {'Modifications': groupchange})
         if status != 200:
             logger.error('Bad response: Status %s, headers %s, body %s', status, headers, res)
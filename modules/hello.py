@@ -6,7 +6,7 @@ without credentials - good for simple tests.
 
 from tufin.io import read_tid
 
-async def main(logger, secrets, args, instr): # pylint: disable=unused-argument,missing-function-docstring
+async def main(logger, secrets, args, instr, pool=None): # pylint: disable=unused-argument,missing-function-docstring
     tid = read_tid(instr, logger=logger)
     logger.debug('Ticket id: %s', tid)
     greetstr = '' if tid is None else f', ticket {tid}'
@@ -9,7 +9,6 @@ from ipaddress import ip_address, ip_interface
 from json.decoder import JSONDecodeError
 
 from aiohttp.web import (
-    json_response,
     HTTPNoContent,
     HTTPBadRequest,
     HTTPNotFound,
@@ -18,6 +17,8 @@ from aiohttp.web import (
     Response
     )
 
+from tufin.codec import json_response, loads
+
 async def handler_opt(logger, secrets, args, submodule, req): # pylint: disable=unused-argument
     '''
     Everything lives in /var/opt/, nothing here.
@@ -51,7 +52,7 @@ async def handler_varopt(logger, secrets, args, indata, req): # pylint: disable=
         if vendor != 'json':
             raise HTTPMethodNotAllowed
         try:
-            body = await req.json()
+            body = loads(await req.read())
         except JSONDecodeError as e:
             raise HTTPBadRequest from e
         try:
@@ -1,7 +1,9 @@
 
 '''
 Application logic for the server. So far only remote
-module invocation is implemented.
+module invocation is implemented. The application owns
+a TufinPool for its whole lifetime, which is handed to
+every module invocation.
 '''
 
 from aiohttp.web import (
@@ -15,7 +17,10 @@ from aiohttp.web import (
 
 from modules import run_module
 from opt import run_opt
+from tufin.codec import json_response
+from tufin.common import TufinConn
 from tufin.io import format_success_failure
+from tufin.pool import TufinPool, missing_secrets
 
 def make_app(logger, secrets, args):
     '''
@@ -25,6 +30,32 @@ def make_app(logger, secrets, args):
     optlogger = logger.getChild('opt')
     varoptlogger = logger.getChild('var.opt')
     routes = []
+    shared = {'pool': None}
+
+    async def pool_context(app): # pylint: disable=unused-argument
+        '''
+        Opens the shared Tufin connection pool on startup, pre-warms
+        its catalogs and closes it on cleanup. Without credentials,
+        modules fall back to opening their own connections.
+        '''
+        missing = missing_secrets(secrets)
+        if missing:
+            logger.warning('No shared Tufin pool, missing secrets: %s', missing)
+            yield
+            return
+        if args.inventory_snapshot and args.database is None:
+            logger.warning('No inventory snapshot, --inventory-snapshot needs a --database')
+        async with TufinPool.from_args(secrets, args) as pool:
+            shared['pool'] = pool
+            logger.info('Opened shared Tufin pool')
+            bglogger = logger.getChild('background')
+            await pool.start_background(
+                TufinConn(secrets, logger=bglogger, tls=args.tls, pool=pool)
+                , logger=bglogger
+                )
+            yield
+            shared['pool'] = None
+        logger.info('Closed shared Tufin pool')
 
     async def hello(req): # pylint: disable=unused-variable
         '''
@@ -33,6 +64,14 @@ def make_app(logger, secrets, args):
         return Response(text=f'Hello, {req.host}!')
     routes.append(rget('/', hello))
 
+    async def stats(req): # pylint: disable=unused-variable,unused-argument
+        '''
+        Counters of the shared Tufin pool, for monitoring and sizing.
+        '''
+        pool = shared['pool']
+        return json_response({} if pool is None else pool.stats())
+    routes.append(rget('/api/v0.1/stats', stats))
+
     async def handle_module(req): # pylint: disable=unused-variable
         '''
         The entry point to invoke a module remotely.
@@ -41,7 +80,7 @@ def make_app(logger, secrets, args):
         '''
         module_name = req.match_info['module']
         instr = await req.text()
-        result = await run_module(logger, secrets, args, instr, module_name)
+        result = await run_module(logger, secrets, args, instr, module_name, pool=shared['pool'])
         return Response(text=format_success_failure(result))
     routes.append(rpost('/api/v0.1/module/{module}', handle_module))
 
@@ -63,6 +102,7 @@ def make_app(logger, secrets, args):
     routes.append(rroute('*', '/api/v0.1/var/opt/{module}/{submodule:.*}', handle_varopt))
 
     app = Application()
+    app.cleanup_ctx.append(pool_context)
     app.add_routes(routes)
     return app
 
@@ -0,0 +1,59 @@
+
+'''
+Background maintenance for server mode: catalogs, indexes and watchers
+that refresh themselves on an interval while the server runs.
+'''
+
+from asyncio import CancelledError, ensure_future, sleep as a_sleep
+
+class Periodic():
+    '''
+    Runs an argument-less coroutine function every interval seconds
+    until stopped. Failures are logged and do not end the loop.
+    '''
+    def __init__(self, func, interval, logger=None, name='periodic task'):
+        self._func = func
+        self._interval = interval
+        self._logger = logger
+        self._name = name
+        self._task = None
+    @property
+    def running(self):
+        '''
+        Whether the loop has been started and not stopped.
+        '''
+        return self._task is not None and not self._task.done()
+    def start(self, delay=None):
+        '''
+        Starts the loop. The first run happens after delay seconds,
+        by default after one interval.
+        '''
+        if self.running or not self._interval:
+            return None
+        self._task = ensure_future(self._loop(self._interval if delay is None else delay))
+        return None
+    async def stop(self):
+        '''
+        Stops the loop and waits for it to end.
+        '''
+        if self._task is None:
+            return None
+        self._task.cancel()
+        try:
+            await self._task
+        except CancelledError:
+            pass
+        self._task = None
+        return None
+    async def _loop(self, delay):
+        '''
+        The loop itself.
+        '''
+        while True:
+            await a_sleep(delay)
+            delay = self._interval
+            try:
+                await self._func()
+            except Exception: # pylint: disable=broad-except
+                if self._logger is not None:
+                    self._logger.exception('Error in %s', self._name)
@@ -0,0 +1,64 @@
+
+'''
+Bounded-concurrency batch execution. A batch runs many calls at once,
+at most limit of them at a time, keeps the results in the order of the
+calls and collects errors per call instead of cancelling the rest.
+'''
+
+from asyncio import Semaphore, gather
+from time import monotonic
+
+DEFAULT_BATCH_LIMIT = 8
+
+class BatchResult():
+    '''
+    The outcome of a batch. The results list holds one entry per call,
+    either its return value or the exception it raised; errors lists
+    the (index, exception) pairs of the failed calls.
+    '''
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.errors = [
+            (index, result)
+            for index, result in enumerate(results)
+            if isinstance(result, Exception)
+            ]
+        self.elapsed = elapsed
+    def values(self):
+        '''
+        The return values of all calls, raising the first error if
+        any call failed.
+        '''
+        if self.errors:
+            raise self.errors[0][1]
+        return self.results
+    def show(self):
+        '''
+        A readable summary, suitable for logging.
+        '''
+        count = len(self.results)
+        return {
+            'calls': count
+            , 'errors': len(self.errors)
+            , 'elapsed': round(self.elapsed, 3)
+            , 'rate': round(count / self.elapsed, 1) if self.elapsed > 0 else None
+            }
+
+async def run_batch(calls, limit=DEFAULT_BATCH_LIMIT):
+    '''
+    Runs calls, an iterable of argument-less functions returning
+    awaitables, with at most limit of them in flight at once.
+    A limit of None or zero runs all of them at once.
+    '''
+    semaphore = Semaphore(limit) if limit else None
+    async def guarded(call):
+        try:
+            if semaphore is None:
+                return await call()
+            async with semaphore:
+                return await call()
+        except Exception as e: # pylint: disable=broad-except
+            return e
+    started = monotonic()
+    results = await gather(*(guarded(call) for call in calls))
+    return BatchResult(list(results), monotonic() - started)
@@ -0,0 +1,171 @@
+
+'''
+Bulk ticket creation. A BulkCreation submits ticket specs from an
+iterable or async iterable concurrently, at most limit at a time, and
+yields a TicketOutcome per spec as soon as its ticket is created or has
+failed, so that results stream back in completion order. Specs are
+pulled from the source only as slots free up.
+
+A spec is either a ready payload {'ticket': {...}} or the keyword
+arguments of tufin.ticket.ticket_creation_data(...) as a dict, or
+either of these as a string of JSON. Specs that cannot be parsed yield
+a failed TicketOutcome like any other failure.
+Creation is not idempotent, so the pool's RetryPolicy only repeats a
+creation SecureChange refused, see tufin.throttle .
+'''
+
+from asyncio import FIRST_COMPLETED, ensure_future, gather, wait
+from time import monotonic
+
+from tufin.batch import DEFAULT_BATCH_LIMIT
+from tufin.codec import loads
+from tufin.ticket import ticket_creation_data
+
+class TicketOutcome(): # pylint: disable=too-few-public-methods
+    '''
+    The result of creating a single ticket: the position of its spec
+    in the source and the id of the created ticket or the error.
+    '''
+    def __init__(self, index, ticket_id=None, error=None, elapsed=0.0):
+        self.index = index
+        self.ticket_id = ticket_id
+        self.error = error
+        self.elapsed = elapsed
+    @property
+    def ok(self):
+        '''
+        Whether the ticket was created.
+        '''
+        return self.error is None
+    def show(self):
+        '''
+        A readable representation, suitable for JSON serialisation.
+        '''
+        return {
+            'index': self.index
+            , 'id': self.ticket_id
+            , 'error': None if self.error is None else repr(self.error)
+            , 'elapsed': round(self.elapsed, 3)
+            }
+
+class BulkCreation():
+    '''
+    Creates tickets with at most limit creations in flight. The
+    counters accumulate over all runs of create(...) , see stats(...) .
+    '''
+    def __init__(self, limit=DEFAULT_BATCH_LIMIT):
+        self._limit = max(1, limit or 1)
+        self._elapsed = 0.0
+        self._counters = {
+            'submitted': 0
+            , 'created': 0
+            , 'failed': 0
+            }
+    async def create(self, conn, specs, numbered=False):
+        '''
+        An async iterator of the TicketOutcome of every spec, in the
+        order the creations finish. Leaving the iteration early, or an
+        error raised by the source of specs, cancels the creations in
+        flight. If numbered, specs are (index, spec) pairs and outcomes
+        carry the given index instead of the position in specs.
+        '''
+        source = spec_source(specs)
+        pending = set()
+        index = 0
+        exhausted = False
+        started = monotonic()
+        try:
+            while True:
+                while not exhausted and len(pending) < self._limit:
+                    try:
+                        spec = await source.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    if numbered:
+                        spec_index, spec = spec
+                    else:
+                        spec_index = index
+                    pending.add(ensure_future(create_one(conn, spec_index, spec)))
+                    self._counters['submitted'] += 1
+                    index += 1
+                if not pending:
+                    break
+                done, pending = await wait(pending, return_when=FIRST_COMPLETED)
+                for task in done:
+                    outcome = task.result()
+                    self._counters['created' if outcome.ok else 'failed'] += 1
+                    yield outcome
+        finally:
+            for task in pending:
+                task.cancel()
+            await gather(*pending, return_exceptions=True)
+            await source.aclose()
+            self._elapsed += monotonic() - started
+    def stats(self):
+        '''
+        Counters and the creation throughput in tickets per second.
+        '''
+        finished = self._counters['created'] + self._counters['failed']
+        return {
+            **self._counters
+            , 'elapsed': round(self._elapsed, 3)
+            , 'tickets_per_second': (
+                round(finished / self._elapsed, 1) if self._elapsed > 0 else None
+                )
+            }
+
+async def create_one(conn, index, spec):
+    '''
+    Creates the ticket of a single spec.
+    '''
+    started = monotonic()
+    try:
+        status, headers, res = await conn.scpost('tickets/', ticket_payload(spec))
+    except Exception as e: # pylint: disable=broad-except
+        return TicketOutcome(index, error=e, elapsed=monotonic() - started)
+    if status not in (200, 201):
+        return TicketOutcome(
+            index
+            , error=ValueError('Bad response creating ticket', status, res)
+            , elapsed=monotonic() - started
+            )
+    return TicketOutcome(
+        index
+        , ticket_id=created_ticket_id(headers, res)
+        , elapsed=monotonic() - started
+        )
+
+async def spec_source(specs):
+    '''
+    An async iterator over an iterable or async iterable of specs.
+    '''
+    if hasattr(specs, '__aiter__'):
+        async for spec in specs:
+            yield spec
+    else:
+        for spec in specs:
+            yield spec
+
+def ticket_payload(spec):
+    '''
+    The creation payload of a spec.
+    '''
+    if isinstance(spec, (str, bytes)):
+        spec = loads(spec)
+    if 'ticket' in spec:
+        return spec
+    return ticket_creation_data(**spec)
+
+def created_ticket_id(headers, res):
+    '''
+    The id of a newly created ticket, from the Location header of the
+    response or, failing that, from its body.
+    '''
+    location = headers.get('Location', '')
+    tail = location.rstrip('/').rsplit('/', 1)[-1]
+    if tail.isdigit():
+        return int(tail)
+    if isinstance(res, dict):
+        return res.get('ticket', res).get('id')
+    return None
@@ -0,0 +1,180 @@
+
+'''
+A bounded in-process cache for read-only API responses. Entries expire
+after a per-endpoint TTL and the least recently used entries are evicted
+once either the entry count or the approximate size in bytes exceeds its
+bound. Endpoints without a TTL are never cached.
+'''
+
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from time import monotonic
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Endpoint patterns and TTLs in seconds for SecureTrack, first match wins
+DEFAULT_ST_TTLS = (
+    ('devices', 300)
+    , ('devices/*/network_objects', 120)
+    , ('network_objects/search', 120)
+    )
+
+class CacheEntry(): # pylint: disable=too-few-public-methods
+    '''
+    A cached response along with its bookkeeping.
+    '''
+    __slots__ = ('value', 'size', 'expires', 'endpoint', 'device_id')
+    def __init__(self, value, size, expires, endpoint, device_id): # pylint: disable=too-many-arguments
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.endpoint = endpoint
+        self.device_id = device_id
+
+class ResponseCache(): # pylint: disable=too-many-instance-attributes
+    '''
+    A TTL and LRU cache keyed by request. Values are shared between
+    callers and must be treated as read-only.
+    '''
+    def __init__(
+            self
+            , ttls=DEFAULT_ST_TTLS
+            , max_entries=DEFAULT_MAX_ENTRIES
+            , max_bytes=DEFAULT_MAX_BYTES
+            ):
+        self._ttls = tuple(ttls)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._epoch = 0
+        self._device_epochs = {}
+        self._counters = {
+            'hits': 0
+            , 'misses': 0
+            , 'stores': 0
+            , 'evictions': 0
+            , 'expirations': 0
+            , 'invalidations': 0
+            }
+    @property
+    def epoch(self):
+        '''
+        Changes on every invalidation not limited to a device.
+        '''
+        return self._epoch
+    def epoch_of(self, endpoint, params=None):
+        '''
+        Changes on every invalidation that affects the response to a
+        request. Responses fetched before such an invalidation are not
+        stored afterwards, see put(...) .
+        '''
+        return self._epoch, self._device_epochs.get(entry_device(endpoint, params), 0)
+    def ttl(self, endpoint):
+        '''
+        The TTL for an endpoint, None if it is not to be cached.
+        '''
+        if not self._max_entries:
+            return None
+        for pattern, ttl in self._ttls:
+            if fnmatchcase(endpoint, pattern):
+                return ttl
+        return None
+    def get(self, key):
+        '''
+        Returns the cached value for key, or None.
+        '''
+        entry = self._entries.get(key)
+        if entry is None:
+            self._counters['misses'] += 1
+            return None
+        if entry.expires <= monotonic():
+            self._drop(key)
+            self._counters['expirations'] += 1
+            self._counters['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._counters['hits'] += 1
+        return entry.value
+    def put(self, key, endpoint, params, value, size, epoch=None): # pylint: disable=too-many-arguments
+        '''
+        Stores a value for key if its endpoint is cacheable and no
+        invalidation affecting it has happened since epoch was taken
+        with epoch_of(...) .
+        '''
+        ttl = self.ttl(endpoint)
+        if ttl is None or (epoch is not None and epoch != self.epoch_of(endpoint, params)):
+            return None
+        if size > self._max_bytes:
+            return None
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = CacheEntry(
+            value
+            , size
+            , monotonic() + ttl
+            , endpoint
+            , entry_device(endpoint, params)
+            )
+        self._bytes += size
+        self._counters['stores'] += 1
+        while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+            self._drop(next(iter(self._entries)))
+            self._counters['evictions'] += 1
+        return None
+    def invalidate(self, pattern='*', device_id=None):
+        '''
+        Drops all entries whose endpoint matches pattern and, if given,
+        that concern the device with id device_id. Returns the number
+        of entries dropped.
+        '''
+        device_id = None if device_id is None else str(device_id)
+        if device_id is None:
+            self._epoch += 1
+        else:
+            self._device_epochs[device_id] = self._device_epochs.get(device_id, 0) + 1
+        stale = [
+            key
+            for key, entry in self._entries.items()
+            if fnmatchcase(entry.endpoint, pattern)
+            and (device_id is None or entry.device_id == device_id)
+            ]
+        for key in stale:
+            self._drop(key)
+        self._counters['invalidations'] += len(stale)
+        return len(stale)
+    def clear(self):
+        '''
+        Drops everything.
+        '''
+        return self.invalidate()
+    def _drop(self, key):
+        '''
+        Removes a single entry.
+        '''
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+    def stats(self):
+        '''
+        Counters for monitoring and sizing.
+        '''
+        return {
+            **self._counters
+            , 'entries': len(self._entries)
+            , 'bytes': self._bytes
+            , 'max_entries': self._max_entries
+            , 'max_bytes': self._max_bytes
+            }
+
+def entry_device(endpoint, params):
+    '''
+    The id of the device a request concerns, if any, as a string.
+    Recognizes devices/{id}/... endpoints and device_id parameters.
+    '''
+    parts = endpoint.strip('/').split('/')
+    if len(parts) > 1 and parts[0] == 'devices':
+        return parts[1]
+    if params and params.get('device_id') is not None:
+        return str(params['device_id'])
+    return None
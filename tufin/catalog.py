@@ -0,0 +1,119 @@
+
+'''
+An in-memory catalog of the SecureTrack devices. The catalog is loaded
+in full once and then refreshed in the background, so device lookups by
+name or id need no round trip. In server mode it lives in the shared
+TufinPool and is pre-warmed at startup; grab_device_id(...) in
+tufin.securetrack consults it before asking the API.
+'''
+
+from time import monotonic
+
+from tufin.background import Periodic
+from tufin.securetrack import iter_devices
+
+DEFAULT_REFRESH_INTERVAL = 600
+
+class DeviceCatalog(): # pylint: disable=too-many-instance-attributes
+    '''
+    Indexes of all devices by name and by id. Lookups see either the
+    previous or the new state of a refresh, never a mix.
+    '''
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self._by_name = {}
+        self._by_id = {}
+        self._loaded_at = None
+        self._refresh_interval = refresh_interval
+        self._refresher = None
+        self._loads = 0
+        self._hits = 0
+        self._misses = 0
+    @property
+    def loaded(self):
+        '''
+        Whether the catalog has been loaded at least once.
+        '''
+        return self._loaded_at is not None
+    async def load(self, conn):
+        '''
+        Loads all devices from SecureTrack and replaces the indexes.
+        Returns the number of devices.
+        '''
+        return self.install([device async for device in iter_devices(conn)])
+    def install(self, devices):
+        '''
+        Replaces the indexes with the given device metadata, e.g. from
+        an inventory snapshot. Returns the number of devices.
+        '''
+        by_name = {}
+        by_id = {}
+        for device in devices:
+            by_id[str(device['id'])] = device
+            by_name.setdefault(device['name'], device['id'])
+        self._by_name = by_name
+        self._by_id = by_id
+        self._loaded_at = monotonic()
+        self._loads += 1
+        return len(by_id)
+    def device_id(self, name):
+        '''
+        The id of the device with the given name, None if unknown.
+        '''
+        device_id = self._by_name.get(name)
+        if device_id is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return device_id
+    def device(self, device_id):
+        '''
+        The metadata of the device with the given id, None if unknown.
+        '''
+        return self._by_id.get(str(device_id))
+    def devices(self):
+        '''
+        The metadata of all devices.
+        '''
+        return list(self._by_id.values())
+    async def start(self, conn, logger=None, initial=True):
+        '''
+        Loads the catalog and keeps refreshing it in the background
+        using conn, which must stay open until stop(...) is called.
+        A failed first load is logged; lookups then fall back to the
+        API until a refresh succeeds. Without initial, the first load
+        is left to the background refresh.
+        '''
+        if initial:
+            try:
+                count = await self.load(conn)
+                if logger is not None:
+                    logger.info('Device catalog loaded with %s devices', count)
+            except Exception: # pylint: disable=broad-except
+                if logger is not None:
+                    logger.exception('Could not pre-warm the device catalog')
+        self._refresher = Periodic(
+            lambda: self.load(conn)
+            , self._refresh_interval
+            , logger=logger
+            , name='device catalog refresh'
+            )
+        self._refresher.start()
+        return None
+    async def stop(self):
+        '''
+        Stops the background refresh.
+        '''
+        if self._refresher is not None:
+            await self._refresher.stop()
+        return None
+    def stats(self):
+        '''
+        Counters for monitoring.
+        '''
+        return {
+            'devices': len(self._by_id)
+            , 'loads': self._loads
+            , 'age': None if self._loaded_at is None else round(monotonic() - self._loaded_at, 1)
+            , 'hits': self._hits
+            , 'misses': self._misses
+            }
@@ -0,0 +1,127 @@
+
+'''
+Chunked submission of large group changes. SecureChange times out on or
+rejects multi_group_change fields with thousands of members, so a large
+change is split into chunks of bounded size. Writing a field replaces
+its value, so every chunk goes to a group change field of its own,
+e.g. "Modifications 1" to "Modifications 5" of the same step, through
+SimpleStep.set(...) . A ChunkedSubmission keeps track of the chunks
+already accepted, and its state can be saved and handed back to resume
+a partial submission without resending them.
+'''
+
+from hashlib import sha256
+
+from tufin.codec import dumpb
+
+DEFAULT_MAX_MEMBERS = 500
+
+class ChunkedSubmission():
+    '''
+    A group change, as provided by tufin.securechange , split into
+    chunks of at most max_members members. The state argument takes
+    the state(...) of an earlier submission of the same change.
+    '''
+    def __init__(self, groupchange, max_members=DEFAULT_MAX_MEMBERS, state=None):
+        self.chunks = split_group_change(groupchange, max_members)
+        self.digest = change_digest(groupchange, max_members)
+        self.done = set()
+        if state is not None:
+            if state.get('digest') != self.digest:
+                raise ValueError(
+                    'Saved progress belongs to another group change'
+                    , state.get('digest')
+                    , self.digest
+                    )
+            self.done = set(state.get('done', []))
+    @property
+    def complete(self):
+        '''
+        Whether all chunks have been accepted.
+        '''
+        return len(self.done) == len(self.chunks)
+    def remaining(self):
+        '''
+        The indexes of the chunks not yet accepted.
+        '''
+        return [index for index in range(len(self.chunks)) if index not in self.done]
+    def state(self):
+        '''
+        The progress so far, suitable for JSON serialisation.
+        '''
+        return {
+            'digest': self.digest
+            , 'chunks': len(self.chunks)
+            , 'done': sorted(self.done)
+            }
+    async def submit(self, conn, step, fieldnames, parallel=1, on_progress=None): # pylint: disable=too-many-arguments
+        '''
+        Sends the remaining chunks to step, a tufin.ticket.SimpleStep ,
+        at most parallel at a time. Chunk i goes to the group change
+        field fieldnames[i], so there must be a field per chunk.
+        on_progress is called with this object after every accepted
+        chunk. All chunks are attempted; the first failure is raised
+        afterwards, and submit(...) may then simply be called again.
+        '''
+        fieldnames = list(fieldnames)
+        if len(fieldnames) < len(self.chunks):
+            raise ValueError(
+                'Not enough group change fields for all chunks'
+                , len(self.chunks)
+                , fieldnames
+                )
+        async def send(conn, index):
+            status, _, res = await step.set(conn, {fieldnames[index]: self.chunks[index]})
+            if status != 200:
+                raise ValueError('Bad response submitting group change chunk', index, status, res)
+            self.done.add(index)
+            if on_progress is not None:
+                on_progress(self)
+            return status
+        result = await conn.batch(
+            [
+                (lambda c, index=index: send(c, index))
+                for index in self.remaining()
+                ]
+            , limit=parallel
+            )
+        if result.errors:
+            raise result.errors[0][1]
+        return self
+
+def split_group_change(groupchange, max_members=DEFAULT_MAX_MEMBERS):
+    '''
+    Splits a multi_group_change into several, each with at most
+    max_members members in total. Groups larger than that are spread
+    over consecutive chunks. Only the first piece of a group to be
+    created creates it, the later ones add to it.
+    '''
+    pieces = []
+    for change in groupchange['group_change']:
+        members = change.get('members', {}).get('member') or []
+        if isinstance(members, dict):
+            members = [members]
+        for start in range(0, max(len(members), 1), max_members):
+            piece = {**change, 'members': {'member': members[start:start+max_members]}}
+            if start > 0 and change.get('change_action') == 'CREATE':
+                piece['change_action'] = 'UPDATE'
+            pieces.append(piece)
+    chunks = []
+    size = 0
+    for piece in pieces:
+        count = len(piece['members']['member'])
+        if not chunks or size + count > max_members:
+            chunks.append({
+                '@xsi.type': groupchange.get('@xsi.type', 'multi_group_change')
+                , 'group_change': []
+                })
+            size = 0
+        chunks[-1]['group_change'].append(piece)
+        size += count
+    return chunks
+
+def change_digest(groupchange, max_members):
+    '''
+    Identifies a group change and its chunking, for resuming.
+    '''
+    return sha256(dumpb([groupchange, max_members])).hexdigest()[:16]
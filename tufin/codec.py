@@ -0,0 +1,83 @@
+
+'''
+The JSON codec used throughout Threefin. Encoding and decoding go through
+orjson when it is installed and through the standard library otherwise.
+Both backends decode bytes or strings and raise json.JSONDecodeError on
+bad input. Values orjson cannot encode, such as integers beyond 64 bits,
+are encoded by the standard library instead.
+
+The backend can be chosen explicitly with use_backend(...) , e.g. to
+compare results or timings.
+'''
+
+from json import dumps as std_dumps, loads as std_loads
+
+from aiohttp.web import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ('orjson', 'stdlib') if orjson is not None else ('stdlib',)
+_BACKEND = {'name': BACKENDS[0]}
+
+def use_backend(name):
+    '''
+    Selects the backend, one of BACKENDS.
+    '''
+    if name not in BACKENDS:
+        raise ValueError('Unavailable JSON backend', name, BACKENDS)
+    _BACKEND['name'] = name
+
+def backend():
+    '''
+    The name of the backend in use.
+    '''
+    return _BACKEND['name']
+
+def loads(data):
+    '''
+    Decodes a JSON document given as bytes or string.
+    '''
+    if _BACKEND['name'] == 'orjson':
+        return orjson.loads(data) # pylint: disable=no-member
+    return std_loads(data)
+
+def dumpb(obj, default=None, pretty=False):
+    '''
+    Encodes obj as UTF-8 JSON bytes. The default argument works as
+    with json.dumps(...) , pretty indents by two spaces.
+    '''
+    if _BACKEND['name'] == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0) # pylint: disable=no-member
+        try:
+            return orjson.dumps(obj, default=default, option=option) # pylint: disable=no-member
+        except orjson.JSONEncodeError: # pylint: disable=no-member
+            pass
+    return std_dumps(obj, default=default, indent=2 if pretty else None).encode('utf-8')
+
+def dumps(obj, default=None, pretty=False):
+    '''
+    Like dumpb(...) , but returns a string.
+    '''
+    if _BACKEND['name'] == 'stdlib':
+        return std_dumps(obj, default=default, indent=2 if pretty else None)
+    return dumpb(obj, default=default, pretty=pretty).decode('utf-8')
+
+def json_response(data, status=200, headers=None):
+    '''
+    An aiohttp response with a JSON body, encoded straight to bytes.
+    '''
+    return Response(
+        body=dumpb(data)
+        , status=status
+        , headers=headers
+        , content_type='application/json'
+        )
+
+def is_json_type(content_type):
+    '''
+    Whether a media type denotes JSON, including the +json suffix.
+    '''
+    return content_type == 'application/json' or content_type.endswith('+json')
@@ -4,15 +4,25 @@ This module provides the TufinConn class, abstracting over the communication
 with the SecureTrack and SecureChange servers.
 '''
 
-from asyncio import gather
-from json import dumps
+from asyncio import sleep as a_sleep
+from contextlib import asynccontextmanager
+from logging import DEBUG
+from time import monotonic
 
-from aiohttp import ClientSession, BasicAuth, ContentTypeError
-
-TUFIN_HEADERS = {
-    'accept': 'application/json'
-    , 'content-type': 'application/json'
-    }
+from tufin.batch import run_batch, DEFAULT_BATCH_LIMIT
+from tufin.codec import dumpb, loads, is_json_type
+from tufin.jsonstream import stream_items
+from tufin.lazylog import LazyJSON, call_fields
+from tufin.paging import paginate, DEFAULT_PAGE_SIZE, DEFAULT_READAHEAD
+from tufin.pool import TufinPool, TUFIN_HEADERS # pylint: disable=unused-import
+from tufin.singleflight import flight_key
+from tufin.throttle import (
+    RETRY_ERRORS,
+    RETRY_STATUSES,
+    COOLDOWN_STATUSES,
+    REFUSED_ERRORS,
+    REFUSED_STATUSES
+    )
 
 def singleton_or_list(obj):
     '''
@@ -34,33 +44,14 @@ class TufinConn():
     """
     A wrapper to grab authentication data and
     generate the right headers.
+
+    When a pool is given, its sessions are borrowed and left open on
+    exit. Otherwise a private pool is created and closed on exit.
     """
-    def __init__(self, secrets, logger=None, tls=None):
+    def __init__(self, secrets, logger=None, tls=None, pool=None):
         self._logger = logger
-
-        scbaseurl = secrets.get('SECURECHANGEURL')
-        scusername = secrets.get('SECURECHANGEUSER')
-        scpassword = secrets.get('SECURECHANGEPASSWORD')
-        assert scbaseurl is not None
-        assert scusername is not None
-        assert scpassword is not None
-        stbaseurl = secrets.get('SECURETRACKURL')
-        stusername = secrets.get('SECURETRACKUSER')
-        stpassword = secrets.get('SECURETRACKPASSWORD')
-        assert stbaseurl is not None
-        assert stusername is not None
-        assert stpassword is not None
-
-        self._scconn = ClientSession(
-            auth=BasicAuth(scusername, password=scpassword)
-            , headers=TUFIN_HEADERS
-            )
-        self._stconn = ClientSession(
-            auth=BasicAuth(stusername, password=stpassword)
-            , headers=TUFIN_HEADERS
-            )
-        self._scbaseurl = scbaseurl if scbaseurl[-1] == '/' else scbaseurl+'/'
-        self._stbaseurl = stbaseurl if stbaseurl[-1] == '/' else stbaseurl+'/'
+        self._owns_pool = pool is None
+        self._pool = TufinPool(secrets) if pool is None else pool
         self._tls = tls
         return None
     async def __aenter__(self):
@@ -70,56 +61,272 @@ class TufinConn():
         return self
     async def __aexit__(self, exc_type, exc, tb): # pylint: disable=invalid-name
         '''
-        Infrastructure function. Closes the underlying connections.
+        Infrastructure function. Closes the underlying connections
+        unless they belong to a shared pool.
         '''
-        await gather(
-            self._scconn.close()
-            , self._stconn.close()
-            )
+        if self._owns_pool:
+            await self._pool.close()
         return None
-    async def _call(self, conn, method, url, body, params=None, xml=False): # pylint: disable=too-many-arguments
+    @property
+    def pool(self):
+        '''
+        The pool this connection draws its sessions from.
+        '''
+        return self._pool
+    async def _call(self, upstream, method, endpoint, body, params=None, xml=False): # pylint: disable=too-many-arguments
         '''
         A generic call to some endpoint.
         '''
+        status, headers, resjson, _ = await self._fetch(
+            upstream, method, endpoint, body, params, xml
+            )
+        return status, headers, resjson
+    async def _fetch(self, upstream, method, endpoint, body, params=None, xml=False): # pylint: disable=too-many-arguments
+        '''
+        Like _call(...), but also returns the size of the response
+        body in bytes.
+        '''
+        url = upstream.url(endpoint)
+        started = monotonic()
+        async with self._response(upstream, method, url, body, params, xml) as res:
+            status, headers, resjson, size = await self._decode(res, url)
+        self._log_call(
+            method, url, endpoint, params, body, status, resjson, size, monotonic() - started
+            )
+        return status, headers, resjson, size
+    def _log_call(self, method, url, endpoint, params, body, status, resjson, size, duration): # pylint: disable=too-many-arguments
+        '''
+        Logs a finished call at debug level. Bodies are only serialised
+        if the record is emitted, and truncated then.
+        '''
+        if self._logger is None or not self._logger.isEnabledFor(DEBUG):
+            return None
+        self._logger.debug(
+            '%s %s -> %s in %.3fs, %s bytes\nParams: %s\nBody: %s\nResult: %s'
+            , method, url, status, duration, size
+            , params, LazyJSON(body), LazyJSON(resjson)
+            , extra=call_fields(method, endpoint, status, duration, size)
+            )
+        return None
+    @asynccontextmanager
+    async def _response(self, upstream, method, url, body, params, xml): # pylint: disable=too-many-arguments
+        '''
+        Provides the response to a request while holding a slot of the
+        upstream's throttle. Idempotent requests are retried on transient
+        errors, all requests when the server refused them, before the
+        response is handed out.
+        '''
+        attempt = 0
+        while True:
+            async with upstream.throttle:
+                res, retry = await self._attempt(upstream, method, url, body, params, xml, attempt)
+                if res is not None:
+                    try:
+                        yield res
+                    finally:
+                        res.release()
+                    return
+            await self._backoff(upstream, method, url, attempt, *retry)
+            attempt += 1
+    async def _open(self, upstream, method, url, body, params, xml): # pylint: disable=too-many-arguments
+        '''
+        Like _response(...), but holds the throttle slot only until the
+        headers have arrived and returns the response, which the caller
+        must release.
+        '''
+        attempt = 0
+        while True:
+            async with upstream.throttle:
+                res, retry = await self._attempt(upstream, method, url, body, params, xml, attempt)
+            if res is not None:
+                return res
+            await self._backoff(upstream, method, url, attempt, *retry)
+            attempt += 1
+    async def _attempt(self, upstream, method, url, body, params, xml, attempt): # pylint: disable=too-many-arguments
+        '''
+        Sends a request once, within a throttle slot the caller holds.
+        Returns (response, None) for a response to hand out, or
+        (None, (delay, reason)) if the request is to be retried.
+        '''
+        try:
+            res = await self._request(upstream.session, method, url, body, params, xml)
+        except RETRY_ERRORS as e:
+            if not upstream.retry.may_retry(method, attempt, refused=isinstance(e, REFUSED_ERRORS)):
+                raise
+            return None, (upstream.retry.delay(attempt), repr(e))
+        refused = res.status in REFUSED_STATUSES
+        if res.status not in RETRY_STATUSES:
+            return res, None
+        if not upstream.retry.may_retry(method, attempt, refused=refused):
+            return res, None
+        delay = upstream.retry.delay(attempt, res.headers.get('Retry-After'))
+        if res.status in COOLDOWN_STATUSES:
+            upstream.throttle.cool_down(delay)
+        res.release()
+        return None, (delay, res.status)
+    async def _backoff(self, upstream, method, url, attempt, delay, reason): # pylint: disable=too-many-arguments
+        '''
+        Waits out the delay before retrying a request.
+        '''
+        upstream.throttle.count_retry()
+        if self._logger:
+            self._logger.info(
+                'Retrying %s %s in %.2fs after attempt %s: %s'
+                , method, url, delay, attempt + 1, reason
+                )
+        await a_sleep(delay)
+        return None
+    async def _stream(self, upstream, method, endpoint, path, body=None, params=None): # pylint: disable=too-many-arguments
+        '''
+        Yields the items found under path in the response, decoding
+        them one at a time as the body arrives, see tufin.jsonstream .
+        The throttle slot is given back once the headers have arrived,
+        so a slow or abandoned consumer does not hold up other
+        requests. The response is released when the stream is
+        exhausted or closed.
+        '''
+        url = upstream.url(endpoint)
+        res = await self._open(upstream, method, url, body, params, False)
+        try:
+            if res.status != 200:
+                raise ValueError(
+                    'Bad status streaming response'
+                    , url
+                    , params
+                    , res.status
+                    , await res.text()
+                    )
+            started = monotonic()
+            count = 0
+            async for item in stream_items(res.content, path):
+                count += 1
+                yield item
+            if self._logger:
+                duration = monotonic() - started
+                self._logger.debug(
+                    'Streamed %s items from %s %s in %.3fs', count, method, url, duration
+                    , extra=call_fields(method, endpoint, res.status, duration, res.content_length)
+                    )
+        finally:
+            res.release()
+    async def _get(self, upstream, endpoint, params=None, cache=None):
+        '''
+        A GET call to some endpoint. Identical concurrent GETs share a
+        single request and its decoded result, and successful results
+        are kept in the cache if one is given. Callers must not modify
+        the result.
+        '''
+        key = flight_key(upstream, 'GET', endpoint, params)
+        if cache is not None and cache.ttl(endpoint) is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        async def fetch():
+            epoch = None if cache is None else cache.epoch_of(endpoint, params)
+            status, headers, resjson, size = await self._fetch(
+                upstream, 'GET', endpoint, None, params
+                )
+            if cache is not None and status == 200:
+                cache.put(key, endpoint, params, (status, headers, resjson), size, epoch=epoch)
+            return status, headers, resjson
+        return await self._pool.singleflight.do(key, fetch)
+    def invalidate(self, pattern='*', device_id=None):
+        '''
+        Drops cached SecureTrack responses for endpoints matching the
+        pattern and, if given, concerning the device device_id. Meant
+        to be called after changes that affect SecureTrack data.
+        '''
+        return self._pool.stcache.invalidate(pattern=pattern, device_id=device_id)
+    async def batch(self, specs, limit=DEFAULT_BATCH_LIMIT):
+        '''
+        Runs many calls concurrently, at most limit at a time, and
+        returns a tufin.batch.BatchResult in the order of the specs.
+        Each spec is either a tuple (method_name, *args) naming a method
+        of this connection, e.g. ('stget', 'devices', {'name': 'fw1'}),
+        or a function taking the connection and returning an awaitable.
+        '''
+        result = await run_batch([self._batch_call(spec) for spec in specs], limit=limit)
+        if self._logger:
+            self._logger.debug('Batch finished: %s', result.show())
+        return result
+    def _batch_call(self, spec):
+        '''
+        Turns a batch spec into an argument-less function.
+        '''
+        if callable(spec):
+            return lambda: spec(self)
+        name, *args = spec
+        method = getattr(self, name)
+        return lambda: method(*args)
+    def _pages(self, upstream, endpoint, path, params, page_size, readahead): # pylint: disable=too-many-arguments
+        '''
+        Iterates over a paginated collection, see tufin.paging .
+        Pages bypass the cache and are not coalesced.
+        '''
+        async def fetch(start, count):
+            return await self._call(
+                upstream, 'GET', endpoint, None
+                , params={**(params or {}), 'start': start, 'count': count}
+                )
+        return paginate(fetch, path, page_size=page_size, readahead=readahead)
+    async def _request(self, conn, method, url, body, params, xml): # pylint: disable=too-many-arguments
+        '''
+        Sends a single request.
+        '''
         if xml:
             headers = {'content-type': 'application/xml', 'accept': 'application/json'}
-            res = await conn.request(method, url, data=body, headers=headers, params=params, ssl=self._tls)
-        else:
-            res = await conn.request(method, url, json=body, params=params, ssl=self._tls)
-        try:
-            resjson = await res.json()
-        except ContentTypeError as e:
+            return await conn.request(method, url, data=body, headers=headers, params=params, ssl=self._tls)
+        data = None if body is None else dumpb(body)
+        return await conn.request(method, url, data=data, params=params, ssl=self._tls)
+    async def _decode(self, res, url):
+        '''
+        Reads and decodes a response.
+        '''
+        raw = await res.read()
+        size = len(raw)
+        if not is_json_type(res.content_type):
             restext = await res.text()
             if not restext:
-                return res.status, res.headers, None
-            raise ValueError('Server did not return valid JSON', url, res.status, restext) from e
-        if self._logger:
-            self._logger.debug('''
-Method: %s
-URL: %s
-Params: %s
-Body: %s
-Status: %s
-Result: %s
-''', method, url, params, body, res.status, dumps(resjson))
-        return res.status, res.headers, resjson
+                return res.status, res.headers, None, size
+            raise ValueError('Server did not return valid JSON', url, res.status, restext)
+        resjson = loads(raw) if raw.strip() else None
+        return res.status, res.headers, resjson, size
     async def scxml(self, method, endpoint, body, params=None):
-        url = self._scbaseurl + endpoint
-        return await self._call(self._scconn, method, url, body, params=params, xml=True)
+        return await self._call(self._pool.sc, method, endpoint, body, params=params, xml=True)
     async def stxml(self, method, endpoint, body, params=None):
-        url = self._stbaseurl + endpoint
-        return await self._call(self._stconn, method, url, body, params=params, xml=True)
+        return await self._call(self._pool.st, method, endpoint, body, params=params, xml=True)
     async def stcall(self, method, endpoint, body, params=None):
         '''
         A generic call to the SecureTrack endpoint.
         '''
-        url = self._stbaseurl + endpoint
-        return await self._call(self._stconn, method, url, body, params=params)
+        return await self._call(self._pool.st, method, endpoint, body, params=params)
     async def stget(self, endpoint, params=None):
         '''
-        A GET call to the SecureTrack endpoint.
+        A GET call to the SecureTrack endpoint. Read-only lookups are
+        served from the pool's SecureTrack cache where possible.
+        '''
+        return await self._get(self._pool.st, endpoint, params=params, cache=self._pool.stcache)
+    def stpages( # pylint: disable=too-many-arguments
+            self
+            , endpoint
+            , path
+            , params=None
+            , page_size=DEFAULT_PAGE_SIZE
+            , readahead=DEFAULT_READAHEAD
+            ):
         '''
-        return await self.stcall('GET', endpoint, None, params=params)
+        An async iterator over the items of a paginated SecureTrack
+        collection. The path names the keys leading to the items,
+        e.g. ('devices', 'device').
+        '''
+        return self._pages(self._pool.st, endpoint, path, params, page_size, readahead)
+    def ststream(self, endpoint, path, params=None):
+        '''
+        A GET call to the SecureTrack endpoint, yielding the items under
+        path one at a time at bounded memory, e.g. for the path
+        ('network_objects', 'network_object'). Not cached.
+        '''
+        return self._stream(self._pool.st, 'GET', endpoint, path, params=params)
     async def stpost(self, endpoint, body, params=None):
         '''
         A POST call to the SecureTrack endpoint.
@@ -135,13 +342,32 @@ Result: %s
         '''
         A generic call to the SecureChange endpoint.
         '''
-        url = self._scbaseurl + endpoint
-        return await self._call(self._scconn, method, url, body, params=params)
+        return await self._call(self._pool.sc, method, endpoint, body, params=params)
     async def scget(self, endpoint, params=None):
         '''
         A GET call to the SecureChange endpoint.
         '''
-        return await self.sccall('GET', endpoint, None, params=params)
+        return await self._get(self._pool.sc, endpoint, params=params)
+    def scpages( # pylint: disable=too-many-arguments
+            self
+            , endpoint
+            , path
+            , params=None
+            , page_size=DEFAULT_PAGE_SIZE
+            , readahead=DEFAULT_READAHEAD
+            ):
+        '''
+        An async iterator over the items of a paginated SecureChange
+        collection. The path names the keys leading to the items,
+        e.g. ('tickets', 'ticket').
+        '''
+        return self._pages(self._pool.sc, endpoint, path, params, page_size, readahead)
+    def scstream(self, endpoint, path, params=None):
+        '''
+        A GET call to the SecureChange endpoint, yielding the items under
+        path one at a time at bounded memory.
+        '''
+        return self._stream(self._pool.sc, 'GET', endpoint, path, params=params)
     async def scpost(self, endpoint, body, params=None):
         '''
         A POST call to the SecureChange endpoint.
@@ -10,6 +10,7 @@ This module provides two key functions:
 from sys import stdin, stdout
 from xml.etree.ElementTree import fromstring, ParseError, XMLParser
 
+from tufin.singleflight import flight_key
 from tufin.ticket import SimpleTicket
 
 TUFINPARSER = XMLParser(encoding='utf-8')
@@ -17,6 +18,8 @@ TUFINPARSER = XMLParser(encoding='utf-8')
 async def read_simple(conn, instr, logger=None):
     '''
     Fetches the ticket indicated by stdin and returns it in mangled form.
+    Only the current step is validated here; accessing other steps can
+    still raise ValueError, see SimpleTicket .
     '''
     tid, status, ticket = await read_ticket(conn, instr, logger=logger)
     if status != 200:
@@ -24,6 +27,7 @@ async def read_simple(conn, instr, logger=None):
         raise ValueError
     try:
         formatted_ticket = SimpleTicket(ticket)
+        formatted_ticket.steps.get(formatted_ticket.current_step) # Steps are parsed lazily
     except ValueError:
         if logger is not None:
             logger.error('Error mangling ticket %s : %s', tid, ticket)
@@ -32,38 +36,76 @@ async def read_simple(conn, instr, logger=None):
 
 async def read_ticket(conn, instr, logger=None):
     '''
-    Fetches the ticket indicated by stdin.
+    Fetches the ticket indicated by stdin, from the pool's ticket cache
+    if it has not changed since it was cached.
     '''
-    tid = read_tid(instr, logger=logger)
+    tid, fingerprint = read_ticket_info(instr, logger=logger)
     if tid is None:
         return None, None, None
-    status, _, ticket = await conn.scget(f'/tickets/{tid}')
-    if status == 200:
-        ticket = ticket['ticket']
+    status, ticket = await fetch_ticket(conn, tid, fingerprint)
     return tid, status, ticket
 
+async def fetch_ticket(conn, tid, fingerprint=None):
+    '''
+    Fetches a ticket by id as (status, ticket), from the pool's ticket
+    cache where possible, see tufin.ticketcache . Concurrent fetches of
+    a ticket share a single request, but not with one started before
+    the ticket was last written to, and such a request's result is not
+    cached either.
+    '''
+    cache = conn.pool.ticketcache
+    ticket = cache.get(tid, fingerprint)
+    if ticket is not None:
+        return 200, ticket
+    endpoint = f'/tickets/{tid}'
+    epoch = cache.epoch(tid)
+    async def fetch():
+        status, _, res = await conn.sccall('GET', endpoint, None)
+        if status == 200:
+            res = res['ticket']
+            cache.put(tid, res, fingerprint, epoch)
+        return status, res
+    key = (flight_key(conn.pool.sc, 'GET', endpoint, None), epoch)
+    return await conn.pool.singleflight.do(key, fetch)
+
 def read_tid(instr, logger=None):
     '''
     Fetches the ticket ID from stdin.
     '''
+    return read_ticket_info(instr, logger=logger)[0]
+
+def read_ticket_info(instr, logger=None):
+    '''
+    Fetches the ticket ID from stdin, along with a fingerprint of the
+    ticket's state made of its current stage, update time and
+    completion. The fingerprint is None if stdin has none of these.
+    '''
     if instr is None:
         instr = read_stdin(default='')
     if logger:
         logger.debug('stdin: %s', instr)
     if not instr:
-        return None
+        return None, None
     try:
         root = fromstring(instr)
     except ParseError:
-        return None
+        return None, None
     id_element = root.find('id')
     if id_element is None:
-        return None
+        return None, None
     try:
         ticket_id = int(id_element.text)
-        return ticket_id
     except ValueError:
-        return None
+        return None, None
+    fingerprint = (
+        root.findtext('current_stage/id')
+        , root.findtext('current_stage/name')
+        , root.findtext('updateDate')
+        , root.find('completion_data') is not None
+        )
+    if fingerprint == (None, None, None, False):
+        fingerprint = None
+    return ticket_id, fingerprint
 
 def read_stdin(default=None):
     '''
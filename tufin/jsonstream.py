@@ -0,0 +1,205 @@
+
+'''
+Incremental decoding of large JSON documents. Tufin list responses keep
+their items in an array a few keys deep, e.g.
+    {"network_objects": {"count": 2, "network_object": [{...}, {...}]}}
+stream_items(...) reads such a document chunk by chunk from a stream,
+walks down to the array and decodes its elements one at a time. Only the
+current element and the unread part of the current chunk are held in
+memory. Values next to the path, such as counts, are decoded and dropped.
+Objects and arrays are scanned for their end as chunks arrive and only
+decoded once complete, so large elements take linear time.
+'''
+
+from codecs import getincrementaldecoder
+from json import JSONDecoder, JSONDecodeError
+from re import compile as re_compile
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = re_compile(r'[ \t\n\r]*')
+STRUCTURE = re_compile(r'[\[\]{}"]')
+STRING_REST = re_compile(r'(?:[^"\\]|\\.)*')
+NUMBER_TAIL = re_compile(r'[0-9.eE+\-]*')
+DECODER = JSONDecoder()
+
+class ContainerScan(): # pylint: disable=too-few-public-methods
+    '''
+    Finds the end of an object or array across chunks of text, keeping
+    the nesting depth and whether it is inside a string in between.
+    '''
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+    def feed(self, text, pos=0):
+        '''
+        Scans text from pos, returning the index just past the end of
+        the container, or None if it continues beyond text.
+        '''
+        if self.escaped and pos < len(text):
+            self.escaped = False
+            pos += 1
+        while pos < len(text):
+            if self.in_string:
+                pos = STRING_REST.match(text, pos).end()
+                if pos == len(text):
+                    return None
+                if text[pos] == '\\':
+                    self.escaped = True
+                    return None
+                self.in_string = False
+                pos += 1
+                continue
+            match = STRUCTURE.search(text, pos)
+            if match is None:
+                return None
+            pos = match.end()
+            token = match.group()
+            if token == '"':
+                self.in_string = True
+            elif token in '{[':
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return pos
+        return None
+
+class StreamBuffer():
+    '''
+    The unread text of a stream with a cursor. The stream is anything
+    with an awaitable read(n) method returning bytes, such as aiohttp's
+    StreamReader.
+    '''
+    def __init__(self, stream, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+    async def read(self):
+        '''
+        The text of the next chunk.
+        '''
+        chunk = await self._stream.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+        return self._decoder.decode(chunk, final=self.eof)
+    async def fill(self):
+        '''
+        Appends the next chunk, dropping the text already consumed.
+        '''
+        self.text = self.text[self.pos:] + await self.read()
+        self.pos = 0
+        return None
+    async def peek(self):
+        '''
+        Skips whitespace and returns the next character, None at the end.
+        '''
+        while True:
+            self.pos = WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if self.eof:
+                return None
+            await self.fill()
+    async def expect(self, chars):
+        '''
+        Consumes the next character, which must be one of chars.
+        '''
+        char = await self.peek()
+        if char is None or char not in chars:
+            raise ValueError('Unexpected JSON input', chars, char, self.text[self.pos:self.pos+64])
+        self.pos += 1
+        return char
+    async def value(self):
+        '''
+        Decodes the next complete JSON value, reading further chunks
+        until it is complete, see container(...) for objects and arrays.
+        A scalar followed by nothing but number characters up to the
+        end of the buffer might be a truncated number, so it is re-read
+        then.
+        '''
+        if await self.peek() in ('{', '['):
+            return await self.container()
+        while True:
+            try:
+                obj, end = DECODER.raw_decode(self.text, self.pos)
+            except JSONDecodeError:
+                if self.eof:
+                    raise
+                await self.fill()
+                continue
+            if not self.eof and NUMBER_TAIL.match(self.text, end).end() == len(self.text):
+                await self.fill()
+                continue
+            self.pos = end
+            return obj
+    async def container(self):
+        '''
+        Decodes the object or array at the cursor. The chunks it spans
+        are collected and joined once its end has been found, so
+        neither scanning nor decoding revisits text.
+        '''
+        scan = ContainerScan()
+        parts = []
+        text = self.text
+        start = self.pos
+        end = scan.feed(text, start)
+        while end is None:
+            if self.eof:
+                raise ValueError('Truncated JSON input', text[start:start+64])
+            parts.append(text[start:])
+            text = await self.read()
+            start = 0
+            end = scan.feed(text)
+        parts.append(text[start:end])
+        self.text = text
+        self.pos = end
+        return DECODER.decode(''.join(parts))
+
+async def stream_items(stream, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Yields the elements of the array found by following the keys in
+    path from the top-level object. A single object in place of the
+    array is yielded as the only item, see singleton_or_list(...) in
+    tufin.common . Nothing is yielded if the path does not exist.
+    '''
+    buf = StreamBuffer(stream, chunk_size=chunk_size)
+    for key in path:
+        if not await find_key(buf, key):
+            return
+    char = await buf.peek()
+    if char == '[':
+        buf.pos += 1
+        if await buf.peek() == ']':
+            return
+        while True:
+            yield await buf.value()
+            if await buf.expect(',]') == ']':
+                return
+    item = await buf.value()
+    if item is not None:
+        yield item
+
+async def find_key(buf, key):
+    '''
+    Positions the buffer at the value of key in the object starting
+    at the cursor. Returns False if the value is no object or lacks
+    the key.
+    '''
+    if await buf.peek() != '{':
+        return False
+    buf.pos += 1
+    if await buf.peek() == '}':
+        return False
+    while True:
+        name = await buf.value()
+        await buf.expect(':')
+        if name == key:
+            return True
+        await buf.value()
+        if await buf.expect(',}') == '}':
+            return False
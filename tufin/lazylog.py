@@ -0,0 +1,49 @@
+
+'''
+Logging helpers that defer work until a record is actually emitted.
+Passing LazyJSON(obj) as a logging argument instead of dumps(obj) means
+the object is only serialised if some handler formats the record, and
+large bodies are cut down to a bounded length.
+'''
+
+from tufin.codec import dumps
+
+DEFAULT_LIMIT = 2048
+
+class LazyJSON(): # pylint: disable=too-few-public-methods
+    '''
+    Serialises obj as JSON when formatted, truncating the output to
+    limit characters. A limit of None disables truncation.
+    '''
+    __slots__ = ('obj', 'limit', 'default', 'pretty')
+    def __init__(self, obj, limit=DEFAULT_LIMIT, default=str, pretty=False):
+        self.obj = obj
+        self.limit = limit
+        self.default = default
+        self.pretty = pretty
+    def __str__(self):
+        text = dumps(self.obj, default=self.default, pretty=self.pretty)
+        return truncate(text, self.limit)
+    __repr__ = __str__
+
+def truncate(text, limit=DEFAULT_LIMIT):
+    '''
+    Cuts text down to limit characters, noting how much was left out.
+    '''
+    if limit is None or len(text) <= limit:
+        return text
+    return f'{text[:limit]}... ({len(text) - limit} more characters)'
+
+def call_fields(method, endpoint, status, duration, size):
+    '''
+    Structured fields describing a single API call, for use as the
+    extra argument of logging calls. Handlers and formatters can pick
+    them up as record attributes, e.g. %(endpoint)s .
+    '''
+    return {
+        'method': method
+        , 'endpoint': endpoint
+        , 'status': status
+        , 'duration': duration
+        , 'bytes': size
+        }
@@ -0,0 +1,185 @@
+
+'''
+In-memory structures for address lookups:
+    - PrefixTree, a binary radix tree over IPv4 and IPv6 prefixes,
+        answering exact and containment queries
+    - SegmentIndex, an index over arbitrary address intervals that
+        answers point queries by binary search
+and helpers to turn Tufin network objects into networks and intervals.
+'''
+
+from bisect import bisect_right
+from ipaddress import ip_address, ip_network
+
+def parse_network(ip, mask):
+    '''
+    A network from an address and a mask, which may be a prefix length
+    or a netmask. IPv6 netmasks are turned into prefix lengths, as the
+    ipaddress module does not accept them.
+    '''
+    mask = str(mask)
+    if ':' in mask:
+        mask = str(bin(int(ip_address(mask))).count('1'))
+    return ip_network(f'{ip}/{mask}', strict=False)
+
+def object_network(obj):
+    '''
+    The network covered by a host or network object, None for other
+    kinds of objects. Hosts without a netmask cover a single address.
+    '''
+    ip = obj.get('ip')
+    if ip is None:
+        return None
+    mask = obj.get('netmask', obj.get('prefix'))
+    if mask is None:
+        return ip_network(ip)
+    return parse_network(ip, mask)
+
+def object_range(obj):
+    '''
+    The first and last address of a range object, None for other
+    kinds of objects.
+    '''
+    first = obj.get('first_ip')
+    last = obj.get('last_ip')
+    if first is None or last is None:
+        return None
+    return ip_address(first), ip_address(last)
+
+def as_network(obj):
+    '''
+    Addresses become single-address networks, networks stay as they are.
+    '''
+    if hasattr(obj, 'prefixlen'):
+        return obj
+    return ip_network(obj)
+
+class PrefixTree():
+    '''
+    A binary radix tree mapping prefixes to lists of values, one tree
+    per IP version. Each node is a list [zero_child, one_child, values].
+    '''
+    def __init__(self):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._size = 0
+    def __len__(self):
+        return self._size
+    def insert(self, network, value):
+        '''
+        Adds value under the prefix network.
+        '''
+        network = as_network(network)
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            bit = (bits >> (width - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            node[2] = []
+        node[2].append(value)
+        self._size += 1
+    def remove(self, network, value):
+        '''
+        Removes value from under the prefix network, pruning nodes
+        left empty. Returns whether value was found.
+        '''
+        network = as_network(network)
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        path = []
+        for depth in range(network.prefixlen):
+            bit = (bits >> (width - 1 - depth)) & 1
+            path.append((node, bit))
+            node = node[bit]
+            if node is None:
+                return False
+        if not node[2] or value not in node[2]:
+            return False
+        node[2].remove(value)
+        self._size -= 1
+        if not node[2]:
+            node[2] = None
+        while path and node[0] is None and node[1] is None and node[2] is None:
+            parent, bit = path.pop()
+            parent[bit] = None
+            node = parent
+        return True
+    def exact(self, network):
+        '''
+        The values stored under exactly this prefix.
+        '''
+        network = as_network(network)
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            node = node[(bits >> (width - 1 - depth)) & 1]
+            if node is None:
+                return []
+        return list(node[2] or [])
+    def containing(self, network):
+        '''
+        The (prefix length, values) pairs of all prefixes containing the
+        given network or address, from the most to the least specific.
+        '''
+        network = as_network(network)
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        found = []
+        if node[2]:
+            found.append((0, node[2]))
+        for depth in range(network.prefixlen):
+            node = node[(bits >> (width - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[2]:
+                found.append((depth + 1, node[2]))
+        found.reverse()
+        return found
+
+class SegmentIndex():
+    '''
+    An index over closed integer intervals, each with a value. The
+    intervals are cut into elementary segments at their boundaries,
+    and every segment lists the values of the intervals covering it,
+    so a point query is one binary search. Build once, query often.
+    '''
+    def __init__(self, intervals):
+        '''
+        The intervals argument is an iterable of (first, last, value).
+        '''
+        events = {}
+        for first, last, value in intervals:
+            events.setdefault(first, ([], []))[0].append(value)
+            events.setdefault(last + 1, ([], []))[1].append(value)
+        self._starts = []
+        self._values = []
+        active = {}
+        for point in sorted(events):
+            opened, closed = events[point]
+            for value in closed:
+                count = active[id(value)][1] - 1
+                if count:
+                    active[id(value)] = (value, count)
+                else:
+                    del active[id(value)]
+            for value in opened:
+                previous = active.get(id(value), (value, 0))[1]
+                active[id(value)] = (value, previous + 1)
+            self._starts.append(point)
+            self._values.append(tuple(value for value, _ in active.values()))
+    def __len__(self):
+        return len(self._starts)
+    def at(self, point):
+        '''
+        The values of all intervals containing point.
+        '''
+        index = bisect_right(self._starts, point) - 1
+        if index < 0:
+            return ()
+        return self._values[index]
@@ -0,0 +1,201 @@
+
+'''
+Per-device indexes of SecureTrack network objects. An index is built
+from one bulk download of a device's objects and answers by name, by
+exact host or subnet, and by containment through a prefix tree and an
+interval index for ranges. The indexes live in the TufinPool and are
+rebuilt once older than their maximum age or once the device's
+generation has moved on, see tufin.revisions .
+'''
+
+from time import monotonic
+
+from tufin.netindex import (
+    PrefixTree,
+    SegmentIndex,
+    as_network,
+    object_network,
+    object_range
+    )
+from tufin.singleflight import SingleFlight
+from tufin.securetrack import iter_network_objects
+
+DEFAULT_MAX_AGE = 900
+DEFAULT_PAGE_SIZE = 2000
+
+class ObjectIndex(): # pylint: disable=too-many-instance-attributes
+    '''
+    The network objects of a single device.
+    '''
+    def __init__(self, device_id, objs, generation=0):
+        self.device_id = device_id
+        self.generation = generation
+        self.built_at = monotonic()
+        self.by_name = {}
+        self.by_uid = {}
+        self.exact = {}
+        self.tree = PrefixTree()
+        intervals = {4: [], 6: []}
+        for obj in objs:
+            self.by_name.setdefault(obj['name'], obj)
+            if obj.get('uid') is not None:
+                self.by_uid[obj['uid']] = obj
+            network = object_network(obj)
+            if network is not None:
+                self.exact.setdefault(network, []).append(obj)
+                self.tree.insert(network, obj)
+                continue
+            bounds = object_range(obj)
+            if bounds is not None and bounds[0].version == bounds[1].version:
+                intervals[bounds[0].version].append((int(bounds[0]), int(bounds[1]), obj))
+        self.ranges = {
+            version: SegmentIndex(entries)
+            for version, entries in intervals.items()
+            }
+    def __len__(self):
+        return len(self.by_uid) or len(self.by_name)
+    def name_for(self, obj):
+        '''
+        The name grab_name(...) would find for obj, or None if the index
+        cannot answer. Strings are looked up by name, addresses and
+        networks by exact match, preferring hosts for addresses.
+        '''
+        if isinstance(obj, str):
+            found = self.by_name.get(obj)
+            return None if found is None else found['name']
+        matches = self.exact.get(as_network(obj))
+        if not matches:
+            return None
+        for match in matches:
+            if match.get('type') == 'host' or 'host' in match.get('@xsi.type', '').lower():
+                return match['name']
+        return matches[0]['name']
+    def containing(self, obj):
+        '''
+        All objects containing an address or network: prefix objects
+        from the most to the least specific, then ranges.
+        '''
+        network = as_network(obj)
+        found = [
+            candidate
+            for _, candidates in self.tree.containing(network)
+            for candidate in candidates
+            ]
+        first = int(network.network_address)
+        last = int(network.broadcast_address)
+        ranges = self.ranges[network.version]
+        covering_last = {id(candidate) for candidate in ranges.at(last)}
+        found.extend(
+            candidate
+            for candidate in ranges.at(first)
+            if id(candidate) in covering_last
+            )
+        return found
+
+class ObjectIndexes():
+    '''
+    The object indexes of all devices, built on demand. A max_age of
+    zero or None disables the indexes. The generations function maps
+    a device id to its current generation; indexes built in an older
+    generation are not used.
+    '''
+    def __init__(self, max_age=DEFAULT_MAX_AGE, page_size=DEFAULT_PAGE_SIZE, generations=None):
+        self.max_age = max_age
+        self._page_size = page_size
+        self._generations = (lambda device_id: 0) if generations is None else generations
+        self._indexes = {}
+        self._builds = SingleFlight()
+        self._hits = 0
+        self._misses = 0
+    @property
+    def enabled(self):
+        '''
+        Whether indexes are built at all.
+        '''
+        return bool(self.max_age)
+    def peek(self, device_id):
+        '''
+        The current index of a device, None if there is none yet or it
+        is outdated. Never triggers a build.
+        '''
+        index = self._indexes.get(str(device_id))
+        if index is None or monotonic() - index.built_at > self.max_age:
+            return None
+        if index.generation != self._generations(device_id):
+            return None
+        return index
+    async def get(self, conn, device_id):
+        '''
+        The index of a device, building it if necessary. Concurrent
+        callers share a single build. None if indexes are disabled.
+        '''
+        if not self.enabled:
+            return None
+        index = self.peek(device_id)
+        if index is not None:
+            return index
+        return await self._builds.do(str(device_id), lambda: self.build(conn, device_id))
+    async def get_or_build(self, conn, device_id):
+        '''
+        Like get(...), but where indexes are disabled, builds a
+        temporary index that is not kept.
+        '''
+        index = await self.get(conn, device_id)
+        if index is None:
+            index = await self.build(conn, device_id)
+        return index
+    async def build(self, conn, device_id):
+        '''
+        Downloads all objects of a device and indexes them. The index
+        is kept unless the device changed during the download.
+        '''
+        generation = self._generations(device_id)
+        objs = [
+            obj
+            async for obj in iter_network_objects(conn, device_id, page_size=self._page_size)
+            ]
+        return self.install(device_id, objs, generation)
+    def install(self, device_id, objs, generation):
+        '''
+        Indexes the given objects of a device, e.g. from an inventory
+        snapshot, as of generation. The index is only kept if the
+        device is still at that generation.
+        '''
+        return self.keep(device_id, ObjectIndex(device_id, objs, generation=generation))
+    def keep(self, device_id, index):
+        '''
+        Keeps a freshly built index if indexes are enabled and the
+        device is still at the index's generation. Returns the index.
+        '''
+        if self.enabled and index.generation == self._generations(device_id):
+            self._indexes[str(device_id)] = index
+        return index
+    def invalidate(self, device_id=None):
+        '''
+        Drops the index of a device, or of all devices.
+        '''
+        if device_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(str(device_id), None)
+    def count(self, hit):
+        '''
+        Records whether a lookup was answered by an index.
+        '''
+        return self.count_many(1 if hit else 0, 0 if hit else 1)
+    def count_many(self, hits, misses):
+        '''
+        Records the outcome of several lookups.
+        '''
+        self._hits += hits
+        self._misses += misses
+    def stats(self):
+        '''
+        Counters for monitoring.
+        '''
+        return {
+            'devices': len(self._indexes)
+            , 'objects': sum(len(index) for index in self._indexes.values())
+            , 'hits': self._hits
+            , 'misses': self._misses
+            }
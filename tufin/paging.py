@@ -0,0 +1,110 @@
+
+'''
+Streaming iteration over paginated Tufin collections. Both SecureTrack
+and SecureChange page their list endpoints with start/count parameters
+and wrap the items in a container that also states the total, e.g.
+    {'devices': {'count': 2, 'total': 5, 'device': [...]}}
+The iterator here walks such a collection page by page, fetching up to
+readahead pages ahead of the consumer, so memory stays bounded by the
+page size regardless of the size of the collection.
+'''
+
+from asyncio import ensure_future
+from collections import deque
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_READAHEAD = 2
+
+async def paginate(fetch, path, page_size=DEFAULT_PAGE_SIZE, readahead=DEFAULT_READAHEAD, start=0): # pylint: disable=too-many-arguments,too-many-locals
+    '''
+    Yields the items of a paginated collection.
+
+    The fetch argument is called as fetch(start, count) and returns an
+    awaitable of (status, headers, json) as TufinConn's methods do. The
+    path argument names the keys leading to the item list, e.g.
+    ('devices', 'device'). The first page is fetched alone; once the
+    total is known, further pages are fetched in the background while
+    the current one is consumed. Each page starts where the previous
+    one ended, so servers capping the count below page_size are paged
+    through in steps of what they return. Paging stops at the total
+    if one is stated, otherwise after a page shorter than page_size,
+    and at an empty page or a page repeating the previous one, which
+    is what a server ignoring start and count returns.
+    '''
+    pending = deque()
+    next_start = start
+    stride = page_size
+    total = None
+    previous = None
+    def schedule(limit):
+        nonlocal next_start
+        while len(pending) < limit and (total is None or next_start < total):
+            pending.append((next_start, ensure_future(fetch(next_start, page_size))))
+            next_start += stride
+    def cancel():
+        for _, task in pending:
+            task.cancel()
+        pending.clear()
+    try:
+        schedule(1)
+        while pending:
+            page_start, task = pending.popleft()
+            status, _, res = await task
+            if status != 200:
+                raise ValueError('Bad status paging through collection', path, status, res)
+            container = dig(res, path[:-1])
+            items = page_items(container, path[-1])
+            total = page_total(container, total)
+            if not items or items == previous:
+                break
+            covered = page_start + len(items)
+            if total is None and len(items) < page_size:
+                cancel()
+            elif total is not None and covered >= total:
+                cancel()
+            else:
+                if pending and pending[0][0] != covered:
+                    cancel()
+                if not pending:
+                    next_start = covered
+                stride = min(page_size, len(items))
+                schedule(max(1, readahead))
+            for item in items:
+                yield item
+            previous = items
+    finally:
+        cancel()
+    return
+
+def dig(res, keys):
+    '''
+    Follows keys into a nested JSON document, treating missing keys
+    as empty containers.
+    '''
+    for key in keys:
+        res = (res or {}).get(key)
+    return res or {}
+
+def page_items(container, key):
+    '''
+    The items on a page. Single items may come as plain objects,
+    see singleton_or_list(...) in tufin.common .
+    '''
+    items = container.get(key)
+    if items is None:
+        return []
+    if not isinstance(items, list):
+        return [items]
+    return items
+
+def page_total(container, previous):
+    '''
+    The total stated in a page's container, if any.
+    '''
+    total = container.get('total')
+    if total is None:
+        return previous
+    try:
+        return int(total)
+    except (TypeError, ValueError):
+        return previous
@@ -0,0 +1,100 @@
+
+'''
+A cache of SecureTrack topology path queries, keyed by source network,
+destination network and service. Every result remembers the devices on
+its path, and is dropped when one of them gets a new revision, see
+tufin.revisions . Entries also expire after a TTL, as routing changes
+elsewhere may reroute a flow through devices not on its cached path.
+'''
+
+from collections import OrderedDict
+from time import monotonic
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_TTL = 300
+
+class PathCache():
+    '''
+    A TTL and LRU bounded map from (src, dst, service) to path results.
+    A max_entries or ttl of zero disables the cache.
+    '''
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._epoch = 0
+        self._counters = {
+            'hits': 0
+            , 'misses': 0
+            , 'stores': 0
+            , 'evictions': 0
+            , 'invalidations': 0
+            }
+    @property
+    def enabled(self):
+        '''
+        Whether anything is cached at all.
+        '''
+        return bool(self._max_entries and self._ttl)
+    @property
+    def epoch(self):
+        '''
+        Changes on every invalidation. Results fetched before an
+        invalidation are not stored afterwards, see put(...) .
+        '''
+        return self._epoch
+    def get(self, key):
+        '''
+        The cached result for key, or None.
+        '''
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self._counters['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._counters['hits'] += 1
+        return entry[0]
+    def put(self, key, result, device_ids, epoch=None):
+        '''
+        Stores a result along with the ids of the devices on its path,
+        unless an invalidation has happened since epoch.
+        '''
+        if not self.enabled or (epoch is not None and epoch != self._epoch):
+            return None
+        self._entries[key] = (
+            result
+            , frozenset(str(device_id) for device_id in device_ids)
+            , monotonic() + self._ttl
+            )
+        self._entries.move_to_end(key)
+        self._counters['stores'] += 1
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+        return None
+    def invalidate(self, device_id=None):
+        '''
+        Drops the results whose path crosses a device, or everything.
+        '''
+        self._epoch += 1
+        device_id = None if device_id is None else str(device_id)
+        stale = [
+            key
+            for key, (_, device_ids, _) in self._entries.items()
+            if device_id is None or device_id in device_ids
+            ]
+        for key in stale:
+            del self._entries[key]
+        self._counters['invalidations'] += len(stale)
+        return len(stale)
+    def stats(self):
+        '''
+        Counters for monitoring and sizing.
+        '''
+        return {
+            **self._counters
+            , 'entries': len(self._entries)
+            , 'max_entries': self._max_entries
+            }
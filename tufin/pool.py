@@ -0,0 +1,315 @@
+
+'''
+This module provides the TufinPool class, which owns the long-lived HTTP
+sessions to SecureChange and SecureTrack. In server mode a single pool is
+shared by every module invocation, so TCP and TLS handshakes are paid once
+per keep-alive connection instead of once per call. One-shot invocations
+get a private pool from TufinConn, which closes it again on exit.
+Each upstream also carries the Throttle and RetryPolicy shared by all
+connections drawing from the pool, and identical concurrent GETs are
+coalesced by the pool's SingleFlight. Read-only SecureTrack lookups are
+cached in the pool's ResponseCache. In server mode the pool also keeps
+the DeviceCatalog, which is maintained in the background, and the
+per-device ObjectIndexes and RuleIndexes. Zone lookups are kept in the
+ZoneCache, path queries in the PathCache and SecureChange tickets in
+the TicketCache. The RevisionWatcher invalidates cached SecureTrack
+data of a device whenever it gets a new revision. With an
+InventorySnapshot, the SecureTrack data is persisted and restored on
+startup.
+'''
+
+from asyncio import gather
+
+from aiohttp import ClientSession, BasicAuth, TCPConnector
+
+from tufin.cache import ResponseCache, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES
+from tufin.catalog import DeviceCatalog, DEFAULT_REFRESH_INTERVAL
+from tufin.objindex import ObjectIndexes
+from tufin.pathcache import PathCache, DEFAULT_TTL as DEFAULT_PATH_TTL
+from tufin.revisions import RevisionWatcher
+from tufin.ruleindex import RuleIndexes
+from tufin.snapshot import InventorySnapshot, DEFAULT_SYNC_INTERVAL
+from tufin.ticketcache import TicketCache, DEFAULT_TTL as DEFAULT_TICKET_TTL
+from tufin.zonecache import (
+    ZoneCache,
+    DEFAULT_MAX_ENTRIES as DEFAULT_ZONE_ENTRIES,
+    DEFAULT_TTL as DEFAULT_ZONE_TTL
+    )
+from tufin.singleflight import SingleFlight
+from tufin.throttle import (
+    Throttle,
+    RetryPolicy,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RATE,
+    DEFAULT_MAX_RETRIES
+    )
+
+TUFIN_HEADERS = {
+    'accept': 'application/json'
+    , 'content-type': 'application/json'
+    }
+
+# Connector defaults, matching aiohttp's own where not stated otherwise
+DEFAULT_LIMIT = 100
+DEFAULT_LIMIT_PER_HOST = 0
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+
+REQUIRED_SECRETS = (
+    'SECURECHANGEURL'
+    , 'SECURECHANGEUSER'
+    , 'SECURECHANGEPASSWORD'
+    , 'SECURETRACKURL'
+    , 'SECURETRACKUSER'
+    , 'SECURETRACKPASSWORD'
+    )
+
+def missing_secrets(secrets):
+    '''
+    Lists the secrets needed to talk to SecureChange and SecureTrack
+    that are absent from the secrets dict.
+    '''
+    if secrets is None:
+        return list(REQUIRED_SECRETS)
+    return [key for key in REQUIRED_SECRETS if secrets.get(key) is None]
+
+def normalize_baseurl(url):
+    '''
+    Makes sure endpoints can simply be appended to the base URL.
+    '''
+    return url if url[-1] == '/' else url+'/'
+
+class Upstream():
+    '''
+    A single Tufin server as seen from the pool: one session, the
+    base URL that endpoints are relative to, and the flow control
+    applied to its requests.
+    '''
+    def __init__(self, name, baseurl, session, throttle=None, retry=None): # pylint: disable=too-many-arguments
+        self.name = name
+        self.baseurl = normalize_baseurl(baseurl)
+        self.session = session
+        self.throttle = Throttle() if throttle is None else throttle
+        self.retry = RetryPolicy() if retry is None else retry
+    def url(self, endpoint):
+        '''
+        The full URL of an endpoint on this upstream.
+        '''
+        return self.baseurl + endpoint
+    async def close(self):
+        '''
+        Closes the underlying session and its connections.
+        '''
+        await self.session.close()
+        return None
+
+class TufinPool(): # pylint: disable=too-many-instance-attributes
+    '''
+    Keep-alive connection pools to SecureChange and SecureTrack.
+    The connector and flow control arguments apply to each upstream
+    separately: concurrency bounds the requests in flight, rate the
+    requests per second (None for no limit). The cache arguments bound
+    the SecureTrack response cache, zero entries disables it. The
+    catalog is refreshed every catalog_refresh seconds once background
+    maintenance is started, zero disables the catalog. Object indexes
+    are rebuilt after object_index_age seconds and rule indexes after
+    rule_index_age seconds, zero disables them.
+    Device revisions are polled every revision_poll seconds once
+    background maintenance is started, zero disables polling. Zone
+    lookups are cached for zone_ttl seconds, path queries for path_ttl
+    seconds and tickets for ticket_ttl seconds, zero disables the
+    respective cache.
+    Given a snapshot_database, the inventory is persisted there and
+    synced every snapshot_sync seconds.
+    '''
+    def __init__( # pylint: disable=too-many-arguments,too-many-locals
+            self
+            , secrets
+            , limit=DEFAULT_LIMIT
+            , limit_per_host=DEFAULT_LIMIT_PER_HOST
+            , dns_cache_ttl=DEFAULT_DNS_CACHE_TTL
+            , keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT
+            , concurrency=DEFAULT_CONCURRENCY
+            , rate=DEFAULT_RATE
+            , max_retries=DEFAULT_MAX_RETRIES
+            , cache_entries=DEFAULT_MAX_ENTRIES
+            , cache_bytes=DEFAULT_MAX_BYTES
+            , catalog_refresh=DEFAULT_REFRESH_INTERVAL
+            , object_index_age=0
+            , rule_index_age=0
+            , revision_poll=0
+            , zone_entries=DEFAULT_ZONE_ENTRIES
+            , zone_ttl=DEFAULT_ZONE_TTL
+            , path_ttl=DEFAULT_PATH_TTL
+            , ticket_ttl=DEFAULT_TICKET_TTL
+            , snapshot_database=None
+            , snapshot_sync=DEFAULT_SYNC_INTERVAL
+            ):
+        missing = missing_secrets(secrets)
+        if missing:
+            raise ValueError('Missing secrets for Tufin connection', missing)
+        self.sc = Upstream(
+            'sc'
+            , secrets['SECURECHANGEURL']
+            , ClientSession(
+                auth=BasicAuth(
+                    secrets['SECURECHANGEUSER']
+                    , password=secrets['SECURECHANGEPASSWORD']
+                    )
+                , headers=TUFIN_HEADERS
+                , connector=make_connector(limit, limit_per_host, dns_cache_ttl, keepalive_timeout)
+                )
+            , throttle=Throttle(concurrency=concurrency, rate=rate)
+            , retry=RetryPolicy(max_retries=max_retries)
+            )
+        self.st = Upstream(
+            'st'
+            , secrets['SECURETRACKURL']
+            , ClientSession(
+                auth=BasicAuth(secrets['SECURETRACKUSER'], password=secrets['SECURETRACKPASSWORD'])
+                , headers=TUFIN_HEADERS
+                , connector=make_connector(limit, limit_per_host, dns_cache_ttl, keepalive_timeout)
+                )
+            , throttle=Throttle(concurrency=concurrency, rate=rate)
+            , retry=RetryPolicy(max_retries=max_retries)
+            )
+        self.singleflight = SingleFlight()
+        self.stcache = ResponseCache(max_entries=cache_entries, max_bytes=cache_bytes)
+        self.catalog = DeviceCatalog(refresh_interval=catalog_refresh)
+        self._catalog_refresh = catalog_refresh
+        self._revision_poll = revision_poll
+        self.revisions = RevisionWatcher(poll_interval=revision_poll)
+        self.objindex = ObjectIndexes(
+            max_age=object_index_age
+            , generations=self.revisions.generation
+            )
+        self.ruleindex = RuleIndexes(max_age=rule_index_age, generations=self.revisions.generation)
+        self.zonecache = ZoneCache(max_entries=zone_entries, ttl=zone_ttl)
+        self.pathcache = PathCache(ttl=path_ttl)
+        self.ticketcache = TicketCache(ttl=ticket_ttl)
+        self.snapshot = (
+            None
+            if snapshot_database is None
+            else InventorySnapshot(snapshot_database, sync_interval=snapshot_sync)
+            )
+        self.revisions.subscribe(self._revision_changed)
+    @classmethod
+    def from_args(cls, secrets, args):
+        '''
+        Creates a pool configured by the command line arguments.
+        '''
+        return cls(
+            secrets
+            , limit=args.pool_limit
+            , limit_per_host=args.pool_limit_per_host
+            , dns_cache_ttl=args.dns_cache_ttl
+            , keepalive_timeout=args.keepalive_timeout
+            , concurrency=args.max_concurrency
+            , rate=args.rate_limit
+            , max_retries=args.max_retries
+            , cache_entries=args.cache_entries
+            , cache_bytes=args.cache_bytes
+            , catalog_refresh=args.catalog_refresh
+            , object_index_age=args.object_index_age
+            , rule_index_age=args.rule_index_age
+            , revision_poll=args.revision_poll
+            , zone_ttl=args.zone_cache_ttl
+            , path_ttl=args.path_cache_ttl
+            , ticket_ttl=args.ticket_cache_ttl
+            , snapshot_database=args.database if args.inventory_snapshot else None
+            , snapshot_sync=args.snapshot_sync
+            )
+    async def __aenter__(self):
+        '''
+        Infrastructure function.
+        '''
+        return self
+    async def __aexit__(self, exc_type, exc, tb): # pylint: disable=invalid-name
+        '''
+        Infrastructure function. Closes the underlying connections.
+        '''
+        await self.close()
+        return None
+    async def start_background(self, conn, logger=None):
+        '''
+        Pre-warms the pool's catalogs and starts their background
+        maintenance, using conn for all requests. The connection must
+        draw from this pool. With a non-empty inventory snapshot, the
+        catalogs are warmed from disk and the API is only asked in
+        the background. Otherwise the first snapshot sync waits for
+        one interval, as the catalogs were just loaded.
+        '''
+        warm = False
+        if self.snapshot is not None:
+            count = self.snapshot.load(self)
+            warm = count > 0
+            if logger is not None:
+                logger.info('Inventory snapshot loaded with %s devices', count)
+        if self._catalog_refresh:
+            await self.catalog.start(conn, logger=logger, initial=not warm)
+        if self._revision_poll:
+            await self.revisions.start(conn, logger=logger, initial=not warm)
+        if self.snapshot is not None:
+            loaded = not warm and (self._catalog_refresh or self._revision_poll)
+            await self.snapshot.start(conn, logger=logger, initial=not loaded)
+        return None
+    async def stop_background(self):
+        '''
+        Stops all background maintenance.
+        '''
+        if self.snapshot is not None:
+            await self.snapshot.stop()
+        await self.revisions.stop()
+        await self.catalog.stop()
+        return None
+    def _revision_changed(self, device_id):
+        '''
+        Drops everything cached about a device that got a new revision.
+        '''
+        self.stcache.invalidate(device_id=device_id)
+        self.objindex.invalidate(device_id)
+        self.ruleindex.invalidate(device_id)
+        self.zonecache.invalidate(device_id)
+        self.pathcache.invalidate(device_id)
+    async def close(self):
+        '''
+        Stops background maintenance and closes both sessions and all
+        pooled connections.
+        '''
+        await self.stop_background()
+        await gather(
+            self.sc.close()
+            , self.st.close()
+            )
+        return None
+    def stats(self):
+        '''
+        Counters for monitoring, per upstream.
+        '''
+        return {
+            'sc': {'throttle': self.sc.throttle.stats()}
+            , 'st': {'throttle': self.st.throttle.stats()}
+            , 'singleflight': self.singleflight.stats()
+            , 'stcache': self.stcache.stats()
+            , 'catalog': self.catalog.stats()
+            , 'objindex': self.objindex.stats()
+            , 'ruleindex': self.ruleindex.stats()
+            , 'revisions': self.revisions.stats()
+            , 'zonecache': self.zonecache.stats()
+            , 'pathcache': self.pathcache.stats()
+            , 'ticketcache': self.ticketcache.stats()
+            , 'snapshot': None if self.snapshot is None else self.snapshot.stats()
+            }
+
+def make_connector(limit, limit_per_host, dns_cache_ttl, keepalive_timeout):
+    '''
+    Creates a keep-alive TCP connector with DNS caching. A DNS cache
+    TTL of None caches forever, following aiohttp.
+    '''
+    return TCPConnector(
+        limit=limit
+        , limit_per_host=limit_per_host
+        , use_dns_cache=True
+        , ttl_dns_cache=dns_cache_ttl
+        , keepalive_timeout=keepalive_timeout
+        )
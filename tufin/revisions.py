@@ -0,0 +1,158 @@
+
+'''
+Revision tracking for SecureTrack devices. The RevisionWatcher polls the
+latest revision of every device and keeps a generation counter per
+device, bumped whenever the device gets a new revision. Caches of
+device-derived data subscribe to the watcher and drop exactly the
+entries of the devices that changed, and builders compare generations
+to avoid storing results fetched before a change.
+'''
+
+from tufin.background import Periodic
+from tufin.batch import DEFAULT_BATCH_LIMIT
+from tufin.securetrack import iter_devices
+
+DEFAULT_POLL_INTERVAL = 60
+
+class RevisionWatcher(): # pylint: disable=too-many-instance-attributes
+    '''
+    Per-device revisions and generations. Generations start at zero and
+    only ever grow; unknown devices are at generation zero.
+    '''
+    def __init__(self, poll_interval=DEFAULT_POLL_INTERVAL, limit=DEFAULT_BATCH_LIMIT):
+        self._poll_interval = poll_interval
+        self._limit = limit
+        self._revisions = {}
+        self._generations = {}
+        self._listeners = []
+        self._poller = None
+        self._polls = 0
+        self._changes = 0
+        self._errors = 0
+    def generation(self, device_id):
+        '''
+        The current generation of a device.
+        '''
+        return self._generations.get(str(device_id), 0)
+    def revision(self, device_id):
+        '''
+        The last seen revision id of a device, None if never polled.
+        '''
+        return self._revisions.get(str(device_id))
+    def seed(self, device_id, revision):
+        '''
+        Records a revision known from elsewhere, e.g. an inventory
+        snapshot, for a device not polled yet. If the device has a
+        different revision by its first poll, it is bumped.
+        '''
+        self._revisions.setdefault(str(device_id), revision)
+    def subscribe(self, listener):
+        '''
+        Registers a function to be called with the device id (a string)
+        of every device whose revision changed.
+        '''
+        self._listeners.append(listener)
+    def bump(self, device_id):
+        '''
+        Moves a device to a new generation and notifies the listeners.
+        Also meant to be called after Threefin itself changed a device.
+        '''
+        device_id = str(device_id)
+        self._generations[device_id] = self._generations.get(device_id, 0) + 1
+        self._changes += 1
+        for listener in self._listeners:
+            listener(device_id)
+        return self._generations[device_id]
+    async def poll(self, conn, device_ids=None):
+        '''
+        Fetches the latest revision of the given devices, of all devices
+        in the pool's catalog or of all devices SecureTrack knows, and
+        bumps those that changed since the last poll. The first revision
+        seen for a device is only recorded. Returns the ids of the
+        devices that changed.
+        '''
+        if device_ids is None:
+            device_ids = await self._device_ids(conn)
+        device_ids = [str(device_id) for device_id in device_ids]
+        result = await conn.batch(
+            [
+                ('stget', f'devices/{device_id}/latest_revision')
+                for device_id in device_ids
+                ]
+            , limit=self._limit
+            )
+        changed = []
+        for device_id, outcome in zip(device_ids, result.results):
+            revision = revision_id(outcome)
+            if revision is None:
+                self._errors += 1
+                continue
+            previous = self._revisions.get(device_id)
+            self._revisions[device_id] = revision
+            if previous is not None and str(previous) != str(revision):
+                self.bump(device_id)
+                changed.append(device_id)
+        self._polls += 1
+        return changed
+    async def _device_ids(self, conn):
+        '''
+        The ids of all devices, from the catalog where it is loaded.
+        '''
+        catalog = conn.pool.catalog
+        if catalog.loaded:
+            return [device['id'] for device in catalog.devices()]
+        return [device['id'] async for device in iter_devices(conn)]
+    async def start(self, conn, logger=None, initial=True):
+        '''
+        Records the current revisions and keeps polling in the
+        background using conn, which must stay open until stop(...)
+        is called. A failed first poll is logged and retried on the
+        next interval. Without initial, the first poll is left to the
+        background.
+        '''
+        if initial:
+            try:
+                await self.poll(conn)
+                if logger is not None:
+                    logger.info('Revision watcher tracking %s devices', len(self._revisions))
+            except Exception: # pylint: disable=broad-except
+                if logger is not None:
+                    logger.exception('Could not fetch the initial device revisions')
+        self._poller = Periodic(
+            lambda: self.poll(conn)
+            , self._poll_interval
+            , logger=logger
+            , name='device revision poll'
+            )
+        self._poller.start()
+        return None
+    async def stop(self):
+        '''
+        Stops polling.
+        '''
+        if self._poller is not None:
+            await self._poller.stop()
+        return None
+    def stats(self):
+        '''
+        Counters for monitoring.
+        '''
+        return {
+            'devices': len(self._revisions)
+            , 'polls': self._polls
+            , 'changes': self._changes
+            , 'errors': self._errors
+            }
+
+def revision_id(outcome):
+    '''
+    The revision id from a (status, headers, json) latest_revision
+    response, None for failed requests and unexpected bodies.
+    '''
+    if isinstance(outcome, Exception):
+        return None
+    status, _, res = outcome
+    if status != 200 or not isinstance(res, dict):
+        return None
+    revision = res.get('revision') or {}
+    return revision.get('revisionId', revision.get('id'))
@@ -0,0 +1,344 @@
+
+'''
+Per-device indexes of SecureTrack security rules. An index is built
+from one bulk download of a device's rules, with source and destination
+objects resolved through the device's object index. Sources and
+destinations are indexed as address intervals and services as port
+intervals per protocol, so finding the rules that match a flow takes a
+few binary searches and set intersections instead of a scan over the
+rulebase. Indexes are rebuilt when the device gets a new revision, see
+tufin.revisions .
+
+Known limitation: a network is only considered covered by a rule if a
+single object of the rule covers it. Objects that cannot be resolved
+match nothing and are counted as unresolved in the stats.
+'''
+
+from time import monotonic
+
+from tufin.netindex import SegmentIndex, as_network, object_network, object_range
+from tufin.objindex import ObjectIndexes
+from tufin.securetrack import iter_rules, iter_services
+
+PROTOCOLS = {
+    'icmp': 1
+    , 'tcp': 6
+    , 'udp': 17
+    , 'icmpv6': 58
+    }
+ALL_PORTS = (0, 65535)
+DEFAULT_MAX_AGE = 900
+
+class RuleIndex(): # pylint: disable=too-many-instance-attributes
+    '''
+    The enabled rules of a single device, in rule order.
+    '''
+    def __init__(self, device_id, rules, resolve_object, resolve_service, generation=0): # pylint: disable=too-many-arguments,too-many-locals
+        self.device_id = device_id
+        self.generation = generation
+        self.built_at = monotonic()
+        self.unresolved = 0
+        self.rules = sorted(
+            (rule for rule in rules if not rule.get('disabled'))
+            , key=rule_order
+            )
+        self._shapes = []
+        sources = {4: [], 6: []}
+        destinations = {4: [], 6: []}
+        services = {}
+        self._src_any = set()
+        self._dst_any = set()
+        self._svc_any = set()
+        self._negated = []
+        for position, rule in enumerate(self.rules):
+            src = self._networks(rule.get('src_network'), resolve_object)
+            dst = self._networks(rule.get('dst_network'), resolve_object)
+            svc = self._services(rule.get('dst_service'), resolve_service)
+            negated = (
+                bool(rule.get('src_networks_negated'))
+                , bool(rule.get('dst_networks_negated'))
+                , bool(rule.get('dst_services_negated'))
+                )
+            self._shapes.append((src, dst, svc, negated))
+            if any(negated):
+                self._negated.append(position)
+                continue
+            add_intervals(sources, self._src_any, src, position)
+            add_intervals(destinations, self._dst_any, dst, position)
+            if svc is None:
+                self._svc_any.add(position)
+            else:
+                for number, (protocol, first, last) in enumerate(svc):
+                    services.setdefault(protocol, []).append((first, last, (position, number)))
+        self._sources = {version: SegmentIndex(entries) for version, entries in sources.items()}
+        self._destinations = {
+            version: SegmentIndex(entries)
+            for version, entries in destinations.items()
+            }
+        self._ports = {protocol: SegmentIndex(entries) for protocol, entries in services.items()}
+    def __len__(self):
+        return len(self.rules)
+    def match(self, src, dst, service='any'):
+        '''
+        All rules matching a flow, in rule order. Sources and
+        destinations are addresses or networks, which a rule must
+        cover entirely. Services are given as for parse_service(...);
+        "any" only matches rules allowing any service.
+        '''
+        src = as_network(src)
+        dst = as_network(dst)
+        protocol, first_port, last_port = parse_service(service)
+        candidates = covering(self._sources[src.version], src) | self._src_any
+        if candidates:
+            candidates &= covering(self._destinations[dst.version], dst) | self._dst_any
+        if candidates:
+            ports = self._ports.get(protocol)
+            by_service = set(self._svc_any)
+            if ports is not None and protocol is not None:
+                by_service |= {
+                    position
+                    for position, _ in set(ports.at(first_port)) & set(ports.at(last_port))
+                    }
+            candidates &= by_service
+        for position in self._negated:
+            if self._matches_slowly(position, src, dst, (protocol, first_port, last_port)):
+                candidates.add(position)
+        return [self.rules[position] for position in sorted(candidates)]
+    def first_match(self, src, dst, service='any'):
+        '''
+        The first rule matching a flow, the one deciding its fate, or
+        None if no rule matches.
+        '''
+        matches = self.match(src, dst, service)
+        return matches[0] if matches else None
+    def _matches_slowly(self, position, src, dst, service):
+        '''
+        Checks a rule with negated elements against a flow.
+        '''
+        src_intervals, dst_intervals, svc_intervals, negated = self._shapes[position]
+        protocol, first_port, last_port = service
+        checks = (
+            network_covered(src_intervals, src)
+            , network_covered(dst_intervals, dst)
+            , svc_intervals is None or (protocol is not None and any(
+                candidate == protocol and first <= first_port and last_port <= last
+                for candidate, first, last in svc_intervals
+                ))
+            )
+        return all(check != negate for check, negate in zip(checks, negated))
+    def _networks(self, objs, resolve):
+        '''
+        The (version, first, last) intervals of a rule's sources or
+        destinations, None for any.
+        '''
+        intervals = []
+        for obj in as_items(objs):
+            found = network_intervals(obj, resolve, set())
+            if found is None:
+                return None
+            if not found:
+                self.unresolved += 1
+            intervals.extend(found)
+        return intervals
+    def _services(self, svcs, resolve):
+        '''
+        The (protocol, first port, last port) intervals of a rule's
+        services, None for any.
+        '''
+        intervals = []
+        for svc in as_items(svcs):
+            found = service_intervals(svc, resolve, set())
+            if found is None:
+                return None
+            if not found:
+                self.unresolved += 1
+            intervals.extend(found)
+        return intervals
+
+class RuleIndexes(ObjectIndexes):
+    '''
+    The rule indexes of all devices, built on demand, see ObjectIndexes .
+    '''
+    def __init__(self, max_age=DEFAULT_MAX_AGE, generations=None):
+        super().__init__(max_age=max_age, generations=generations)
+    async def build(self, conn, device_id):
+        '''
+        Downloads the rules of a device and indexes them, resolving
+        objects through the pool's object index and services through
+        the device's service list where a rule only refers to them.
+        '''
+        generation = self._generations(device_id)
+        rules = [rule async for rule in iter_rules(conn, device_id)]
+        objindex = await conn.pool.objindex.get_or_build(conn, device_id)
+        services = {}
+        if any(
+                service_intervals(svc, lambda uid: None, set()) == []
+                for rule in rules
+                for svc in as_items(rule.get('dst_service'))
+                ):
+            services = {
+                svc.get('uid'): svc
+                async for svc in iter_services(conn, device_id)
+                }
+        index = RuleIndex(
+            device_id
+            , rules
+            , objindex.by_uid.get
+            , services.get
+            , generation=generation
+            )
+        return self.keep(device_id, index)
+    def stats(self):
+        '''
+        Counters for monitoring.
+        '''
+        indexes = list(self._indexes.values())
+        return {
+            'devices': len(indexes)
+            , 'rules': sum(len(index) for index in indexes)
+            , 'unresolved': sum(index.unresolved for index in indexes)
+            , 'hits': self._hits
+            , 'misses': self._misses
+            }
+
+def rule_order(rule):
+    '''
+    The position of a rule in its rulebase.
+    '''
+    for key in ('order', 'rule_number', 'id'):
+        if rule.get(key) is not None:
+            return int(rule[key])
+    return 0
+
+def as_items(obj):
+    '''
+    Lists stay lists, None becomes empty, anything else a single item.
+    '''
+    if obj is None:
+        return []
+    return obj if isinstance(obj, list) else [obj]
+
+def is_any(obj):
+    '''
+    Whether a rule element stands for anything.
+    '''
+    return (
+        obj.get('@xsi.type', '').lower().startswith('any')
+        or str(obj.get('type', '')).lower() in ('any', 'any_object')
+        or str(obj.get('name', '')).lower() == 'any'
+        )
+
+def network_intervals(obj, resolve, seen):
+    '''
+    The (version, first, last) intervals covered by a network object,
+    resolving references and group members by uid. None for any,
+    empty if the object cannot be resolved.
+    '''
+    if is_any(obj):
+        return None
+    if not any(key in obj for key in ('ip', 'first_ip', 'member')):
+        obj = resolve(obj.get('uid')) or obj
+    network = object_network(obj) if 'ip' in obj else None
+    if network is not None:
+        return [(network.version, int(network.network_address), int(network.broadcast_address))]
+    bounds = object_range(obj)
+    if bounds is not None:
+        return [(bounds[0].version, int(bounds[0]), int(bounds[1]))]
+    intervals = []
+    for member in as_items(obj.get('member')):
+        if member.get('uid') in seen:
+            continue
+        seen.add(member.get('uid'))
+        found = network_intervals(member, resolve, seen)
+        if found is None:
+            return None
+        intervals.extend(found)
+    return intervals
+
+def service_intervals(svc, resolve, seen):
+    '''
+    The (protocol, first port, last port) intervals of a service,
+    resolving references and group members by uid. None for any,
+    empty if the service cannot be resolved.
+    '''
+    if is_any(svc):
+        return None
+    if svc.get('protocol') is None and 'member' not in svc:
+        svc = resolve(svc.get('uid')) or svc
+    if svc.get('protocol') is not None:
+        protocol = protocol_number(svc['protocol'])
+        first = svc.get('min_port', svc.get('min'))
+        last = svc.get('max_port', svc.get('max', first))
+        if first is None:
+            first, last = ALL_PORTS
+        return [(protocol, int(first), int(last))]
+    intervals = []
+    for member in as_items(svc.get('member')):
+        if member.get('uid') in seen:
+            continue
+        seen.add(member.get('uid'))
+        found = service_intervals(member, resolve, seen)
+        if found is None:
+            return None
+        intervals.extend(found)
+    return intervals
+
+def protocol_number(protocol):
+    '''
+    An IP protocol number from a number or a name like "tcp".
+    '''
+    if isinstance(protocol, str) and not protocol.isdigit():
+        return PROTOCOLS[protocol.lower()]
+    return int(protocol)
+
+def parse_service(service):
+    '''
+    A flow's service as (protocol, first port, last port), from strings
+    like "tcp:443", "udp:1000-2000", "icmp" or "any". The protocol is
+    None for any.
+    '''
+    service = str(service).strip().lower()
+    if service in ('', 'any'):
+        return None, ALL_PORTS[0], ALL_PORTS[1]
+    protocol, _, ports = service.partition(':')
+    if not ports:
+        return protocol_number(protocol), ALL_PORTS[0], ALL_PORTS[1]
+    first, _, last = ports.partition('-')
+    return protocol_number(protocol), int(first), int(last or first)
+
+def add_intervals(indexes, anys, intervals, position):
+    '''
+    Files a rule's intervals under its position and their number within
+    the rule, or the rule under anys if it matches anything.
+    '''
+    if intervals is None:
+        anys.add(position)
+        return None
+    for number, (version, first, last) in enumerate(intervals):
+        indexes[version].append((first, last, (position, number)))
+    return None
+
+def covering(index, network):
+    '''
+    The positions of the rules with an interval covering a network.
+    '''
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    found = set(index.at(first))
+    if first != last:
+        found &= set(index.at(last))
+    return {position for position, _ in found}
+
+def network_covered(intervals, network):
+    '''
+    Whether a single one of the intervals covers a network, always
+    true for any.
+    '''
+    if intervals is None:
+        return True
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    return any(
+        version == network.version and low <= first and last <= high
+        for version, low, high in intervals
+        )
@@ -3,15 +3,32 @@
 Convenience functions specific to SecureChange.
 
 Implemented so far:
-    - Group changes retaining existing members
-To be implemented:
-    - Group changes not retaining existing members
-    - Group changes specifying members to be removed
+    - Group changes retaining existing members, also for many groups
+        and members at once
+    - Group changes towards a desired membership, adding and removing
+        only what differs
+    - Streaming iteration over tickets, with their details fetched
+        ahead in parallel, and NDJSON export
 '''
 
 #TODO: Properly subdivide the various types of group changes.
 
-from tufin.securetrack import grab_name
+from asyncio import ensure_future, gather
+from collections import deque
+
+from tufin.batch import DEFAULT_BATCH_LIMIT
+from tufin.codec import dumpb
+from tufin.io import fetch_ticket
+from tufin.netindex import as_network, object_network
+from tufin.securetrack import (
+    grab_group,
+    grab_name,
+    grab_name_bulk,
+    group_members,
+    needs_details,
+    resolve_members
+    )
+from tufin.ticket import SimpleTicket
 
 def group_change(mgmt_id, name, members, exists=True):
     '''
@@ -42,6 +59,184 @@ def group_change_multiple(data):
             ]
         }
 
+async def group_change_bulk( # pylint: disable=too-many-arguments
+        conn
+        , groups
+        , new_groups=()
+        , names=None
+        , comment=''
+        , limit=DEFAULT_BATCH_LIMIT
+        ):
+    '''
+    Builds a group change for many groups and members at once. The
+    groups argument is a dict of form
+        {
+            (groupname, mgmt_id): addresses_or_networks
+            }
+    and groups whose key is in new_groups are created rather than
+    updated. Members are deduplicated within each group, and existing
+    objects are looked up once per device, for all devices concurrently.
+    The names and comment arguments are as for make_member_data_bulk(...) .
+    '''
+    groups = {key: list(dict.fromkeys(objs)) for key, objs in groups.items()}
+    by_device = {}
+    for (_, mgmt_id), objs in groups.items():
+        by_device.setdefault(mgmt_id, {}).update(dict.fromkeys(objs))
+    mgmt_ids = list(by_device)
+    result = await conn.batch(
+        [
+            (lambda c, mgmt_id=mgmt_id: make_member_data_bulk(
+                c, mgmt_id, list(by_device[mgmt_id]), names=names, comment=comment, limit=limit
+                ))
+            for mgmt_id in mgmt_ids
+            ]
+        , limit=limit
+        )
+    members = {
+        mgmt_id: dict(zip(by_device[mgmt_id], data))
+        for mgmt_id, data in zip(mgmt_ids, result.values())
+        }
+    return group_change_multiple({
+        key: (key not in new_groups, [members[key[1]][obj] for obj in objs])
+        for key, objs in groups.items()
+        })
+
+async def group_change_diff(conn, groups, names=None, comment='', limit=DEFAULT_BATCH_LIMIT): # pylint: disable=too-many-locals
+    '''
+    Builds a group change that brings groups to a desired membership.
+    The groups argument is a dict of form
+        {
+            (groupname, mgmt_id): addresses_networks_or_object_names
+            }
+    Each group is fetched once, members listed by reference are
+    resolved through at most one object index per device, and the
+    current members are compared to the desired ones, see
+    group_diff(...) . Desired object names must exist. Only the
+    members to be added or removed are listed, groups without
+    differences are left out and groups that do not exist are
+    created. Returns None if nothing is to be changed. The names and
+    comment arguments are as for make_member_data_bulk(...) .
+    '''
+    keys = list(groups)
+    result = await conn.batch(
+        [
+            (lambda c, key=key: grab_group(c, key[1], key[0]))
+            for key in keys
+            ]
+        , limit=limit
+        )
+    found = dict(zip(keys, result.values()))
+    indexes = await member_indexes(conn, found, limit=limit)
+    diffs = {}
+    for key in keys:
+        group = found[key]
+        current = None
+        if group is not None:
+            current = resolve_members(group_members(group), indexes.get(key[1]))
+        added, removed = group_diff(current or [], groups[key])
+        if added or removed or current is None:
+            diffs[key] = (current, added, removed)
+    if not diffs:
+        return None
+    await check_names_exist(conn, diffs, indexes, limit=limit)
+    additions = await group_change_bulk(
+        conn
+        , {
+            key: [obj for obj in added if not isinstance(obj, str)]
+            for key, (_, added, _) in diffs.items()
+            }
+        , names=names
+        , comment=comment
+        , limit=limit
+        )
+    resolved = iter(change['members']['member'] for change in additions['group_change'])
+    changes = {}
+    for (name, mgmt_id), (current, added, removed) in diffs.items():
+        current_names = {member['name'] for member in current or []}
+        changes[(name, mgmt_id)] = (current is not None, [
+            *(member for member in next(resolved) if member['name'] not in current_names)
+            , *(existing_object(mgmt_id, obj) for obj in added if isinstance(obj, str))
+            , *(existing_object(mgmt_id, obj, remove=True) for obj in removed)
+            ])
+    return group_change_multiple(changes)
+
+async def member_indexes(conn, groups, limit=DEFAULT_BATCH_LIMIT):
+    '''
+    The object indexes needed to resolve the members of groups, given
+    as {(groupname, mgmt_id): group_or_none}, by device. Each device is
+    indexed once, and only if one of its groups lists members by
+    reference, see tufin.securetrack.needs_details(...) .
+    '''
+    mgmt_ids = list(dict.fromkeys(
+        mgmt_id
+        for (_, mgmt_id), group in groups.items()
+        if group is not None and any(needs_details(member) for member in group_members(group))
+        ))
+    result = await conn.batch(
+        [
+            (lambda c, mgmt_id=mgmt_id: c.pool.objindex.get_or_build(c, mgmt_id))
+            for mgmt_id in mgmt_ids
+            ]
+        , limit=limit
+        )
+    return dict(zip(mgmt_ids, result.values()))
+
+async def check_names_exist(conn, diffs, indexes, limit=DEFAULT_BATCH_LIMIT):
+    '''
+    Makes sure the object names to be added by group_change_diff(...)
+    exist on their devices, looking them up in the given indexes or
+    else through grab_name_bulk(...) . Raises ValueError otherwise.
+    '''
+    by_device = {}
+    for (_, mgmt_id), (_, added, _) in diffs.items():
+        wanted = by_device.setdefault(mgmt_id, {})
+        wanted.update(dict.fromkeys(obj for obj in added if isinstance(obj, str)))
+    for mgmt_id, names in by_device.items():
+        names = list(names)
+        if not names:
+            continue
+        index = indexes.get(mgmt_id)
+        if index is not None:
+            found = [index.name_for(name) for name in names]
+        else:
+            found = await grab_name_bulk(conn, mgmt_id, names, limit=limit)
+        missing = [name for name, existing in zip(names, found) if existing != name]
+        if missing:
+            raise ValueError('No such network objects', mgmt_id, missing)
+    return None
+
+def group_diff(current, desired):
+    '''
+    Compares a group's current members, as provided by
+    tufin.securetrack.grab_group_members(...) , to the desired ones,
+    given as addresses, networks or object names. A current member is
+    kept if its name or its address is desired. Returns the desired
+    entries not covered by a current member and the names of the
+    current members to be removed.
+    '''
+    desired = list(dict.fromkeys(desired))
+    desired_names = {obj for obj in desired if isinstance(obj, str)}
+    desired_networks = {as_network(obj) for obj in desired if not isinstance(obj, str)}
+    current_names = set()
+    current_networks = set()
+    removed = []
+    for member in current:
+        network = object_network(member) if 'ip' in member else None
+        current_names.add(member['name'])
+        if network is not None:
+            current_networks.add(network)
+        if member['name'] not in desired_names and network not in desired_networks:
+            removed.append(member['name'])
+    added = [
+        obj
+        for obj in desired
+        if (
+            obj not in current_names if isinstance(obj, str)
+            else as_network(obj) not in current_networks
+            )
+        ]
+    return added, removed
+
 def group_change_payload(mgmt_id, name, members, exists=True):
     '''
     Creates a single group change payload. Used by group_change(...)
@@ -54,12 +249,150 @@ def group_change_payload(mgmt_id, name, members, exists=True):
         , 'change_action': 'UPDATE' if exists else 'CREATE'
         }
 
+def iter_ticket_summaries(conn, params=None, **kwargs):
+    '''
+    Iterates over the tickets listed by SecureChange, page by page.
+    The params argument takes filters such as {'status': 'In Progress'}.
+    Further keyword arguments are passed to TufinConn.scpages(...) .
+    '''
+    return conn.scpages('tickets', ('tickets', 'ticket'), params=params, **kwargs)
+
+async def iter_ticket_data( # pylint: disable=too-many-arguments
+        conn
+        , params=None
+        , details=True
+        , parallel=DEFAULT_BATCH_LIMIT
+        , on_error=None
+        , **kwargs
+        ):
+    '''
+    Iterates over the tickets listed by SecureChange, see
+    iter_ticket_summaries(...) . With details, every ticket is fetched
+    in full through tufin.io.fetch_ticket(...) , up to parallel of them
+    ahead of the consumer and in the order of the listing, so memory
+    stays bounded by the page size and parallel. A failed fetch raises,
+    unless on_error is given: it is then called with the summary and
+    the error, and the ticket is skipped.
+    '''
+    summaries = iter_ticket_summaries(conn, params=params, **kwargs)
+    if not details:
+        async for summary in summaries:
+            yield summary
+        return
+    pending = deque()
+    async def next_ticket():
+        summary, task = pending.popleft()
+        try:
+            return await task
+        except Exception as e: # pylint: disable=broad-except
+            if on_error is None:
+                raise
+            on_error(summary, e)
+            return None
+    try:
+        async for summary in summaries:
+            pending.append((summary, ensure_future(fetch_ticket_data(conn, summary['id']))))
+            if len(pending) >= max(1, parallel):
+                ticket = await next_ticket()
+                if ticket is not None:
+                    yield ticket
+        while pending:
+            ticket = await next_ticket()
+            if ticket is not None:
+                yield ticket
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await gather(*(task for _, task in pending), return_exceptions=True)
+        await summaries.aclose()
+
+async def iter_tickets(conn, params=None, parallel=DEFAULT_BATCH_LIMIT, on_error=None, **kwargs):
+    '''
+    Like iter_ticket_data(...) , yielding the tickets as SimpleTicket ,
+    whose steps are only parsed on access.
+    '''
+    tickets = iter_ticket_data(conn, params=params, parallel=parallel, on_error=on_error, **kwargs)
+    try:
+        async for ticket in tickets:
+            yield SimpleTicket(ticket)
+    finally:
+        await tickets.aclose()
+
+async def export_tickets( # pylint: disable=too-many-arguments
+        conn
+        , handle
+        , params=None
+        , details=True
+        , parallel=DEFAULT_BATCH_LIMIT
+        , on_error=None
+        , **kwargs
+        ):
+    '''
+    Writes the tickets listed by SecureChange to the binary file handle
+    as newline-delimited JSON, one ticket at a time, see
+    iter_ticket_data(...) . Returns the number of tickets written.
+    '''
+    count = 0
+    tickets = iter_ticket_data(
+        conn
+        , params=params
+        , details=details
+        , parallel=parallel
+        , on_error=on_error
+        , **kwargs
+        )
+    try:
+        async for ticket in tickets:
+            handle.write(dumpb(ticket) + b'\n')
+            count += 1
+    finally:
+        await tickets.aclose()
+    return count
+
+async def fetch_ticket_data(conn, ticket_id):
+    '''
+    The full data of a single ticket, see tufin.io.fetch_ticket(...) .
+    '''
+    status, ticket = await fetch_ticket(conn, ticket_id)
+    if status != 200:
+        raise ValueError('Bad status fetching ticket', ticket_id, status, ticket)
+    return ticket
+
 async def make_member_data(conn, mgmt_id, obj, name=None, comment=''):
     '''
     Creates the payload for a single member, checking whether a suitable
     object already exists.
     '''
     existing_name = await grab_name(conn, mgmt_id, obj)
+    return member_data(mgmt_id, obj, existing_name, name=name, comment=comment)
+
+async def make_member_data_bulk( # pylint: disable=too-many-arguments
+        conn
+        , mgmt_id
+        , objs
+        , names=None
+        , comment=''
+        , limit=DEFAULT_BATCH_LIMIT
+        ):
+    '''
+    Like make_member_data(...), but for many objects at once, looking
+    up existing objects concurrently. The names argument optionally
+    maps objects to the names used for new objects. Returns the member
+    payloads in the order of objs.
+    '''
+    objs = list(objs)
+    names = names or {}
+    existing_names = await grab_name_bulk(conn, mgmt_id, objs, limit=limit)
+    return [
+        member_data(mgmt_id, obj, existing_name, name=names.get(obj), comment=comment)
+        for obj, existing_name in zip(objs, existing_names)
+        ]
+
+def member_data(mgmt_id, obj, existing_name, name=None, comment=''): # pylint: disable=too-many-arguments
+    '''
+    Creates the payload for a single member, given the name of the
+    existing object, if any.
+    '''
     if existing_name is not None:
         return existing_object(mgmt_id, existing_name)
     if hasattr(obj, 'netmask'):
@@ -4,16 +4,40 @@ Convenience functions specific to SecureTrack.
 
 Implemented so far:
     - Getting a device ID
-    - Getting an object name given the id of the object's device
-    - Zone lookups
+    - Getting an object name given the id of the object's device,
+        also for many objects at once
+    - Getting a group's members
+    - Zone lookups, cached and in parallel chunks
+    - Topology path queries, cached and in parallel
+    - Rule matching against per-device rule indexes
+    - Streaming iteration over devices and network objects, also
+        over search results
+
+Device ids are served from the device catalog in server mode, see
+tufin.catalog . Other device and object lookups go through
+TufinConn.stget(...) and are thus served from the pool's response
+cache when possible. Modules changing SecureTrack data should call
+TufinConn.invalidate(...) afterwards. Zone lookups are remembered in
+the pool's zone cache, see tufin.zonecache , and path queries in its
+path cache, see tufin.pathcache . Rules are matched locally, see
+tufin.ruleindex .
 '''
 
-from ipaddress import ip_network, ip_address
+from tufin.batch import DEFAULT_BATCH_LIMIT
+from tufin.netindex import as_network, parse_network
+
+DEFAULT_ZONE_CHUNK_SIZE = 200
 
 async def grab_device_id(conn, target):
     '''
-    Grabs a device's id.
+    Grabs a device's id, from the pool's device catalog if it has been
+    loaded and knows the device, from the API otherwise.
     '''
+    catalog = conn.pool.catalog
+    if catalog.loaded:
+        device_id = catalog.device_id(target)
+        if device_id is not None:
+            return device_id
     status, _, deviceres = await conn.stget('devices', params={'name': target})
     if status != 200:
         raise ValueError('Bad status', target, status, deviceres)
@@ -23,28 +47,87 @@ async def grab_device_id(conn, target):
             return candidate['id']
     raise ValueError('No such device', target)
 
-async def grab_name(conn, device_id, obj):
+def iter_devices(conn, params=None, **kwargs):
     '''
-    Grabs an object's name on a given device.
+    Iterates over all devices known to SecureTrack, page by page.
+    Further keyword arguments are passed to TufinConn.stpages(...) .
     '''
-    if isinstance(obj, str):
-        endpoint = f'devices/{device_id}/network_objects'
-        params = {'name': obj}
-    elif hasattr(obj, 'netmask'):
-        endpoint = 'network_objects/search'
-        params = {
-            'device_id': device_id
-            , 'filter': 'subnet'
-            , 'contains': str(obj.network_address)
-            , 'contained_in': str(obj.network_address)
-            , 'exact_subnet': obj.netmask
-            }
+    return conn.stpages('devices', ('devices', 'device'), params=params, **kwargs)
+
+def iter_network_objects(conn, device_id, params=None, **kwargs):
+    '''
+    Iterates over all network objects of a device, page by page.
+    Further keyword arguments are passed to TufinConn.stpages(...) .
+    '''
+    return conn.stpages(
+        f'devices/{device_id}/network_objects'
+        , ('network_objects', 'network_object')
+        , params=params
+        , **kwargs
+        )
+
+def iter_rules(conn, device_id, params=None, **kwargs):
+    '''
+    Iterates over all security rules of a device, page by page.
+    Further keyword arguments are passed to TufinConn.stpages(...) .
+    '''
+    return conn.stpages(
+        f'devices/{device_id}/rules'
+        , ('rules', 'rule')
+        , params=params
+        , **kwargs
+        )
+
+def iter_services(conn, device_id, params=None, **kwargs):
+    '''
+    Iterates over all services of a device, page by page.
+    Further keyword arguments are passed to TufinConn.stpages(...) .
+    '''
+    return conn.stpages(
+        f'devices/{device_id}/services'
+        , ('services', 'service')
+        , params=params
+        , **kwargs
+        )
+
+async def match_rules(conn, device_id, flows):
+    '''
+    The rules of a device matching each of the flows, given as for
+    path_lookup(...) , answered from the device's rule index. The
+    index is built if necessary; where rule indexes are disabled, a
+    temporary one is built for this call. Returns one list of matching
+    rules, in rule order, per flow. Flows answered by an index that
+    was already current count as hits, the others as misses.
+    '''
+    ruleindex = conn.pool.ruleindex
+    index = ruleindex.peek(device_id)
+    if index is not None:
+        ruleindex.count_many(len(flows), 0)
     else:
-        endpoint = 'network_objects/search'
-        params = {
-            'device_id': device_id
-            , 'ip': str(obj) # Is this sufficient?
-            }
+        index = await ruleindex.get_or_build(conn, device_id)
+        ruleindex.count_many(0, len(flows))
+    return [index.match(*flow) for flow in flows]
+
+async def grab_name(conn, device_id, obj):
+    '''
+    Grabs an object's name on a given device, from the device's object
+    index if one has been built and knows the object, from the API
+    otherwise.
+    '''
+    objindex = conn.pool.objindex
+    index = objindex.peek(device_id)
+    if index is not None:
+        name = index.name_for(obj)
+        objindex.count(name is not None)
+        if name is not None:
+            return name
+    return await grab_name_remote(conn, device_id, obj)
+
+async def grab_name_remote(conn, device_id, obj):
+    '''
+    Like grab_name(...), but always asks the API.
+    '''
+    endpoint, params = name_query(device_id, obj)
     status, _, res = await conn.stget(endpoint, params=params)
     if status != 200:
         raise ValueError(
@@ -59,46 +142,284 @@ async def grab_name(conn, device_id, obj):
         return None
     return netobjs[0]['name']
 
-async def zone_lookup(conn, objects):
+def iter_matching_objects(conn, device_id, obj):
+    '''
+    Like grab_name(...), but yields all matching network objects one
+    at a time, decoding the response incrementally. Suitable for broad
+    searches with very many results.
+    '''
+    endpoint, params = name_query(device_id, obj)
+    return conn.ststream(endpoint, ('network_objects', 'network_object'), params=params)
+
+def name_query(device_id, obj):
+    '''
+    The endpoint and parameters to search for objects like obj on
+    a given device.
+    '''
+    if isinstance(obj, str):
+        return f'devices/{device_id}/network_objects', {'name': obj}
+    if hasattr(obj, 'netmask'):
+        return 'network_objects/search', {
+            'device_id': device_id
+            , 'filter': 'subnet'
+            , 'contains': str(obj.network_address)
+            , 'contained_in': str(obj.network_address)
+            , 'exact_subnet': obj.netmask
+            }
+    return 'network_objects/search', {
+        'device_id': device_id
+        , 'ip': str(obj) # Is this sufficient?
+        }
+
+async def grab_name_bulk(conn, device_id, objs, limit=DEFAULT_BATCH_LIMIT):
+    '''
+    Like grab_name(...), but for many objects on the same device at
+    once. Where object indexes are enabled, the device's index is built
+    if necessary and the API is only asked about objects the index does
+    not know. Returns the names in the order of objs, raising the first
+    error encountered after all lookups have finished.
+    '''
+    objs = list(objs)
+    index = await conn.pool.objindex.get(conn, device_id)
+    names = [None if index is None else index.name_for(obj) for obj in objs]
+    misses = [position for position, name in enumerate(names) if name is None]
+    if index is not None:
+        conn.pool.objindex.count_many(len(objs) - len(misses), len(misses))
+    result = await conn.batch(
+        [
+            (lambda c, obj=objs[position]: grab_name_remote(c, device_id, obj))
+            for position in misses
+            ]
+        , limit=limit
+        )
+    for position, name in zip(misses, result.values()):
+        names[position] = name
+    return names
+
+async def grab_group(conn, device_id, name):
+    '''
+    Grabs a network object group by name, None if there is none.
+    '''
+    endpoint = f'devices/{device_id}/network_objects'
+    status, _, res = await conn.stget(endpoint, params={'name': name})
+    if status != 200:
+        raise ValueError('Bad result searching for a group', device_id, name, status, res)
+    for candidate in res['network_objects']['network_object']:
+        is_group = 'member' in candidate or candidate.get('type') == 'group'
+        if candidate['name'] == name and is_group:
+            return candidate
+    return None
+
+async def grab_group_members(conn, device_id, name, index=None):
+    '''
+    The members of a group, None if there is no such group. Members
+    listed without their details are resolved through index, an
+    ObjectIndex of the device, or else through the device's object
+    index, built for the purpose if indexes are disabled.
+    '''
+    group = await grab_group(conn, device_id, name)
+    if group is None:
+        return None
+    members = group_members(group)
+    if index is None and any(needs_details(member) for member in members):
+        index = await conn.pool.objindex.get_or_build(conn, device_id)
+    return resolve_members(members, index)
+
+def group_members(group):
+    '''
+    The members of a group as listed, always a list.
+    '''
+    members = group.get('member') or []
+    if isinstance(members, dict):
+        members = [members]
+    return members
+
+def needs_details(member):
+    '''
+    Whether a group member is only listed by reference.
+    '''
+    return not any(key in member for key in ('ip', 'first_ip', 'member'))
+
+def resolve_members(members, index):
     '''
-    Looks up the zones relevant to the objects specified.
+    Replaces the members listed by reference with their details from
+    an ObjectIndex, where it knows them.
+    '''
+    if index is None:
+        return list(members)
+    return [
+        (index.by_uid.get(member.get('uid')) or member) if needs_details(member) else member
+        for member in members
+        ]
+
+async def grab_containing_objects(conn, device_id, obj):
+    '''
+    All network objects on a device containing an address or network,
+    answered from the device's object index. Falls back to streaming
+    the API's search results where object indexes are disabled.
+    '''
+    index = await conn.pool.objindex.get(conn, device_id)
+    if index is not None:
+        return index.containing(obj)
+    return [found async for found in iter_matching_objects(conn, device_id, obj)]
+
+async def zone_lookup(conn, objects, chunk_size=DEFAULT_ZONE_CHUNK_SIZE, limit=DEFAULT_BATCH_LIMIT): # pylint: disable=too-many-locals
+    '''
+    Looks up the zones relevant to the objects specified. Answers are
+    taken from the pool's zone cache where possible, the rest is
+    deduplicated and posted to security_zones in chunks of chunk_size,
+    at most limit chunks at a time.
     Assumptions:
         - @xsi.type is either "object_network" or "ip_network"
         - Display names are unique
     '''
+    zonecache = conn.pool.zonecache
     display_name_cache = {}
-    payload = {'network_objects': {'network_object': [
-        (
-            zone_payload_address(obj)
-            if hasattr(obj, 'max_prefixlen')
-            else zone_payload_object(obj, display_name_cache)
-            )
-        for obj in objects
-        ]}}
-    zonedata = await conn.stpost('security_zones', payload)
     res = {}
-    for entry in zonedata['security_zones_result']['network_object_zones_map']['entry']:
-        value_zones = [
-            zone['zone']
-            for zone in entry['value']['network_objects_zones']['network_objects_zone']
+    pending = {}
+    for obj in objects:
+        if hasattr(obj, 'max_prefixlen'):
+            network = as_network(obj)
+            zones = zonecache.network_zones(network)
+            if zones is None:
+                pending.setdefault(network, zone_payload_address(network))
+            else:
+                add_network_zones(res, network, list(zones))
+            continue
+        payload = zone_payload_object(obj, display_name_cache)
+        zones = zonecache.object_zones(payload['management_id'], payload['uid'])
+        if zones is None:
+            pending.setdefault((str(payload['management_id']), payload['uid']), payload)
+        else:
+            name = object_display_name(display_name_cache, payload['management_id'], payload['uid'])
+            res[name] = list(zones)
+    payloads = list(pending.values())
+    result = await conn.batch(
+        [
+            (lambda c, chunk=payloads[start:start+chunk_size]: zone_lookup_chunk(c, chunk))
+            for start in range(0, len(payloads), chunk_size)
             ]
-        key_full = entry['key']
-        if (key_network := key_full.get('network')) is not None:
-            key_mask = key_network['mask']
-            key_ip = key_network['ip']
-            res[ip_network(key_ip + '/' + key_mask)] = value_zones
-            if key_mask == '255.255.255.255': #TODO: Recognize IPv6 hosts
-                res[ip_address(key_ip)] = value_zones
+        , limit=limit
+        )
+    for entries in result.values():
+        for entry in entries:
+            value_zones = [
+                zone['zone']
+                for zone in entry['value']['network_objects_zones']['network_objects_zone']
+                ]
+            key_full = entry['key']
+            if (key_network := key_full.get('network')) is not None:
+                network = parse_network(key_network['ip'], key_network['mask'])
+                zonecache.put_network(network, value_zones)
+                add_network_zones(res, network, value_zones)
+            else:
+                management_id = key_full['management_id']
+                uid = key_full['uid']
+                zonecache.put_object(management_id, uid, value_zones)
+                res[object_display_name(display_name_cache, management_id, uid)] = value_zones
+    return res
+
+async def zone_lookup_chunk(conn, payloads):
+    '''
+    Posts a single chunk of zone_lookup(...) and returns the entries
+    of the result.
+    '''
+    payload = {'network_objects': {'network_object': payloads}}
+    status, _, zonedata = await conn.stpost('security_zones', payload)
+    if status != 200:
+        raise ValueError('Bad result looking up security zones', status, zonedata)
+    return zonedata['security_zones_result']['network_object_zones_map']['entry']
+
+def add_network_zones(res, network, zones):
+    '''
+    Enters the zones of a network into a zone_lookup(...) result,
+    under the host's address as well for single hosts.
+    '''
+    res[network] = zones
+    if network.prefixlen == network.max_prefixlen:
+        res[network.network_address] = zones
+
+def object_display_name(display_name_cache, management_id, uid):
+    '''
+    The key of an object in a zone_lookup(...) result.
+    '''
+    return display_name_cache.get(
+        (management_id, uid)
+        , f'Tufin:/devices/{management_id}/network_objects/{uid}'
+        )
+
+async def path_lookup(conn, flows, limit=DEFAULT_BATCH_LIMIT):
+    '''
+    Looks up the topology paths of flows, given as (src, dst) or
+    (src, dst, service) tuples of addresses or networks and services
+    like "tcp:443", "any" by default. Answers are taken from the pool's
+    path cache where possible, the remaining distinct flows are queried
+    at most limit at a time. Returns a dict from path_key(...) to the
+    path_calc_results of each flow, see path_device_ids(...) .
+    '''
+    pathcache = conn.pool.pathcache
+    res = {}
+    pending = {}
+    for flow in flows:
+        key = path_key(*flow)
+        if key in res or key in pending:
+            continue
+        cached = pathcache.get(key)
+        if cached is None:
+            pending[key] = None
         else:
-            management_id = key_full['management_id']
-            uid = key_full['uid']
-            display_name = display_name_cache.get(
-                (management_id, uid)
-                , f'Tufin:/devices/{management_id}/network_objects/{uid}'
-                )
-            res[display_name] = value_zones
+            res[key] = cached
+    result = await conn.batch(
+        [
+            (lambda c, key=key: path_query(c, key))
+            for key in pending
+            ]
+        , limit=limit
+        )
+    res.update(zip(pending, result.values()))
     return res
 
+async def path_query(conn, key):
+    '''
+    Queries SecureTrack for the path of a single flow given by its
+    path_key(...) and caches the result.
+    '''
+    src, dst, service = key
+    pathcache = conn.pool.pathcache
+    epoch = pathcache.epoch
+    status, _, pathres = await conn.stget(
+        'topology/path'
+        , params={'src': path_param(src), 'dst': path_param(dst), 'service': service}
+        )
+    if status != 200:
+        raise ValueError('Bad result looking up a topology path', key, status, pathres)
+    result = pathres['path_calc_results']
+    pathcache.put(key, result, path_device_ids(result), epoch=epoch)
+    return result
+
+def path_key(src, dst, service='any'):
+    '''
+    The normalized form of a flow: source and destination networks and
+    a lowercase service.
+    '''
+    return as_network(src), as_network(dst), (str(service).strip().lower() or 'any')
+
+def path_param(network):
+    '''
+    A network as a path query parameter, hosts as plain addresses.
+    '''
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+def path_device_ids(result):
+    '''
+    The ids of the devices on a path, in path order.
+    '''
+    devices = result.get('device_info') or []
+    if isinstance(devices, dict):
+        devices = [devices]
+    return [device['id'] for device in devices]
 
 def zone_payload_object(obj, display_name_cache):
     '''
@@ -118,19 +439,15 @@ def zone_payload_object(obj, display_name_cache):
 def zone_payload_address(address):
     '''
     Creates the payload for zone retrieval for a network address.
+    Single addresses are sent as host networks, /32 or /128.
     '''
-    if address.version == 4:
-        xsitype = 'raw_network_subnet'
-        netmask_default = '255.255.255.255'
-    else:
-        xsitype = 'raw_network_ipv6'
-        netmask_default = 'ffff:ffff:ffff:ffff' #Pure guesswork, there's no example at hand
+    network = as_network(address)
     return {
         '@xsi.type': 'ip_network'
         , 'network': {
-            '@xsi.type': xsitype
-            , 'ip': str(getattr(address, 'network_address', address))
-            , 'mask': str(getattr(address, 'netmask', netmask_default))
+            '@xsi.type': 'raw_network_subnet' if network.version == 4 else 'raw_network_ipv6'
+            , 'ip': str(network.network_address)
+            , 'mask': str(network.netmask)
             }
         }
 
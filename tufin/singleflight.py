@@ -0,0 +1,79 @@
+
+'''
+Coalescing of identical concurrent requests. While a request for some key
+is in flight, further callers asking for the same key wait for that
+request instead of sending their own, and all of them receive the same
+result. The shared result must therefore be treated as read-only.
+'''
+
+from asyncio import ensure_future, shield
+
+class Flight(): # pylint: disable=too-few-public-methods
+    '''
+    A single request in flight and the number of callers awaiting it.
+    '''
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight():
+    '''
+    Runs at most one coroutine per key at a time. Waiters are
+    cancellation-safe: a cancelled waiter leaves the request running
+    for the others, and only when the last waiter is gone is the
+    request itself cancelled.
+    '''
+    def __init__(self):
+        self._flights = {}
+        self._leaders = 0
+        self._followers = 0
+    async def do(self, key, func):
+        '''
+        Returns the result of func(), sharing it with all concurrent
+        callers using the same key.
+        '''
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+            self._leaders += 1
+        else:
+            self._followers += 1
+        flight.waiters += 1
+        try:
+            return await shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._land(key, flight)
+                flight.task.cancel()
+    def _land(self, key, flight):
+        '''
+        Forgets a finished or abandoned flight, unless a newer one
+        has already taken its place.
+        '''
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception() # Retrieved by the waiters, silences asyncio
+    def stats(self):
+        '''
+        Counters for monitoring. Followers are the requests saved.
+        '''
+        return {
+            'in_flight': len(self._flights)
+            , 'leaders': self._leaders
+            , 'followers': self._followers
+            }
+
+def flight_key(upstream, method, endpoint, params):
+    '''
+    A hashable key identifying a request, independent of the order
+    of its parameters.
+    '''
+    if params:
+        frozen = tuple(sorted((str(k), str(v)) for k, v in params.items()))
+    else:
+        frozen = ()
+    return upstream.name, method, endpoint, frozen
@@ -0,0 +1,271 @@
+
+'''
+A persistent snapshot of the SecureTrack inventory in the SQLite
+database passed as --database. Devices, their network objects and the
+revision these were taken at are stored along with the zone cache, so a
+freshly started server answers device, object and zone lookups from
+warm in-memory indexes right away. The snapshot is brought up to date
+in the background, downloading only the objects of devices whose
+revision changed since they were stored.
+'''
+
+from asyncio import get_running_loop
+from sqlite3 import connect
+from time import time
+
+from tufin.background import Periodic
+from tufin.codec import dumps, loads
+from tufin.netindex import as_network
+from tufin.securetrack import iter_devices, iter_network_objects
+
+DEFAULT_SYNC_INTERVAL = 300
+DEFAULT_SYNC_LIMIT = 4
+
+class InventorySnapshot():
+    '''
+    The on-disk inventory of a TufinPool. load(...) fills the pool's
+    catalog, object indexes and zone cache from disk, sync(...) updates
+    the disk and the indexes from SecureTrack.
+    '''
+    def __init__(self, database, sync_interval=DEFAULT_SYNC_INTERVAL, limit=DEFAULT_SYNC_LIMIT):
+        self.database = database
+        self._sync_interval = sync_interval
+        self._limit = limit
+        self._revisions = {}
+        self._syncer = None
+        self._counters = {
+            'loads': 0
+            , 'syncs': 0
+            , 'devices_synced': 0
+            , 'objects_synced': 0
+            }
+        make_tables(database)
+    def load(self, pool):
+        '''
+        Fills the pool's catalog, object indexes and zone cache from
+        disk and tells the pool's revision watcher which revisions the
+        data stem from, so that devices changed in the meantime are
+        invalidated on its first poll. Returns the number of devices.
+        '''
+        devices, revisions, objects, zones = read_snapshot(self.database)
+        self._revisions = revisions
+        if not devices:
+            return 0
+        pool.catalog.install(devices)
+        for device_id, revision in revisions.items():
+            pool.revisions.seed(device_id, revision)
+        if pool.objindex.enabled:
+            for device_id, objs in objects.items():
+                pool.objindex.install(device_id, objs, pool.revisions.generation(device_id))
+        now = time()
+        for key, entry, expires in zones:
+            pool.zonecache.restore(key, entry, expires - now)
+        self._counters['loads'] += 1
+        return len(devices)
+    async def sync(self, conn):
+        '''
+        Brings the snapshot up to date: refreshes the device list and
+        revisions, downloads the objects of devices whose revision
+        differs from the stored one and writes the zone cache.
+        '''
+        pool = conn.pool
+        devices = [device async for device in iter_devices(conn)]
+        pool.catalog.install(devices)
+        device_ids = [str(device['id']) for device in devices]
+        loop = get_running_loop()
+        await loop.run_in_executor(None, write_devices, self.database, devices)
+        await pool.revisions.poll(conn, device_ids)
+        stale = [
+            device_id
+            for device_id in device_ids
+            if pool.revisions.revision(device_id) is not None
+            and self._revisions.get(device_id) != str(pool.revisions.revision(device_id))
+            ]
+        result = await conn.batch(
+            [
+                (lambda c, device_id=device_id: self._sync_device(c, device_id))
+                for device_id in stale
+                ]
+            , limit=self._limit
+            )
+        await loop.run_in_executor(
+            None, write_zones, self.database, pool.zonecache.export(), time()
+            )
+        self._counters['syncs'] += 1
+        if result.errors:
+            raise result.errors[0][1]
+        return len(stale)
+    async def _sync_device(self, conn, device_id):
+        '''
+        Downloads and stores the objects of a single device.
+        '''
+        pool = conn.pool
+        revision = str(pool.revisions.revision(device_id))
+        generation = pool.revisions.generation(device_id)
+        objs = [obj async for obj in iter_network_objects(conn, device_id)]
+        if pool.objindex.enabled:
+            pool.objindex.install(device_id, objs, generation)
+        await get_running_loop().run_in_executor(
+            None, write_objects, self.database, device_id, revision, objs
+            )
+        self._revisions[device_id] = revision
+        self._counters['devices_synced'] += 1
+        self._counters['objects_synced'] += len(objs)
+        return None
+    async def start(self, conn, logger=None, initial=True):
+        '''
+        Syncs right away and then every sync_interval seconds in the
+        background using conn, which must stay open until stop(...)
+        is called. Without initial, the first sync waits for one
+        interval, e.g. when the catalog was just loaded from the API.
+        '''
+        self._syncer = Periodic(
+            lambda: self.sync(conn)
+            , self._sync_interval
+            , logger=logger
+            , name='inventory snapshot sync'
+            )
+        self._syncer.start(delay=0 if initial else None)
+        return None
+    async def stop(self):
+        '''
+        Stops the background sync.
+        '''
+        if self._syncer is not None:
+            await self._syncer.stop()
+        return None
+    def stats(self):
+        '''
+        Counters for monitoring.
+        '''
+        return {
+            **self._counters
+            , 'devices': len(self._revisions)
+            }
+
+def zone_row(key):
+    '''
+    The kind and text key of a zone cache key.
+    '''
+    if isinstance(key, tuple):
+        return 'object', dumps(list(key))
+    return 'network', str(key)
+
+def zone_key(kind, text):
+    '''
+    The zone cache key of a stored zone row.
+    '''
+    if kind == 'object':
+        return tuple(loads(text))
+    return as_network(text)
+
+def read_snapshot(database):
+    '''
+    Everything stored: the device list, the revision per device, the
+    objects per device and the zone rows with their expiry time.
+    '''
+    with connect(database) as conn:
+        devices = []
+        revisions = {}
+        for device_id, revision, data in conn.execute(
+                'SELECT id, revision, data FROM st_snapshot_device ORDER BY id'
+                ):
+            devices.append(loads(data))
+            if revision is not None:
+                revisions[device_id] = revision
+        objects = {}
+        for device_id, data in conn.execute(
+                'SELECT device_id, data FROM st_snapshot_object ORDER BY device_id, position'
+                ):
+            objects.setdefault(device_id, []).append(loads(data))
+        zones = [
+            (zone_key(kind, key), loads(data), expires)
+            for kind, key, data, expires in conn.execute(
+                'SELECT kind, key, zones, expires FROM st_snapshot_zone'
+                )
+            ]
+    return devices, revisions, objects, zones
+
+def write_devices(database, devices):
+    '''
+    Replaces the device list, keeping the revisions of known devices
+    and dropping the objects of devices that are gone.
+    '''
+    rows = [
+        (device['name'], dumps(device), str(device['id']))
+        for device in devices
+        ]
+    with connect(database) as conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO st_snapshot_device (name, data, id) VALUES (?,?,?)'
+            , rows
+            )
+        conn.executemany('UPDATE st_snapshot_device SET name = ?, data = ? WHERE id = ?', rows)
+        device_ids = {str(device['id']) for device in devices}
+        gone = [
+            (device_id,)
+            for (device_id,) in conn.execute('SELECT id FROM st_snapshot_device')
+            if device_id not in device_ids
+            ]
+        conn.executemany('DELETE FROM st_snapshot_device WHERE id = ?', gone)
+        conn.executemany('DELETE FROM st_snapshot_object WHERE device_id = ?', gone)
+
+def write_objects(database, device_id, revision, objs):
+    '''
+    Replaces the objects of a device and records their revision.
+    '''
+    with connect(database) as conn:
+        conn.execute('DELETE FROM st_snapshot_object WHERE device_id = ?', (device_id,))
+        conn.executemany(
+            'INSERT INTO st_snapshot_object (device_id, position, data) VALUES (?,?,?)'
+            , [
+                (device_id, position, dumps(obj))
+                for position, obj in enumerate(objs)
+                ]
+            )
+        conn.execute(
+            'UPDATE st_snapshot_device SET revision = ? WHERE id = ?'
+            , (revision, device_id)
+            )
+
+def write_zones(database, entries, now):
+    '''
+    Replaces the stored zone cache with exported entries.
+    '''
+    with connect(database) as conn:
+        conn.execute('DELETE FROM st_snapshot_zone')
+        conn.executemany(
+            'INSERT OR REPLACE INTO st_snapshot_zone (kind, key, zones, expires) VALUES (?,?,?,?)'
+            , [
+                (*zone_row(key), dumps(zones), now + remaining)
+                for key, zones, remaining in entries
+                ]
+            )
+
+def make_tables(database):
+    '''
+    Setting up this module's bit of the database.
+    '''
+    with connect(database) as conn:
+        conn.execute('''
+CREATE TABLE IF NOT EXISTS st_snapshot_device (
+    id TEXT PRIMARY KEY
+    , name TEXT NOT NULL
+    , revision TEXT
+    , data TEXT NOT NULL
+);''')
+        conn.execute('''
+CREATE TABLE IF NOT EXISTS st_snapshot_object (
+    device_id TEXT NOT NULL
+    , position INTEGER NOT NULL
+    , data TEXT NOT NULL
+    , PRIMARY KEY (device_id, position)
+) WITHOUT ROWID;''')
+        conn.execute('''
+CREATE TABLE IF NOT EXISTS st_snapshot_zone (
+    kind TEXT NOT NULL
+    , key TEXT NOT NULL
+    , zones TEXT NOT NULL
+    , expires REAL NOT NULL
+    , PRIMARY KEY (kind, key)
+) WITHOUT ROWID;''')
@@ -0,0 +1,175 @@
+
+'''
+Flow control for the Tufin upstreams. Every request to SecureChange or
+SecureTrack passes through the Throttle of its upstream, which bounds the
+number of requests in flight and their rate. The RetryPolicy decides
+whether and when a failed request is sent again.
+'''
+
+from asyncio import Lock, Semaphore, TimeoutError as AsyncTimeoutError, sleep as a_sleep
+from email.utils import parsedate_to_datetime
+from random import uniform
+from time import monotonic, time
+
+from aiohttp import ClientConnectionError, ClientConnectorError
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RATE = None
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+
+# Methods that may be repeated without changing the outcome. Not PUT,
+# which SecureChange uses to advance tasks: after a gateway timeout the
+# step may have moved on and a repeat would fail on the finished task.
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'DELETE'})
+# Statuses that indicate a transient problem on the server's side
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# Statuses that indicate the server wants everyone to slow down
+COOLDOWN_STATUSES = frozenset({429, 503})
+# Errors that indicate a transient problem on the way to the server
+RETRY_ERRORS = (ClientConnectionError, AsyncTimeoutError)
+# Statuses and errors meaning the server never acted on the request, so
+# that even requests which are not idempotent may be sent again. Not
+# 503, which a proxy may send after the backend acted.
+REFUSED_STATUSES = frozenset({429})
+REFUSED_ERRORS = (ClientConnectorError,)
+
+class TokenBucket(): # pylint: disable=too-few-public-methods
+    '''
+    A token bucket holding up to burst tokens and refilling at rate
+    tokens per second. Waiters are served in order of arrival.
+    '''
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('Token bucket rate must be positive', rate)
+        self._rate = rate
+        self._burst = burst if burst is not None else max(1, rate)
+        self._tokens = self._burst
+        self._stamp = monotonic()
+        self._lock = Lock()
+    def _refill(self):
+        '''
+        Adds the tokens accrued since the last refill.
+        '''
+        now = monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+        self._stamp = now
+    async def take(self):
+        '''
+        Waits for and removes a single token.
+        '''
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await a_sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+        return None
+
+class Throttle():
+    '''
+    An async context manager admitting one request to an upstream.
+    Combines a concurrency budget, an optional token bucket and a
+    shared cooldown that pauses all requests after the upstream has
+    signalled overload.
+    '''
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, burst=None):
+        self._semaphore = Semaphore(concurrency) if concurrency else None
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._resume_at = 0.0
+        self._in_flight = 0
+        self._cooldowns = 0
+        self._retries = 0
+    async def __aenter__(self):
+        '''
+        Waits for a free slot, the end of any cooldown and a token.
+        '''
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        try:
+            while (pause := self._resume_at - monotonic()) > 0:
+                await a_sleep(pause)
+            if self._bucket is not None:
+                await self._bucket.take()
+        except BaseException:
+            if self._semaphore is not None:
+                self._semaphore.release()
+            raise
+        self._in_flight += 1
+        return self
+    async def __aexit__(self, exc_type, exc, tb): # pylint: disable=invalid-name
+        '''
+        Frees the slot.
+        '''
+        self._in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+        return None
+    def cool_down(self, delay):
+        '''
+        Holds back all new requests for delay seconds.
+        '''
+        self._cooldowns += 1
+        self._resume_at = max(self._resume_at, monotonic() + delay)
+    def count_retry(self):
+        '''
+        Records a retried request for the statistics.
+        '''
+        self._retries += 1
+    def stats(self):
+        '''
+        Counters for monitoring.
+        '''
+        return {
+            'in_flight': self._in_flight
+            , 'retries': self._retries
+            , 'cooldowns': self._cooldowns
+            }
+
+class RetryPolicy():
+    '''
+    Retries idempotent requests, and any request the server refused,
+    with jittered exponential backoff, preferring the server's
+    Retry-After header where given.
+    '''
+    def __init__(
+            self
+            , max_retries=DEFAULT_MAX_RETRIES
+            , base=DEFAULT_BACKOFF_BASE
+            , cap=DEFAULT_BACKOFF_CAP
+            ):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+    def may_retry(self, method, attempt, refused=False):
+        '''
+        Whether a request that failed on the given attempt, counted
+        from zero, may be sent again. Refused requests were never
+        acted on and may be sent again whatever their method.
+        '''
+        return (refused or method.upper() in IDEMPOTENT_METHODS) and attempt < self.max_retries
+    def delay(self, attempt, retry_after=None):
+        '''
+        Seconds to wait before the next attempt.
+        '''
+        hinted = parse_retry_after(retry_after)
+        if hinted is not None:
+            return min(self.cap, hinted)
+        return uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+def parse_retry_after(value):
+    '''
+    Parses a Retry-After header, given either in seconds or as an
+    HTTP date. Returns None for missing or malformed headers.
+    '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
@@ -6,6 +6,8 @@ Features:
     - By-name access to steps and fields
     - No distinction between steps and tasks
     - Updates to single or multiple fields via object method
+    - Write-behind updates, merged into one request per task, via
+        TicketUpdateSession
 
 Assumptions about the workflow:
     - Unique name per step
@@ -13,6 +15,8 @@ Assumptions about the workflow:
     - Unique field names inside each step
 '''
 
+from collections.abc import Mapping
+
 def ticket_creation_data(workflow, subject, fields, domain='', reference=None, priority='Normal'): # pylint: disable=too-many-arguments
     '''
     Creates a payload for ticket creation.
@@ -44,7 +48,12 @@ class SimpleTicket():
         - Unique name per step
         - One task per step
         - Unique field names inside each step
+    Steps are only parsed on first access, see StepMap . Any access to
+    a step, through steps[...] , field(...) or the methods working on
+    the current step, therefore raises ValueError if that step is
+    malformed, not the construction of the ticket.
     '''
+    __slots__ = ('id', 'status', 'workflow', 'domain', 'requester', 'current_step', 'steps')
     def __init__(self, indata):
         self.id = indata.get('id')
         self.status = indata.get('status')
@@ -59,11 +68,17 @@ class SimpleTicket():
         insteps = indata.get('steps', {}).get('step', [])
         if isinstance(insteps, dict):
             insteps = [insteps] #Special case: Ticket in the first step
-        self.steps = {
-            instep['name']: SimpleStep(self.id, instep)
-            for instep in insteps
-            }
+        self.steps = StepMap(self.id, insteps)
         return None
+    def field(self, stepname, fieldname):
+        '''
+        The raw field fieldname of step stepname, if any. Raises
+        ValueError if the step is malformed.
+        '''
+        step = self.steps.get(stepname)
+        if step is None:
+            return None
+        return step.fields.get(fieldname)
     async def advance(self, conn):
         '''
         Sets the status of the current step to 'DONE'.
@@ -80,6 +95,11 @@ class SimpleTicket():
         '''
         current_step = self.steps[self.current_step]
         return await current_step.set(conn, mapping)
+    def updates(self, conn, advance=False):
+        '''
+        A TicketUpdateSession for this ticket.
+        '''
+        return TicketUpdateSession(conn, self, advance=advance)
     def show(self):
         '''
         A readable representation of the object.
@@ -96,12 +116,111 @@ class SimpleTicket():
                 }
             }
 
+class TicketUpdateSession():
+    '''
+    Buffers field updates to a SimpleTicket and sends them in one PUT
+    per task on flush(...) , which happens on leaving the session as a
+    context manager without an exception. Repeated writes to a field
+    are merged, later payload keys winning. With advance, the current
+    step is set to 'DONE' once its fields are written. Example:
+        async with ticket.updates(conn, advance=True) as updates:
+            updates.set({'Modifications': groupchange})
+            updates.set({'Comment': {'text': 'Done by Threefin'}})
+    '''
+    def __init__(self, conn, ticket, advance=False):
+        self._conn = conn
+        self._ticket = ticket
+        self._advance = advance
+        self._pending = {}
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.flush()
+        return None
+    def __len__(self):
+        '''
+        The number of fields waiting to be written.
+        '''
+        return sum(len(mapping) for mapping in self._pending.values())
+    def set(self, mapping, step=None):
+        '''
+        Buffers the updates from mapping, of the form taken by
+        SimpleStep.set(...) , for a step given by name, by default
+        the current step.
+        '''
+        stepname = self._ticket.current_step if step is None else step
+        fields = self._ticket.steps[stepname].fields
+        pending = self._pending.setdefault(stepname, {})
+        for k, v in mapping.items():
+            if k not in fields:
+                raise ValueError('Non-existing field!', k, stepname)
+            pending[k] = {**pending.get(k, {}), **v}
+    async def flush(self):
+        '''
+        Writes the buffered updates, one PUT per task, and advances the
+        ticket if asked to. Returns the (status, headers, body) of every
+        request made by step name, with the advance under 'DONE'.
+        A failed request raises ValueError, leaving the updates not
+        yet written buffered.
+        '''
+        responses = {}
+        for stepname in list(self._pending):
+            step = self._ticket.steps[stepname]
+            status, headers, res = await step.set(self._conn, self._pending[stepname])
+            if status != 200:
+                raise ValueError(
+                    'Bad response writing ticket fields'
+                    , self._ticket.id
+                    , stepname
+                    , status
+                    , res
+                    )
+            del self._pending[stepname]
+            responses[stepname] = (status, headers, res)
+        if self._advance:
+            status, headers, res = await self._ticket.advance(self._conn)
+            if status != 200:
+                raise ValueError('Bad response advancing ticket', self._ticket.id, status, res)
+            self._advance = False
+            responses['DONE'] = (status, headers, res)
+        return responses
+
+class StepMap(Mapping):
+    '''
+    The steps of a ticket by name. A step is turned into a SimpleStep
+    on first access, so malformed steps only raise ValueError then.
+    '''
+    __slots__ = ('_ticketid', '_insteps', '_positions', '_parsed')
+    def __init__(self, ticketid, insteps):
+        self._ticketid = ticketid
+        self._insteps = insteps
+        self._positions = {
+            instep['name']: position
+            for position, instep in enumerate(insteps)
+            }
+        self._parsed = {}
+    def __getitem__(self, name):
+        step = self._parsed.get(name)
+        if step is None:
+            step = SimpleStep(self._ticketid, self._insteps[self._positions[name]])
+            self._parsed[name] = step
+        return step
+    def __iter__(self):
+        return iter(self._positions)
+    def __len__(self):
+        return len(self._positions)
+    def __contains__(self, name):
+        return name in self._positions
+
 class SimpleStep():
     '''
     Assumes:
         - Exactly one task
         - Unique field names
+    The by-name field index and parsed options are built on first use.
     '''
+    __slots__ = ('ticketid', 'stepid', 'taskid', 'status', '_infields', '_fields', '_options')
     def __init__(self, ticketid, indata):
         task = indata['tasks']['task']
         if not isinstance(task, dict):
@@ -114,20 +233,36 @@ class SimpleStep():
             infields = task['fields']['field']
             if isinstance(infields, dict):
                 infields = [infields]
-            self.fields = {
-                infield['name']: infield
-                for infield in infields
-                }
         except KeyError as e:
             raise ValueError(ticketid, indata) from e
+        self._infields = infields
+        self._fields = None
+        self._options = {}
         return None
+    @property
+    def fields(self):
+        '''
+        The raw fields by name, indexed on first access.
+        '''
+        if self._fields is None:
+            try:
+                self._fields = {
+                    infield['name']: infield
+                    for infield in self._infields
+                    }
+            except KeyError as e:
+                raise ValueError(self.ticketid, self._infields) from e
+        return self._fields
     async def done(self, conn):
         '''
         Set step status to 'DONE'.
         '''
         endpoint = f'tickets/{self.ticketid}/steps/{self.stepid}/tasks/{self.taskid}'
         payload = f'<task><status>DONE</status><fields /></task>'
-        return await conn.scxml('PUT', endpoint, payload)
+        try:
+            return await conn.scxml('PUT', endpoint, payload)
+        finally:
+            conn.pool.ticketcache.invalidate(self.ticketid)
     async def set(self, conn, mapping):
         '''
         Apply the updates from mapping.
@@ -147,7 +282,10 @@ class SimpleStep():
                 , **v # Yeah, weird.
                 })
         body = {'fields': {'field': modifications}}
-        return await conn.scput(endpoint, body)
+        try:
+            return await conn.scput(endpoint, body)
+        finally:
+            conn.pool.ticketcache.invalidate(self.ticketid)
     def text(self, fieldname):
         '''
         Get the text content of the specified field, if any.
@@ -157,30 +295,12 @@ class SimpleStep():
         '''
         Get the selected and possible options of the specified field, if any.
         '''
-        field = self.fields.get(name)
-        if field is None:
-            return None, None
-        possible = field.get('options', {}).get('option')
-        if possible is None:
-            return None, None
-        if isinstance(possible, list):
-            possible_options = [o['value'] for o in possible]
-        elif isinstance(possible, dict):
-            possible_options = [possible['value']]
-        elif isinstance(possible, str):
-            possible_options = [possible]
-        else:
-            raise ValueError('Strange option field', name, field, self)
-        selected = field.get('selected_options', {}).get('selected_option')
-        if isinstance(selected, list):
-            selected_options = [o['value'] for o in selected]
-        elif isinstance(selected, dict):
-            selected_options = [selected['value']]
-        elif isinstance(selected, str):
-            selected_options = [selected]
-        else:
-            selected_options = []
-        return selected_options, tuple(sorted(possible_options))
+        found = self._options.get(name)
+        if found is None:
+            found = field_options(self.fields.get(name), name)
+            self._options[name] = found
+        selected_options, possible_options = found
+        return (None if selected_options is None else list(selected_options)), possible_options
     def show(self):
         '''
         A readable representation of the object.
@@ -191,3 +311,32 @@ class SimpleStep():
             , 'status': self.status
             , 'fields': self.fields
             }
+
+def field_options(field, name):
+    '''
+    The selected options as a tuple and the sorted possible options of
+    a field, (None, None) for missing fields and fields without options.
+    '''
+    if field is None:
+        return None, None
+    possible = field.get('options', {}).get('option')
+    if possible is None:
+        return None, None
+    if isinstance(possible, list):
+        possible_options = [o['value'] for o in possible]
+    elif isinstance(possible, dict):
+        possible_options = [possible['value']]
+    elif isinstance(possible, str):
+        possible_options = [possible]
+    else:
+        raise ValueError('Strange option field', name, field)
+    selected = field.get('selected_options', {}).get('selected_option')
+    if isinstance(selected, list):
+        selected_options = [o['value'] for o in selected]
+    elif isinstance(selected, dict):
+        selected_options = [selected['value']]
+    elif isinstance(selected, str):
+        selected_options = [selected]
+    else:
+        selected_options = []
+    return tuple(selected_options), tuple(sorted(possible_options))
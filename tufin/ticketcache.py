@@ -0,0 +1,107 @@
+
+'''
+A short-lived cache of SecureChange tickets by ticket id, so that the
+scripts SecureChange fires for one ticket, and chained modules, do not
+download it again and again. Writes through tufin.ticket drop the
+ticket, and an entry is only reused while the ticket_info passed on
+stdin still shows the same step, status and update time it was fetched
+for, see tufin.io.read_ticket_info .
+'''
+
+from collections import OrderedDict
+from time import monotonic
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 30
+
+class TicketCache():
+    '''
+    A TTL and LRU bounded map from ticket ids to ticket data. A
+    max_entries or ttl of zero disables the cache. Callers must not
+    modify the tickets.
+    '''
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._epochs = {}
+        self._clock = 0
+        self._floor = 0
+        self._counters = {
+            'hits': 0
+            , 'misses': 0
+            , 'refreshes': 0
+            , 'stores': 0
+            , 'evictions': 0
+            , 'invalidations': 0
+            }
+    @property
+    def enabled(self):
+        '''
+        Whether anything is cached at all.
+        '''
+        return bool(self._max_entries and self._ttl)
+    def epoch(self, ticket_id):
+        '''
+        Changes on every invalidation of the ticket. Tickets fetched
+        before an invalidation are not stored afterwards, see put(...) .
+        '''
+        return self._epochs.get(int(ticket_id), self._floor)
+    def get(self, ticket_id, fingerprint=None):
+        '''
+        The cached ticket, or None. With a fingerprint, a ticket cached
+        under a different one is dropped, as it changed since.
+        '''
+        ticket_id = int(ticket_id)
+        entry = self._entries.get(ticket_id)
+        if entry is not None and fingerprint is not None and entry[1] != fingerprint:
+            del self._entries[ticket_id]
+            self._counters['refreshes'] += 1
+            entry = None
+        elif entry is not None and entry[2] <= monotonic():
+            del self._entries[ticket_id]
+            entry = None
+        if entry is None:
+            self._counters['misses'] += 1
+            return None
+        self._entries.move_to_end(ticket_id)
+        self._counters['hits'] += 1
+        return entry[0]
+    def put(self, ticket_id, ticket, fingerprint=None, epoch=None):
+        '''
+        Stores a ticket along with the fingerprint it was fetched for,
+        unless it was invalidated since epoch.
+        '''
+        ticket_id = int(ticket_id)
+        if not self.enabled or (epoch is not None and epoch != self.epoch(ticket_id)):
+            return None
+        self._entries[ticket_id] = (ticket, fingerprint, monotonic() + self._ttl)
+        self._entries.move_to_end(ticket_id)
+        self._counters['stores'] += 1
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+        return None
+    def invalidate(self, ticket_id):
+        '''
+        Drops a ticket, meant to be called after writing to it.
+        '''
+        ticket_id = int(ticket_id)
+        self._clock += 1
+        self._epochs[ticket_id] = self._clock
+        if len(self._epochs) > max(self._max_entries, 1):
+            # Forgetting the epochs moves all tickets to the latest one,
+            # which only stops fetches in flight from being stored
+            self._epochs.clear()
+            self._floor = self._clock
+        if self._entries.pop(ticket_id, None) is not None:
+            self._counters['invalidations'] += 1
+    def stats(self):
+        '''
+        Counters for monitoring and sizing.
+        '''
+        return {
+            **self._counters
+            , 'entries': len(self._entries)
+            , 'max_entries': self._max_entries
+            }
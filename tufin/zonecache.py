@@ -0,0 +1,164 @@
+
+'''
+A cache of security zone lookups. Networks and addresses are kept in a
+prefix tree, so an address or subnet inside an already resolved subnet
+that lies entirely within a single zone is answered without asking
+SecureTrack. Objects are kept by (management_id, uid) and dropped when
+their device gets a new revision, see tufin.revisions .
+'''
+
+from collections import OrderedDict
+from time import monotonic
+
+from tufin.netindex import PrefixTree, as_network
+
+DEFAULT_MAX_ENTRIES = 16384
+DEFAULT_TTL = 300
+
+class ZoneCache():
+    '''
+    A TTL and LRU bounded map from networks and objects to their zones.
+    A max_entries or ttl of zero disables the cache.
+    '''
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._tree = PrefixTree()
+        self._counters = {
+            'hits': 0
+            , 'contained_hits': 0
+            , 'misses': 0
+            , 'stores': 0
+            , 'evictions': 0
+            , 'invalidations': 0
+            }
+    @property
+    def enabled(self):
+        '''
+        Whether anything is cached at all.
+        '''
+        return bool(self._max_entries and self._ttl)
+    def network_zones(self, network):
+        '''
+        The zones of an address or network, None if unknown. Known
+        networks are answered directly; others are answered from the
+        most specific known network containing them that lies in a
+        single zone.
+        '''
+        network = as_network(network)
+        zones = self._get(network)
+        if zones is not None:
+            self._counters['hits'] += 1
+            return zones
+        for _, candidates in self._tree.containing(network):
+            for candidate in candidates:
+                zones = self._get(candidate)
+                if zones is not None and len(zones) == 1:
+                    self._counters['contained_hits'] += 1
+                    return zones
+        self._counters['misses'] += 1
+        return None
+    def object_zones(self, management_id, uid):
+        '''
+        The zones of a device's object, None if unknown.
+        '''
+        zones = self._get((str(management_id), uid))
+        self._counters['hits' if zones is not None else 'misses'] += 1
+        return zones
+    def put_network(self, network, zones):
+        '''
+        Remembers the zones of an address or network.
+        '''
+        network = as_network(network)
+        if self._put(network, zones):
+            self._tree.insert(network, network)
+    def put_object(self, management_id, uid, zones):
+        '''
+        Remembers the zones of a device's object.
+        '''
+        self._put((str(management_id), uid), zones)
+    def invalidate(self, device_id=None):
+        '''
+        Drops the objects of a device, or everything.
+        '''
+        if device_id is None:
+            stale = list(self._entries)
+        else:
+            device_id = str(device_id)
+            stale = [
+                key
+                for key in self._entries
+                if isinstance(key, tuple) and key[0] == device_id
+                ]
+        for key in stale:
+            self._drop(key)
+        self._counters['invalidations'] += len(stale)
+        return len(stale)
+    def export(self):
+        '''
+        The live entries as (key, zones, remaining seconds) triples,
+        keys being networks or (management_id, uid) tuples.
+        '''
+        now = monotonic()
+        return [
+            (key, zones, expires - now)
+            for key, (zones, expires) in self._entries.items()
+            if expires > now
+            ]
+    def restore(self, key, zones, remaining):
+        '''
+        Re-enters an exported entry that lives on for remaining seconds.
+        '''
+        if remaining <= 0:
+            return None
+        if self._put(key, zones) and not isinstance(key, tuple):
+            self._tree.insert(key, key)
+        if key in self._entries:
+            self._entries[key] = (zones, monotonic() + min(remaining, self._ttl))
+        return None
+    def _get(self, key):
+        '''
+        A live entry's zones, dropping it if it has expired.
+        '''
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        zones, expires = entry
+        if expires <= monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return zones
+    def _put(self, key, zones):
+        '''
+        Stores an entry, evicting the least recently used ones beyond
+        the bound. Returns whether the key is new.
+        '''
+        if not self.enabled:
+            return False
+        new = key not in self._entries
+        self._entries[key] = (zones, monotonic() + self._ttl)
+        self._entries.move_to_end(key)
+        self._counters['stores'] += 1
+        while len(self._entries) > self._max_entries:
+            self._drop(next(iter(self._entries)))
+            self._counters['evictions'] += 1
+        return new and key in self._entries
+    def _drop(self, key):
+        '''
+        Removes a single entry.
+        '''
+        del self._entries[key]
+        if not isinstance(key, tuple):
+            self._tree.remove(key, key)
+    def stats(self):
+        '''
+        Counters for monitoring and sizing.
+        '''
+        return {
+            **self._counters
+            , 'entries': len(self._entries)
+            , 'networks': len(self._tree)
+            , 'max_entries': self._max_entries
+            }